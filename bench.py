@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""Measure the performance of the data pipeline on the test fixtures.
+
+Each subcommand times one stage of the pipeline against the project's test
+data (and, where useful, a scaled-up copy of it) and prints a small report:
+
+    $ python3 bench.py neos
+    $ python3 bench.py neos --scale 50
+    $ python3 bench.py csv --rows 1000000
+    $ python3 bench.py dates
+    $ python3 bench.py codecs --cadfile data/cad.json
+    $ python3 bench.py memory --neofile data/neos.csv --cadfile data/cad.json
+    $ python3 bench.py http --clients 32 --requests 5000
+    $ python3 bench.py shared --workers 1 4 16
+    $ python3 bench.py scan --jobs 1 2 4 8 16
+
+Timings are the best of `--repeat` runs, to reduce noise from the machine.
+"""
+import argparse
+import asyncio
+import bz2
+import csv
+import datetime
+import gzip
+import itertools
+import json
+import lzma
+import multiprocessing
+import os
+import pathlib
+import random
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+import urllib.parse
+
+from database import NEODatabase
+from extract import load_neos, load_approaches, open_data_file
+from filters import create_filters
+from helpers import cd_to_datetime, datetime_to_str
+from models import NearEarthObject
+from resultcache import ResultCache
+import service
+import shared
+from write import write_to_csv
+
+# Paths to the root of the project and the test fixtures.
+PROJECT_ROOT = pathlib.Path(__file__).parent.resolve()
+TESTS_ROOT = PROJECT_ROOT / 'tests'
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+def best_of(func, repeat):
+    """Return the fastest of `repeat` timed calls to `func`, in seconds."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def scaled_copy(path, scale, directory):
+    """Write a copy of a CSV file whose data rows are repeated `scale` times.
+
+    :param path: The CSV file to copy.
+    :param scale: How many times to repeat the data rows.
+    :param directory: The directory in which to write the copy.
+    :return: The path to the copy.
+    """
+    target = pathlib.Path(directory) / f"{path.stem}-x{scale}{path.suffix}"
+    with open(path) as src, open(target, 'w') as dst:
+        dst.write(src.readline())
+        body = src.read()
+        for _ in range(scale):
+            dst.write(body)
+    return target
+
+
+def load_neos_dictreader(neo_csv_path):
+    """Load NEOs with a `csv.DictReader`, the way `load_neos` used to."""
+    with open(neo_csv_path) as f:
+        return [
+            NearEarthObject(designation=neo.get('pdes', ''),
+                            name=neo.get('name') or None,
+                            diameter=float(neo.get('diameter') or 'nan'),
+                            hazardous=neo.get('pha') == 'Y')
+            for neo in csv.DictReader(f)
+        ]
+
+
+def bench_neos(args):
+    """Compare the projected `load_neos` against a full `csv.DictReader` parse."""
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = [TEST_NEO_FILE]
+        if args.scale > 1:
+            paths.append(scaled_copy(TEST_NEO_FILE, args.scale, tmp))
+
+        print(f"{'file':<28} {'rows':>8} {'DictReader':>12} {'projected':>12} {'speedup':>8}")
+        for path in paths:
+            rows = len(load_neos(path))
+            before = best_of(lambda: load_neos_dictreader(path), args.repeat)
+            after = best_of(lambda: load_neos(path), args.repeat)
+            print(f"{path.name:<28} {rows:>8} {before:>11.3f}s {after:>11.3f}s {before / after:>7.2f}x")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def synthetic_approaches(rows):
+    """Return `rows` linked close approaches, cycling through the test fixtures."""
+    approaches = load_approaches(TEST_CAD_FILE)
+    NEODatabase(load_neos(TEST_NEO_FILE), approaches)
+    return list(itertools.islice(itertools.cycle(approaches), rows))
+
+
+def write_to_csv_dictwriter(results, filename):
+    """Write close approaches with a `csv.DictWriter`, the way `write_to_csv` used to."""
+    fieldnames = ('datetime_utc', 'distance_au', 'velocity_km_s',
+                  'designation', 'name', 'diameter_km', 'potentially_hazardous')
+    with open(filename, 'w') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in results:
+            ca_data = row.serialize()
+            neo_data = row.neo.serialize()
+            writer.writerow({
+                'datetime_utc': ca_data.get('datetime_utc'),
+                'distance_au': ca_data.get('distance_au'),
+                'velocity_km_s': ca_data.get('velocity_km_s'),
+                'designation': neo_data.get('designation'),
+                'name': '' if neo_data.get('name') is None else neo_data.get('name'),
+                'diameter_km': neo_data.get('diameter_km'),
+                'potentially_hazardous': neo_data.get('potentially_hazardous')
+            })
+
+
+def bench_csv(args):
+    """Compare the tuple-based `write_to_csv` against a `csv.DictWriter` export."""
+    approaches = synthetic_approaches(args.rows)
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'results.csv')
+        print(f"{'writer':<12} {'rows':>9} {'seconds':>9} {'rows/s':>11} {'MiB/s':>8}")
+        for name, writer in (('DictWriter', write_to_csv_dictwriter), ('fast path', write_to_csv)):
+            seconds = best_of(lambda: writer(approaches, path), args.repeat)
+            size = os.path.getsize(path) / (1 << 20)
+            print(f"{name:<12} {len(approaches):>9} {seconds:>8.3f}s {len(approaches) / seconds:>11,.0f} "
+                  f"{size / seconds:>8.1f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_dates(args):
+    """Compare `cd_to_datetime` and `datetime_to_str` against `strptime` and `strftime`."""
+    with open(TEST_CAD_FILE) as f:
+        calendar_dates = [row[3] for row in json.load(f)['data']]
+    datetimes = [cd_to_datetime(calendar_date) for calendar_date in calendar_dates]
+
+    cases = (
+        ('parse', 'strptime', lambda: [datetime.datetime.strptime(cd, "%Y-%b-%d %H:%M") for cd in calendar_dates],
+         'cd_to_datetime', lambda: [cd_to_datetime(cd) for cd in calendar_dates]),
+        ('format', 'strftime', lambda: [dt.strftime("%Y-%m-%d %H:%M") for dt in datetimes],
+         'datetime_to_str', lambda: [datetime_to_str(dt) for dt in datetimes]),
+    )
+    print(f"{'step':<8} {'stdlib':>16} {'ns/call':>8} {'ours':>16} {'ns/call':>8} {'speedup':>8}")
+    for step, stdlib_name, stdlib, ours_name, ours in cases:
+        before = best_of(stdlib, args.repeat) / len(calendar_dates) * 1e9
+        after = best_of(ours, args.repeat) / len(calendar_dates) * 1e9
+        print(f"{step:<8} {stdlib_name:>16} {before:>8.0f} {ours_name:>16} {after:>8.0f} {before / after:>7.2f}x")
+
+
+def bench_codecs(args):
+    """Compare reading and loading compressed data files against the plain file."""
+    tmp = tempfile.mkdtemp()
+    try:
+        path = args.cadfile
+        contents = path.read_bytes()
+        paths = [('plain', path)]
+        for name, module, extension in (('gzip', gzip, '.gz'), ('bzip2', bz2, '.bz2'), ('xz', lzma, '.xz')):
+            target = pathlib.Path(tmp) / f"{path.name}{extension}"
+            with module.open(target, 'wb') as f:
+                f.write(contents)
+            paths.append((name, target))
+
+        def read(target):
+            with open_data_file(target, binary=True) as f:
+                while f.read(1 << 20):
+                    pass
+
+        size = len(contents) / (1 << 20)
+        print(f"{'codec':<8} {'on disk':>12} {'read':>9} {'MiB/s':>8} {'load':>9}")
+        for name, target in paths:
+            seconds = best_of(lambda: read(target), args.repeat)
+            load = best_of(lambda: load_approaches(target), args.repeat)
+            print(f"{name:<8} {os.path.getsize(target) / (1 << 20):>8.1f} MiB {seconds:>8.3f}s "
+                  f"{size / seconds:>8.1f} {load:>8.3f}s")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_memory(args):
+    """Measure the memory retained per NEO and per close approach with tracemalloc."""
+    tracemalloc.start()
+
+    before = tracemalloc.take_snapshot()
+    neos = load_neos(args.neofile)
+    after_neos = tracemalloc.take_snapshot()
+    approaches = load_approaches(args.cadfile)
+    after_approaches = tracemalloc.take_snapshot()
+    database = NEODatabase(neos, approaches)
+    after_linking = tracemalloc.take_snapshot()
+
+    tracemalloc.stop()
+
+    def retained(start, end):
+        return sum(stat.size_diff for stat in end.compare_to(start, 'filename'))
+
+    print(f"{'stage':<24} {'objects':>9} {'bytes':>12} {'bytes/object':>13}")
+    for stage, count, size in (
+            ('NEOs', len(neos), retained(before, after_neos)),
+            ('close approaches', len(approaches), retained(after_neos, after_approaches)),
+            ('linking, per approach', len(approaches), retained(after_approaches, after_linking)),
+    ):
+        print(f"{stage:<24} {count:>9} {size:>12,} {size / count:>13.1f}")
+    return database
+
+
+async def fetch(reader, writer, target):
+    """Send a GET request over a keep-alive connection, and read the whole response.
+
+    :return: The response's status code and body.
+    """
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        return status, await reader.readexactly(int(headers['content-length']))
+    chunks = []
+    while True:
+        size = int(await reader.readline(), 16)
+        chunk = await reader.readexactly(size + 2)
+        if not size:
+            return status, b''.join(chunks)
+        chunks.append(chunk[:-2])
+
+
+def bench_http(args):
+    """Load-test the HTTP query service with concurrent clients on this machine."""
+    database = NEODatabase(load_neos(args.neofile), load_approaches(args.cadfile))
+    designations = [neo.designation for neo in database._neos if neo.approaches]
+    days = sorted({approach.time.date() for approach in database._approaches})
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.QueryService(database, args.workers).start(port=0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def target(rng):
+        if rng.random() < 0.5:
+            return f"/neo?designation={urllib.parse.quote(rng.choice(designations))}"
+        return f"/query?date={rng.choice(days)}&limit=20"
+
+    async def client(index, count, latencies):
+        rng = random.Random(index)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for _ in range(count):
+            start = time.perf_counter()
+            status, _ = await fetch(reader, writer, target(rng))
+            latencies.append(time.perf_counter() - start)
+            assert status in (200, 404), status
+        writer.close()
+
+    async def export(sizes):
+        # A full, unfiltered export, streaming alongside the small requests.
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        start = time.perf_counter()
+        _, body = await fetch(reader, writer, '/query')
+        sizes.append((len(body), time.perf_counter() - start))
+        writer.close()
+
+    async def run(with_export):
+        latencies, sizes = [], []
+        per_client = args.requests // args.clients
+        start = time.perf_counter()
+        await asyncio.gather(*([export(sizes)] if with_export else []),
+                             *(client(index, per_client, latencies) for index in range(args.clients)))
+        return latencies, time.perf_counter() - start, sizes
+
+    client_loop = asyncio.new_event_loop()
+    try:
+        print(f"{'scenario':<22} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for with_export in (False, True):
+            latencies, seconds, sizes = client_loop.run_until_complete(run(with_export))
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1e3
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3
+            scenario = 'with a full export' if with_export else 'lookups and queries'
+            print(f"{scenario:<22} {len(latencies):>9} {len(latencies) / seconds:>9,.0f} {p50:>8.2f} {p99:>8.2f}")
+            for size, export_seconds in sizes:
+                print(f"{'':<22} (export: {size / (1 << 20):.1f} MiB in {export_seconds:.2f}s)")
+    finally:
+        client_loop.close()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+def _memory_kib():
+    """Return this process's resident and proportional set sizes, in KiB (PSS is None if unknown)."""
+    sizes = {}
+    for name in ('/proc/self/smaps_rollup', '/proc/self/status'):
+        try:
+            with open(name) as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in ('Rss', 'Pss', 'VmRSS'):
+                        sizes.setdefault(key, int(value.split()[0]))
+        except OSError:
+            continue
+    return sizes.get('Rss', sizes.get('VmRSS')), sizes.get('Pss')
+
+
+def _shared_worker(mode, neofile, cadfile, image, barrier, results):
+    """Get a database one way or the other, touch all of it, and report the cost."""
+    start = time.perf_counter()
+    if mode == 'attach':
+        database = shared.SharedDatabase.attach(image)
+    else:
+        database = NEODatabase(load_neos(neofile), load_approaches(cadfile))
+    ready = time.perf_counter() - start
+    # A full scan reads every page of the columns, as a busy worker would.
+    matches = sum(1 for _ in database.query(create_filters(distance_max=0.05)))
+    # Measure once every worker holds its database, so shared pages are counted as shared.
+    barrier.wait()
+    rss, pss = _memory_kib()
+    results.put((ready, rss, pss, matches))
+    barrier.wait()
+
+
+def bench_shared(args):
+    """Compare workers that each load the database with workers that attach one shared image."""
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(dir='/dev/shm' if os.path.isdir('/dev/shm') else None) as directory:
+        start = time.perf_counter()
+        image = shared.publish(NEODatabase(load_neos(args.neofile), load_approaches(args.cadfile)),
+                               pathlib.Path(directory) / 'shared.img')
+        print(f"published a {image.stat().st_size / (1 << 20):.1f} MiB image in {time.perf_counter() - start:.2f}s")
+        print(f"{'workers':>7} {'mode':<7} {'ready s':>8} {'RSS MiB':>8} {'PSS MiB':>8} {'total PSS':>10}")
+        for workers in args.workers:
+            for mode in ('load', 'attach'):
+                barrier = context.Barrier(workers)
+                results = context.Queue()
+                processes = [context.Process(target=_shared_worker,
+                                             args=(mode, args.neofile, args.cadfile, image, barrier, results))
+                             for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                reports = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+
+                ready = max(report[0] for report in reports)
+                rss = sum(report[1] for report in reports) / workers / 1024
+                if all(report[2] is not None for report in reports):
+                    pss = [report[2] / 1024 for report in reports]
+                    print(f"{workers:>7} {mode:<7} {ready:>8.3f} {rss:>8.1f} {sum(pss) / workers:>8.1f} {sum(pss):>10.1f}")
+                else:
+                    print(f"{workers:>7} {mode:<7} {ready:>8.3f} {rss:>8.1f} {'?':>8} {'?':>10}")
+
+
+def bench_scan(args):
+    """Time a full-scan query, on an unindexed predicate, across more and more worker processes."""
+    # Keep no results, so that every run scans.
+    database = NEODatabase(load_neos(args.neofile), load_approaches(args.cadfile), cache=ResultCache(max_entries=0))
+    filters = create_filters(velocity_min=args.min_velocity)
+    # Pack the scanned column and start the workers up front, as a long-lived session would have.
+    matches = len(list(database.query(filters, jobs=max(args.jobs))))
+    print(f"{len(database._approaches):,} approaches, {matches:,} matches, on {os.cpu_count()} CPU(s)")
+    print(f"{'jobs':>5} {'seconds':>9} {'speedup':>8}")
+    serial = None
+    for jobs in args.jobs:
+        seconds = best_of(lambda: list(database.query(filters, jobs=jobs)), args.repeat)
+        serial = serial or seconds
+        print(f"{jobs:>5} {seconds:>9.3f} {serial / seconds:>7.2f}x")
+    database.close()
+
+
+def make_parser():
+    """Create an ArgumentParser for this script."""
+    parser = argparse.ArgumentParser(description="Benchmark the NEO data pipeline.")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="Number of timed runs; the best is reported.")
+    subparsers = parser.add_subparsers(dest='cmd', required=True)
+
+    neos = subparsers.add_parser('neos', description=bench_neos.__doc__)
+    neos.add_argument('--scale', type=int, default=20,
+                      help="Also time a copy of the fixture with its rows repeated this many times.")
+    neos.set_defaults(func=bench_neos)
+
+    export = subparsers.add_parser('csv', description=bench_csv.__doc__)
+    export.add_argument('--rows', type=int, default=1000000,
+                        help="The number of synthetic close approaches to export.")
+    export.set_defaults(func=bench_csv)
+
+    dates = subparsers.add_parser('dates', description=bench_dates.__doc__)
+    dates.set_defaults(func=bench_dates)
+
+    codecs = subparsers.add_parser('codecs', description=bench_codecs.__doc__)
+    codecs.add_argument('--cadfile', type=pathlib.Path, default=TEST_CAD_FILE,
+                        help="Path to a plain JSON file of close approach data to compress.")
+    codecs.set_defaults(func=bench_codecs)
+
+    http = subparsers.add_parser('http', description=bench_http.__doc__)
+    http.add_argument('--clients', type=int, default=32,
+                      help="The number of concurrent keep-alive clients.")
+    http.add_argument('--requests', type=int, default=5000,
+                      help="The total number of requests, shared among the clients.")
+    http.add_argument('--workers', type=int, default=4,
+                      help="The service's number of worker threads.")
+    http.add_argument('--neofile', type=pathlib.Path, default=TEST_NEO_FILE,
+                      help="Path to CSV file of near-Earth objects.")
+    http.add_argument('--cadfile', type=pathlib.Path, default=TEST_CAD_FILE,
+                      help="Path to JSON file of close approach data.")
+    http.set_defaults(func=bench_http)
+
+    memory = subparsers.add_parser('memory', description=bench_memory.__doc__)
+    memory.add_argument('--neofile', type=pathlib.Path, default=TEST_NEO_FILE,
+                        help="Path to CSV file of near-Earth objects.")
+    memory.add_argument('--cadfile', type=pathlib.Path, default=TEST_CAD_FILE,
+                        help="Path to JSON file of close approach data.")
+    memory.set_defaults(func=bench_memory)
+
+    workers = subparsers.add_parser('shared', description=bench_shared.__doc__)
+    workers.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16],
+                         help="The numbers of worker processes to try.")
+    workers.add_argument('--neofile', type=pathlib.Path, default=TEST_NEO_FILE,
+                         help="Path to CSV file of near-Earth objects.")
+    workers.add_argument('--cadfile', type=pathlib.Path, default=TEST_CAD_FILE,
+                         help="Path to JSON file of close approach data.")
+    workers.set_defaults(func=bench_shared)
+
+    scan = subparsers.add_parser('scan', description=bench_scan.__doc__)
+    scan.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                      help="The numbers of worker processes to try; start with 1 for the serial baseline.")
+    scan.add_argument('--min-velocity', type=float, default=25.0,
+                      help="The velocity bound of the query, in kilometers per second.")
+    scan.add_argument('--neofile', type=pathlib.Path, default=TEST_NEO_FILE,
+                      help="Path to CSV file of near-Earth objects.")
+    scan.add_argument('--cadfile', type=pathlib.Path, default=TEST_CAD_FILE,
+                      help="Path to JSON file of close approach data.")
+    scan.set_defaults(func=bench_scan)
+
+    return parser
+
+
+def main():
+    """Run the chosen benchmark."""
+    args = make_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""A columnar, NumPy-backed store of close approaches for vectorized queries.
+
+Querying the database row by row evaluates every filter on every approach with
+an interpreted call. `ApproachColumns` instead keeps each attribute that the
+filters from `create_filters` can inspect in a NumPy array, one entry per
+approach, and turns a collection of filters into a single boolean mask over
+those arrays. Only the approaches that survive the mask are handed back.
+
+NumPy is an optional dependency: the rest of the project works without it, and
+only constructing an `ApproachColumns` requires it.
+"""
+from filters import DateFilter, DistanceFilter, VelocityFilter, DiameterFilter, HazardousFilter, RangeFilter
+from helpers import MINUTES_PER_DAY
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without NumPy installed.
+    np = None
+
+# The fewest rows `iter_select` evaluates at a time.
+MIN_BLOCK_SIZE = 1024
+
+# The column inspected by each kind of filter.
+FILTER_COLUMNS = {
+    DateFilter: 'day',
+    DistanceFilter: 'distance',
+    VelocityFilter: 'velocity',
+    DiameterFilter: 'diameter',
+    HazardousFilter: 'hazardous',
+}
+
+
+def column_for(f):
+    """Return the name of the column a filter inspects, or None if it has none."""
+    return FILTER_COLUMNS.get(f.attribute if isinstance(f, RangeFilter) else type(f))
+
+
+class ApproachColumns:
+    """Close approach attributes laid out as parallel NumPy arrays.
+
+    Row `i` of every column describes `approaches[i]`. The columns are:
+
+    - `time`: the approach time, in integer minutes since the epoch.
+    - `distance`, `velocity`: the approach's nominal distance and velocity.
+    - `neo`: the index of the approach's NEO in `neos`, or -1 if unlinked.
+    - `diameter`, `hazardous`: the diameter and hazard status of the NEO.
+    """
+
+    def __init__(self, neos, approaches):
+        """Build the columns for a linked collection of NEOs and approaches.
+
+        :param neos: A sequence of `NearEarthObject`s.
+        :param approaches: A sequence of `CloseApproach`es, already linked to `neos`.
+        :raises ImportError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError("The columnar backend requires NumPy; install it with `pip install numpy`.")
+
+        self._neo_index = {id(neo): index for index, neo in enumerate(neos)}
+        # Hold the NEO attributes with a trailing sentinel NEO (of unknown
+        # diameter, and not hazardous) for unlinked approaches to point at.
+        diameters = np.fromiter((neo.diameter for neo in neos), dtype=np.float64, count=len(neos))
+        hazardous = np.fromiter((bool(neo.hazardous) for neo in neos), dtype=np.bool_, count=len(neos))
+        self._neo_diameters = np.append(diameters, np.nan)
+        self._neo_hazardous = np.append(hazardous, False)
+
+        self._size = 0
+        self._buffers = {}
+        self._day = None
+        self.extend(approaches)
+
+    @classmethod
+    def from_arrays(cls, time, distance, velocity, neo, diameter, hazardous, day=None):
+        """Wrap existing column arrays, such as read-only views of a shared image, without copying them.
+
+        The store can be queried, but not extended.
+
+        :return: An `ApproachColumns` over the given arrays.
+        """
+        if np is None:
+            raise ImportError("The columnar backend requires NumPy; install it with `pip install numpy`.")
+        columns = cls.__new__(cls)
+        columns.time, columns.distance, columns.velocity = time, distance, velocity
+        columns.neo, columns.diameter, columns.hazardous = neo, diameter, hazardous
+        columns._day = day
+        columns._size = len(time)
+        columns._buffers = None
+        return columns
+
+    def __len__(self):
+        """Return the number of approaches in the store."""
+        return self._size
+
+    def _append(self, name, values, start):
+        """Write `values` into a column's buffer from row `start` on, growing it if needed.
+
+        Buffers at least double when they grow, so that appending costs time in
+        proportion to the number of new rows, on average.
+
+        :return: A view of the column's rows up to the last one written.
+        """
+        stop = start + len(values)
+        buffer = self._buffers.get(name)
+        if buffer is None or len(buffer) < stop:
+            grown = np.empty(stop if buffer is None else max(stop, 2 * len(buffer)), dtype=values.dtype)
+            if buffer is not None:
+                grown[:start] = buffer[:start]
+            self._buffers[name] = buffer = grown
+        buffer[start:stop] = values
+        return buffer[:stop]
+
+    def extend(self, approaches):
+        """Add rows for further approaches, linked to the same NEOs, to the end of the store.
+
+        :param approaches: A sequence of `CloseApproach`es.
+        """
+        count = len(approaches)
+        neo = np.fromiter((self._neo_index.get(id(approach.neo), -1) for approach in approaches),
+                          dtype=np.int64, count=count)
+        columns = {
+            'time': np.fromiter((approach.minutes for approach in approaches), dtype=np.int64, count=count),
+            'distance': np.fromiter((approach.distance for approach in approaches), dtype=np.float64, count=count),
+            'velocity': np.fromiter((approach.velocity for approach in approaches), dtype=np.float64, count=count),
+            'neo': neo,
+            # Gather the NEO attributes per approach.
+            'diameter': self._neo_diameters[neo],
+            'hazardous': self._neo_hazardous[neo],
+        }
+        for name, values in columns.items():
+            setattr(self, name, self._append(name, values, self._size))
+        self._size += count
+
+    @property
+    def day(self):
+        """The approach date, in whole days since the epoch (computed on first use)."""
+        done = 0 if self._day is None else len(self._day)
+        if done < len(self):
+            self._day = self._append('day', self.time[done:] // MINUTES_PER_DAY, done)
+        return self._day
+
+    def mask(self, filters, rows=None):
+        """Evaluate a collection of filters over many approaches at once.
+
+        :param filters: A collection of filters, as produced by `create_filters`.
+        :param rows: The positions of the approaches to evaluate, or None for all of them.
+        :return: A boolean array whose entry `i` is whether the `i`th evaluated approach matches every filter.
+        :raises TypeError: If a filter has no corresponding column.
+        """
+        mask = np.ones(len(self) if rows is None else len(rows), dtype=np.bool_)
+        for f in filters:
+            column = column_for(f)
+            if column is None:
+                raise TypeError(f"{f!r} cannot be evaluated over columns.")
+            values = getattr(self, column)
+            if isinstance(rows, range):
+                values = values[rows.start:rows.stop]
+            elif rows is not None:
+                values = values[rows]
+            if isinstance(f, RangeFilter):
+                if f.low is not None:
+                    mask &= values >= f.attribute.key(f.low)
+                if f.high is not None:
+                    mask &= values <= f.attribute.key(f.high)
+            else:
+                mask &= f.op(values, f.key(f.value))
+        return mask
+
+    def select(self, filters, rows=None):
+        """Return the positions of the approaches matching every filter, in order.
+
+        :param filters: A collection of filters, as produced by `create_filters`.
+        :param rows: The positions of the approaches to consider, in order, or None for all of them.
+        :return: An array of the indices of the matching approaches.
+        """
+        if rows is None:
+            return np.flatnonzero(self.mask(filters))
+        if isinstance(rows, range):
+            return np.flatnonzero(self.mask(filters, rows)) + rows.start
+        rows = np.asarray(rows, dtype=np.int64)
+        return rows[self.mask(filters, rows)]
+
+    def iter_select(self, filters, rows=None, block=None):
+        """Generate the positions of the matching approaches a block of rows at a time.
+
+        When only the first few matches are wanted, evaluating the filters over
+        every row up front is wasted work. Instead, start with a block of rows
+        sized for the wanted number of matches, and double the block each time
+        it comes up short.
+
+        :param filters: A collection of filters, as produced by `create_filters`.
+        :param rows: The positions of the approaches to consider, in order, or None for all of them.
+        :param block: Roughly how many matches are wanted, or None to evaluate every row at once.
+        :yield: Arrays of the indices of matching approaches, in order.
+        """
+        if not block:
+            yield self.select(filters, rows)
+            return
+
+        if rows is None:
+            rows = range(len(self))
+        size = max(block, MIN_BLOCK_SIZE)
+        start = 0
+        while start < len(rows):
+            yield self.select(filters, rows[start:start + size])
+            start += size
+            size *= 2
+
@@ -0,0 +1,208 @@
+"""Serve `inspect` and `query` commands from a database kept resident in memory.
+
+Each run of `main.py` pays to load the database before it can answer a single
+command. `serve` loads it once and answers commands sent over a Unix domain
+socket, and `request` sends one command to such a daemon and streams its output
+back, so that a scripted `main.py --via-daemon query ...` skips loading entirely.
+
+A client sends one line of JSON: the data files it expects to be served, and the
+parsed arguments of its command. The daemon runs the command and streams back
+what it prints as frames - a kind byte and a big-endian 32-bit length, then that
+many bytes of UTF-8 - of kind `o` (standard output), `e` (standard error) or,
+last of all, `x` (the end of the output).
+"""
+import contextlib
+import datetime
+import io
+import json
+import pathlib
+import socket
+import socketserver
+import struct
+import sys
+import types
+
+from snapshot import CACHE_ROOT
+
+# The socket a daemon listens on, unless another is requested.
+DEFAULT_SOCKET = CACHE_ROOT / 'daemon.sock'
+
+_FRAME = struct.Struct('>cI')
+_FLUSH_SIZE = 1 << 16
+
+# The arguments of commands that hold dates and paths, which JSON can't represent directly.
+_DATE_ARGUMENTS = ('date', 'start_date', 'end_date')
+_PATH_ARGUMENTS = ('outfile',)
+
+
+def encode_args(args):
+    """Turn a command's parsed arguments into a JSON-serializable dictionary.
+
+    Relative output paths are resolved here, against the client's working
+    directory, rather than later against the daemon's.
+
+    :param args: The `Namespace` of a command's arguments.
+    :return: A dictionary of the arguments.
+    """
+    encoded = dict(vars(args))
+    for key, value in encoded.items():
+        if isinstance(value, datetime.date):
+            encoded[key] = value.isoformat()
+        elif isinstance(value, pathlib.PurePath):
+            encoded[key] = str(pathlib.Path(value).resolve())
+    return encoded
+
+
+def decode_args(encoded):
+    """Turn a dictionary made by `encode_args` back into a command's arguments.
+
+    :param encoded: A dictionary of arguments.
+    :return: A `SimpleNamespace` with the same attributes as the original `Namespace`.
+    """
+    args = dict(encoded)
+    for key in _DATE_ARGUMENTS:
+        if args.get(key) is not None:
+            args[key] = datetime.datetime.strptime(args[key], '%Y-%m-%d').date()
+    for key in _PATH_ARGUMENTS:
+        if args.get(key) is not None:
+            args[key] = pathlib.Path(args[key])
+    return types.SimpleNamespace(**args)
+
+
+class _FrameWriter(io.TextIOBase):
+    """A text stream that sends what is written to it as frames of one kind."""
+
+    def __init__(self, sock, kind):
+        self._sock = sock
+        self._kind = kind
+        self._buf = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._buf.append(text)
+        self._size += len(text)
+        if self._size >= _FLUSH_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._buf:
+            data = ''.join(self._buf).encode('utf-8')
+            self._buf, self._size = [], 0
+            self._sock.sendall(_FRAME.pack(self._kind, len(data)) + data)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Run the one command a client sends, and stream back its output."""
+
+    def handle(self):
+        server = self.server
+        stdout = _FrameWriter(self.connection, b'o')
+        stderr = _FrameWriter(self.connection, b'e')
+        line = self.rfile.readline()
+        if not line:
+            # A client checking `is_listening`, which sends nothing.
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            args = decode_args(request['args'])
+            if (args.neofile, args.cadfile) != server.identity:
+                stderr.write(f"The daemon serves {server.identity[0]} and {server.identity[1]}, "
+                             f"not {args.neofile} and {args.cadfile}.\n")
+            else:
+                # The database serializes the shard loads that commands may
+                # trigger, so commands from many clients can run at once.
+                server.run(server.database, args, stdout=stdout, stderr=stderr)
+        except Exception as e:
+            stderr.write(f"Something went wrong! {e}\n")
+        try:
+            stdout.flush()
+            stderr.flush()
+            self.connection.sendall(_FRAME.pack(b'x', 0))
+        except OSError:
+            # The client went away before reading all of its output.
+            pass
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(database, run, neofile, cadfile, socket_path=DEFAULT_SOCKET):
+    """Answer commands against a loaded database until interrupted.
+
+    Each client is served on its own thread, and its command writes its
+    output to streams of its own, so clients' commands run concurrently.
+
+    :param database: The `NEODatabase` to answer commands from.
+    :param run: A function of the database, a command's arguments and `stdout`
+        and `stderr` streams that performs the command.
+    :param neofile: The CSV file of NEOs the database was built from.
+    :param cadfile: The JSON file of close approaches the database was built from.
+    :param socket_path: The path of the Unix domain socket to listen on.
+    """
+    socket_path = pathlib.Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if is_listening(socket_path):
+        raise OSError(f"A daemon is already listening on {socket_path}.")
+    with contextlib.suppress(FileNotFoundError):
+        # A socket left behind by a daemon that didn't shut down cleanly.
+        socket_path.unlink()
+
+    with _Server(str(socket_path), _Handler) as server:
+        server.database = database
+        server.run = run
+        server.identity = (str(pathlib.Path(neofile).resolve()), str(pathlib.Path(cadfile).resolve()))
+        try:
+            server.serve_forever()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                socket_path.unlink()
+
+
+def is_listening(socket_path=DEFAULT_SOCKET):
+    """Return whether a daemon is accepting connections on a socket.
+
+    :param socket_path: The path of the Unix domain socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def _read_exactly(sock, size):
+    """Read exactly `size` bytes from a socket."""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("The daemon closed the connection early.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def request(args, socket_path=DEFAULT_SOCKET, stdout=None, stderr=None):
+    """Send a command to a daemon, and copy its output to this process's as it arrives.
+
+    :param args: The `Namespace` of the command's arguments, including `neofile` and `cadfile`.
+    :param socket_path: The path of the daemon's Unix domain socket.
+    :param stdout: Where to write the command's standard output; defaults to `sys.stdout`.
+    :param stderr: Where to write the command's standard error; defaults to `sys.stderr`.
+    :raises OSError: If no daemon is listening on the socket.
+    """
+    streams = {b'o': stdout or sys.stdout, b'e': stderr or sys.stderr}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps({'args': encode_args(args)}).encode('utf-8') + b'\n')
+        while True:
+            kind, length = _FRAME.unpack(_read_exactly(sock, _FRAME.size))
+            if kind == b'x':
+                return
+            streams[kind].write(_read_exactly(sock, length).decode('utf-8'))
@@ -1,34 +1,85 @@
 """Class to define the Near Earth Object database and link them with their associated Close Approaches."""
 
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import operator
+import threading
+from array import array
+from bisect import bisect_left
+
+from columnar import ApproachColumns, column_for
+from filters import compile_filters, split_date_range
+from helpers import datetime_to_minutes
+from models import ApproachSlice
+import ordering
+import parallel
+from planner import Statistics, plan_query
+from resultcache import ResultCache, cache_key
+
 
 class NEODatabase:
     """A database of near-Earth objects and their close approaches."""
 
-    def __init__(self, neos, approaches):
+    def __init__(self, neos, approaches, columnar=False, shards=(), cache=None):
         """Create a new `NEODatabase`.
 
+        Close approaches may also come from `shards`, each of which is only read
+        from disk once a query needs an approach in its time range.
+
         :param neos: A collection of `NearEarthObject`s.
-        :param approaches: A collection of `CloseApproach`es.
+        :param approaches: A collection (or a stream, such as `iter_approaches`) of `CloseApproach`es.
+        :param columnar: Whether to answer queries from a NumPy-backed `ApproachColumns` store.
+        :param shards: A sequence of `CADShard`s of further close approaches, in order.
+        :param cache: The `ResultCache` to remember the results of recent queries in; by default, a new one.
         """
         self._neos = neos
-        self._approaches = approaches
-        self.link_neos_and_approaches()
+        # Held while loading shards or adding approaches, and while a query
+        # starts, so that it sees the database either before or after the change.
+        self._lock = threading.RLock()
+        self.cache = ResultCache() if cache is None else cache
+        # Bumped whenever relinking moves approaches, so positions found before can be recognized as stale.
+        self.generation = 0
+        self._approaches = []
+        self._owners = array('q')
+        self._columnar = columnar
+        self.link_neos_and_approaches(approaches)
+        self._base_count = len(self._approaches)
+
+        self._shards = list(shards)
+        self._shard_approaches = {}
+        self._added = []
+        # The worker processes for parallel scans, started by the first one.
+        self._pool = None
+        self._pool_jobs = 0
+
+    def link_neos_and_approaches(self, approaches=None):
+        """Links NEOs and their close approaches together.
 
-    def link_neos_and_approaches(self):
-        """Links NEOs and their close approaches together."""
-        pdes_to_index_map = {
+        The approaches are consumed in a single pass, so they may be streamed in
+        straight from the data file without first being collected into a list.
+
+        :param approaches: An iterable of `CloseApproach`es to add to the database, or None to relink its own.
+        """
+        if approaches is None:
+            approaches = self._approaches
+            self._approaches = []
+            self._owners = array('q')
+        self._pdes_to_index_map = pdes_to_index_map = {
             neo.designation: index
             for index, neo in enumerate(self._neos)
         }
 
-        for approach in self._approaches:
-            if approach._designation in pdes_to_index_map.keys():
+        # Hash-join the approaches to their NEOs, remembering each one's owner.
+        owners = self._owners
+        for approach in approaches:
+            self._approaches.append(approach)
+            index = pdes_to_index_map.get(approach._designation, -1)
+            if index >= 0:
                 # Assign the approach it's NEO
-                approach.neo = self._neos[pdes_to_index_map.get(
-                    approach._designation)]
-                # Add the approach to the NEO approaches' list
-                self._neos[pdes_to_index_map.get(
-                    approach._designation)].approaches.append(approach)
+                approach.neo = self._neos[index]
+            owners.append(index)
 
         # Generate mappings for neos to designation and neos to names
         self._neos_to_designation = {
@@ -37,32 +88,421 @@ class NEODatabase:
         }
         self._neos_to_names = {neo.name: neo for neo in self._neos}
 
+        # Index the approaches by time, so date ranges become contiguous slices.
+        self._time_order = sorted(range(len(self._approaches)),
+                                  key=lambda index: self._approaches[index].minutes)
+        self._time_keys = [self._approaches[index].minutes for index in self._time_order]
+
+        self._group_approaches_by_neo(owners)
+        # The data files are sorted by time, in which case the index is just
+        # the approaches' own positions and a slice of it is a plain range.
+        self._time_order_is_identity = self._time_order == list(range(len(self._time_order)))
+
+        # Gather the statistics the query planner estimates selectivities from.
+        self._statistics = Statistics(self._approaches)
+        self._columns = ApproachColumns(self._neos, self._approaches) if self._columnar else None
+        # The columns packed for parallel scans, each built the first time a scan needs it.
+        self._packed_columns = {}
+        # The positions of earlier queries' matches don't survive relinking.
+        self.cache.clear()
+        self.generation += 1
+
+    def _load_shards(self, start=None, end=None):
+        """Read every shard with an approach in `[start, end)` that isn't loaded yet.
+
+        The database is then relinked from scratch, with the approaches of the
+        loaded shards following its own in shard order, so that the order in
+        which queries happen to load shards never shows in their results.
+
+        :param start: The earliest `datetime` wanted, or None for no lower bound.
+        :param end: The first `datetime` not wanted, or None for no upper bound.
+        :return: Whether any shard was loaded.
+        """
+        lo = None if start is None else datetime_to_minutes(start)
+        hi = None if end is None else datetime_to_minutes(end)
+        with self._lock:
+            wanted = [index for index, shard in enumerate(self._shards)
+                      if index not in self._shard_approaches and shard.overlaps(lo, hi)]
+            if not wanted:
+                return False
+
+            for index in wanted:
+                self._shard_approaches[index] = self._shards[index].load()
+
+            approaches = self._approaches[:self._base_count]
+            self._approaches = []
+            self._owners = array('q')
+            self.link_neos_and_approaches(itertools.chain(
+                approaches, *(self._shard_approaches[index] for index in sorted(self._shard_approaches)),
+                self._added))
+            self._base_count = len(approaches)
+            return True
+
+    def add_approaches(self, approaches):
+        """Add close approaches to the database without relinking it from scratch.
+
+        Only the new approaches are joined to their NEOs, sampled into the
+        planner's statistics and appended to the columnar store, if any, so the
+        cost grows with the number of new approaches rather than with the size of
+        the database. So does adding them to the time index when, as usual, they
+        are later than every approach already known; otherwise, they are sorted
+        and merged into the index in a single pass. NEOs that gain an approach
+        keep their own, time-ordered list of approaches from then on.
+
+        :param approaches: An iterable of new `CloseApproach`es.
+        :return: The number of approaches added.
+        """
+        approaches = list(approaches)
+        with self._lock:
+            first = len(self._approaches)
+            for approach in approaches:
+                self._approaches.append(approach)
+                index = self._pdes_to_index_map.get(approach._designation, -1)
+                if index >= 0:
+                    approach.neo = self._neos[index]
+                self._owners.append(index)
+
+            # Merge the new approaches into the time index. A delta of approaches
+            # later than any already known, the usual case, is simply appended.
+            positions = sorted(range(first, len(self._approaches)), key=lambda index: self._approaches[index].minutes)
+            if not self._time_keys or not positions or self._approaches[positions[0]].minutes >= self._time_keys[-1]:
+                self._time_order.extend(positions)
+                self._time_keys.extend(self._approaches[index].minutes for index in positions)
+                self._time_order_is_identity = self._time_order_is_identity and positions == list(
+                    range(first, len(self._approaches)))
+            else:
+                # Merge the sorted delta in, after any approaches already known at the same time.
+                merged = list(heapq.merge(zip(self._time_keys, self._time_order),
+                                          ((self._approaches[index].minutes, index) for index in positions),
+                                          key=operator.itemgetter(0)))
+                self._time_keys = [minutes for minutes, _ in merged]
+                self._time_order = [index for _, index in merged]
+                self._time_order_is_identity = False
+
+            for index in positions:
+                approach = self._approaches[index]
+                if approach.neo is not None:
+                    approach.neo.add_approach(approach)
+
+            self._statistics.extend(approaches)
+            if self._columns is not None:
+                self._columns.extend(approaches)
+            for name, values in list(self._packed_columns.items()):
+                values.extend(parallel.pack_column(approaches, name))
+            # Earlier queries may now have more matches.
+            self.cache.clear()
+            # Keep the approaches through any later relinking, when shards load.
+            self._added.extend(approaches)
+        return len(approaches)
+
+    def _group_approaches_by_neo(self, owners):
+        """Lay every NEO's approaches out contiguously, in time order.
+
+        Rather than grow a separate list per NEO, a stable sort of the time
+        index by owner places all linked approaches in one shared list, grouped
+        by NEO and ordered by time within each group. `_neo_offsets[i]` is where
+        the approaches of `_neos[i]` start, and `_neo_offsets[i + 1]` where they
+        end. Each NEO's `approaches` becomes a view over its slice.
+
+        :param owners: The index in `_neos` of each approach's NEO, or -1 if it has none.
+        """
+        counts = collections.Counter(owners)
+        offsets = array('q', itertools.accumulate(
+            itertools.chain((0,), (counts.get(index, 0) for index in range(len(self._neos))))))
+
+        positions = sorted(self._time_order, key=owners.__getitem__)
+        # Unlinked approaches sort first, as their owner is -1; leave them out.
+        grouped = list(map(self._approaches.__getitem__, positions[counts.get(-1, 0):]))
+
+        for index, neo in enumerate(self._neos):
+            start, stop = offsets[index], offsets[index + 1]
+            neo.approaches = ApproachSlice(grouped, start, stop) if stop > start else ()
+
+        self._approaches_by_neo = grouped
+        self._neo_offsets = offsets
+
+    def _time_bounds(self, start, end):
+        """Find where the approaches with a time in `[start, end)` lie in the time index.
+
+        :param start: The earliest `datetime` to include, or None for no lower bound.
+        :param end: The first `datetime` to exclude, or None for no upper bound.
+        :return: The `(lo, hi)` bounds of those approaches' slice of the time index.
+        """
+        lo = 0 if start is None else bisect_left(self._time_keys, datetime_to_minutes(start))
+        hi = len(self._time_keys) if end is None else bisect_left(self._time_keys, datetime_to_minutes(end))
+        return lo, max(lo, hi)
+
+    def _count_between(self, start, end):
+        """Count the approaches with a time in `[start, end)`."""
+        lo, hi = self._time_bounds(start, end)
+        return hi - lo
+
+    def _rows_between(self, start, end):
+        """Find the approaches whose time falls in `[start, end)` by binary search.
+
+        :param start: The earliest `datetime` to include, or None for no lower bound.
+        :param end: The first `datetime` to exclude, or None for no upper bound.
+        :return: The positions of those approaches, in ascending order.
+        """
+        lo, hi = self._time_bounds(start, end)
+        if self._time_order_is_identity:
+            return range(lo, hi)
+        # Hand approaches back in their original order.
+        return sorted(self._time_order[lo:hi])
+
     def get_neo_by_designation(self, designation):
         """Find and return an NEO by its primary designation.
 
+        Any shards not yet loaded are loaded first, so that the NEO comes back
+        with all of its close approaches.
+
         :param designation: The primary designation of the NEO to search for.
         :return: The `NearEarthObject` with the desired primary designation, or `None`.
         """
+        self._load_shards()
         return self._neos_to_designation.get(designation.upper())
 
     def get_neo_by_name(self, name):
         """Find and return an NEO by its name.
 
+        Any shards not yet loaded are loaded first, as for `get_neo_by_designation`.
+
         :param name: The name, as a string, of the NEO to search for.
         :return: The `NearEarthObject` with the desired name, or `None`.
         """
+        self._load_shards()
         return self._neos_to_names.get(name.capitalize())
 
-    def query(self, filters=()):
+    def plan(self, filters=()):
+        """Plan how to evaluate a collection of filters.
+
+        :param filters: A collection of filters capturing user-specified criteria.
+        :return: A `QueryPlan` with the time range to read from the index and the ordered predicates to check.
+        """
+        return plan_query(filters, self._statistics, self._count_between)
+
+    def query(self, filters=(), limit=None, jobs=1, sort_by=None, descending=False):
         """Query close approaches to generate those that match a collection of filters.
 
+        The positions of the matches are remembered in the database's `cache`,
+        so that running an equivalent query again reads them back instead of
+        scanning again.
+
+        Matches come out in the order of the data files, unless `sort_by` names
+        an attribute to order them by (see `ordering`). Ordering by time reads
+        the time index in order, and stops as soon as `limit` matches are
+        found; ordering by anything else finds every match first.
+
         :param filters: A collection of filters capturing user-specified criteria.
+        :param limit: The most matching approaches wanted, or None for all of them. The
+            scan stops as soon as this many have been found.
+        :param jobs: The number of worker processes to scan the approaches with.
+        :param sort_by: The attribute to order matches by - 'distance', 'velocity', 'time' or 'diameter' - or None.
+        :param descending: Whether to order matches from the largest value of `sort_by` to the smallest.
         :return: A stream of matching `CloseApproach` objects.
+        :raises ValueError: If `limit` is negative.
+        """
+        if limit is not None and limit < 0:
+            raise ValueError(f"The limit must not be negative, not {limit}.")
+        # Start the scan against the database as it is now; it runs on without the lock.
+        with self._lock:
+            if sort_by == 'time':
+                rows = self._rows_by_time(filters, descending)
+            elif sort_by is not None:
+                rows = self._matching_rows(filters, None, jobs)
+            else:
+                rows = self._matching_rows(filters, limit, jobs)
+            # The approaches the scan reads, once it has loaded any shards it needs.
+            approaches = self._approaches
+        if sort_by is not None and sort_by != 'time':
+            key = ordering.sort_key(approaches, sort_by, descending)
+            rows = ordering.top_k(rows, key, limit) if limit else ordering.sort(rows, key)
+        results = map(approaches.__getitem__, rows)
+        return itertools.islice(results, limit) if limit else results
+
+    def order(self, rows, sort_by, descending=False, limit=None):
+        """Order the positions of some matches by an attribute of their approaches.
+
+        With a `limit`, only that many positions are kept while the rest stream
+        past. Without one, every position is sorted, spilling to disk if there are many.
+
+        :param rows: An iterable of positions, in ascending order, as from `match` or `refine`.
+        :param sort_by: The attribute to order by - 'distance', 'velocity', 'time' or 'diameter'.
+        :param descending: Whether to order from the largest value to the smallest.
+        :param limit: How many of the first positions are wanted, or None for all of them.
+        :return: An iterable of the (first `limit`) positions, in order.
+        """
+        key = ordering.sort_key(self._approaches, sort_by, descending)
+        if limit:
+            return ordering.top_k(rows, key, limit)
+        return ordering.sort(rows, key)
+
+    def _rows_by_time(self, filters, descending=False):
+        """Generate the positions of the approaches matching a collection of filters, in time order."""
+        plan = self.plan(filters)
+        if self._load_shards(plan.start, plan.end):
+            plan = self.plan(filters)
+        lo, hi = self._time_bounds(plan.start, plan.end)
+        # Hold on to the approaches as they are now, should the database be relinked mid-query.
+        approaches = self._approaches
+        rows = self._time_order[lo:hi]
+        if descending:
+            # Walk the index backwards, but keep approaches at the same time in the order of the data file.
+            groups = itertools.groupby(reversed(rows), key=lambda row: approaches[row].minutes)
+            rows = (row for _, group in groups for row in reversed(list(group)))
+        matches = compile_filters(plan.predicates)
+        return (row for row in rows if matches(approaches[row]))
+
+    def match(self, filters=(), jobs=1):
+        """Find the positions of every close approach that matches a collection of filters.
+
+        :param filters: A collection of filters capturing user-specified criteria.
+        :param jobs: The number of worker processes to scan the approaches with.
+        :return: An `array` of the positions of the matching approaches, in ascending order.
+        """
+        with self._lock:
+            rows = self._matching_rows(filters, None, jobs)
+        return array('q', rows)
+
+    def refine(self, rows, filters=()):
+        """Narrow down an earlier set of matches with more filters.
+
+        Only the approaches at `rows` are examined, so the cost grows with the
+        size of the earlier result rather than with the size of the database.
+
+        :param rows: The positions of the earlier matches, in ascending order, as from `match` or `refine`.
+        :param filters: A collection of further filters that the approaches must match.
+        :return: An `array` of the positions of the approaches at `rows` that match every filter.
         """
-        if filters:
-            for approach in self._approaches:
-                if all(map(lambda f: f(approach), filters)):
-                    yield approach
+        with self._lock:
+            approaches, columns, plan = self._approaches, self._columns, self.plan(filters)
+        if plan.start is not None and plan.end is not None and plan.start >= plan.end:
+            return array('q')
+        # The date filters the plan collapsed into a time range are checked like any other.
+        _, _, residual = split_date_range(filters)
+        predicates = [f for f in filters if not any(f is other for other in residual)] + plan.predicates
+
+        if columns is not None:
+            vectorized = [f for f in predicates if column_for(f) is not None]
+            rows = columns.select(vectorized, rows).tolist()
+            predicates = [f for f in predicates if column_for(f) is None]
+        matches = compile_filters(predicates)
+        return array('q', itertools.compress(rows, map(matches, map(approaches.__getitem__, rows))))
+
+    def approaches_at(self, rows):
+        """Generate the close approaches at some positions, such as those from `match` or `refine`.
+
+        :param rows: An iterable of positions of approaches in the database.
+        :return: A stream of `CloseApproach` objects.
+        """
+        return map(self._approaches.__getitem__, rows)
+
+    def _matching_rows(self, filters, limit=None, jobs=1):
+        """Generate the positions of the approaches matching a collection of filters, in order."""
+        plan = self.plan(filters)
+        # Read only the shards the query's date range overlaps, then plan
+        # again against statistics that include their approaches.
+        if self._load_shards(plan.start, plan.end):
+            plan = self.plan(filters)
+
+        # A query with nothing to evaluate row by row is as cheap to answer as to cache.
+        key = cache_key(filters) if plan.predicates else None
+        rows = None if key is None else self.cache.get(key, limit)
+        if rows is None:
+            epoch = self.cache.epoch
+            rows = self._scan(plan, limit, jobs)
+            if key is not None:
+                rows = self._remember(key, rows, limit, epoch)
+        return rows
+
+    def _remember(self, key, rows, limit=None, epoch=None):
+        """Pass along the positions of a query's matches, caching them once they are all found.
+
+        :param key: The query's `cache_key`.
+        :param rows: A stream of the positions of the query's matches.
+        :param limit: The most matches wanted, or None for all of them.
+        :param epoch: The cache's `epoch` when the scan started, so that a scan
+            outlasting a change to the data doesn't cache stale positions.
+        :yield: The positions from `rows`.
+        """
+        found = array('q')
+        for row in rows:
+            found.append(row)
+            if limit and len(found) >= limit:
+                # The caller stops here, so cache the first matches now.
+                self.cache.put(key, found, complete=False, epoch=epoch)
+                yield row
+                return
+            yield row
+        self.cache.put(key, found, complete=True, epoch=epoch)
+
+    def _scan_pool(self, jobs):
+        """Return a pool of at least `jobs` worker processes for parallel scans, starting one if need be."""
+        if self._pool_jobs < jobs:
+            self.close()
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+            self._pool_jobs = jobs
+        return self._pool
+
+    def close(self):
+        """Stop the worker processes of parallel scans, if any were started.
+
+        The database can still be queried afterwards; a later parallel scan starts new workers.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_jobs = 0
+
+    def _scan(self, plan, limit=None, jobs=1):
+        """Start generating the positions of the approaches matching a `QueryPlan`, in order.
+
+        The scan holds on to the approaches, columns and index as they are when
+        it starts. Relinking the database, as when another query loads shards,
+        replaces them rather than changing them, so a scan that is still running
+        keeps generating positions consistent with the approaches it began with.
+
+        :param plan: The `QueryPlan` to follow.
+        :param limit: How many matches are wanted, if known, so that the columnar
+            store can evaluate its masks a block at a time instead of all at once.
+        :param jobs: The number of worker processes to scan with. A scan is only
+            spread across processes when every predicate can be evaluated over packed columns.
+        :return: A stream of the positions of the matching approaches.
+        """
+        rows = None if plan.start is None and plan.end is None else self._rows_between(plan.start, plan.end)
+        parallelizable = jobs > 1 and plan.predicates and parallel.columns_for(plan.predicates) is not None
+        pool = self._scan_pool(jobs) if parallelizable else None
+        return _scan_rows(self._approaches, self._columns, self._packed_columns, rows, plan.predicates, limit,
+                          pool, jobs)
+
+
+def _scan_rows(approaches, columns, packed_columns, rows, predicates, limit=None, pool=None, jobs=1):
+    """Generate the positions of the approaches at `rows` (or all of them) that match every predicate.
+
+    With a `pool`, the rows are scanned in partitions across its worker processes, `jobs` at a time.
+    """
+    if pool is not None:
+        def packed_column(name):
+            # Pack each column the first time a scan needs it.
+            values = packed_columns.get(name)
+            if values is None:
+                values = packed_columns[name] = parallel.pack_column(approaches, name)
+            return values
+
+        rows = range(len(approaches)) if rows is None else rows
+        yield from parallel.scan(pool, packed_column, rows, predicates, jobs, limit)
+    elif columns is not None:
+        # Vectorize every predicate the columns can answer, and check any
+        # others only against the approaches that survive.
+        vectorized = [f for f in predicates if column_for(f) is not None]
+        matches = compile_filters([f for f in predicates if column_for(f) is None])
+        for indices in columns.iter_select(vectorized, rows, block=limit):
+            for index in indices.tolist():
+                if matches(approaches[index]):
+                    yield index
+    else:
+        matches = compile_filters(predicates)
+        if rows is None:
+            yield from itertools.compress(itertools.count(), map(matches, approaches))
         else:
-            for approach in self._approaches:
-                yield approach
+            yield from itertools.compress(rows, map(matches, map(approaches.__getitem__, rows)))
@@ -1,41 +1,305 @@
 """Functions to load the Nearth Earth Objects and Close Approaches from the data files."""
 
+import bz2
 import csv
+import gzip
+import io
 import json
+import lzma
+import re
 from models import NearEarthObject, CloseApproach
 
+# Size, in characters, of each read from a close approach file while streaming.
+_CHUNK_SIZE = 1 << 16
 
-def load_neos(neo_csv_path):
+# Size, in bytes, of the buffer between a decompressor and the text decoder.
+_READ_BUFFER_SIZE = 1 << 20
+
+# The compression formats a data file may be stored in, recognised first by
+# their magic bytes and then by their extension.
+_CODECS = (
+    # (name, magic bytes, extensions, module)
+    ('gzip', b'\x1f\x8b', ('.gz', '.gzip'), gzip),
+    ('bzip2', b'BZh', ('.bz2',), bz2),
+    ('xz', b'\xfd7zXZ\x00', ('.xz', '.lzma'), lzma),
+)
+
+# How many bytes at the end of a close approach file to probe for its `fields`.
+_TAIL_PROBE_SIZE = 1 << 18
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_FIELDS_KEY = re.compile(rb'"fields"\s*:')
+
+
+def compression(path):
+    """Return the name of the compression format of a data file, or None if it is plain.
+
+    :param path: A path to a data file.
+    :return: One of 'gzip', 'bzip2' or 'xz', or None.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    for name, magic, _, _ in _CODECS:
+        if head.startswith(magic):
+            return name
+    suffix = str(path).lower()
+    for name, _, extensions, _ in _CODECS:
+        if suffix.endswith(extensions):
+            return name
+    return None
+
+
+def open_data_file(path, binary=False, newline=None):
+    """Open a data file for reading, decompressing it on the fly if needed.
+
+    Decompression is streamed, through a large buffer, so a compressed file
+    never has to be expanded on disk or held in memory as a whole.
+
+    :param path: A path to a plain, gzip, bzip2 or xz data file.
+    :param binary: Whether to return a binary file object, rather than a text one.
+    :param newline: How to translate newlines, as for `open`, in text mode.
+    :return: A file object over the file's uncompressed contents.
+    """
+    codec = compression(path)
+    if codec is None:
+        if binary:
+            return open(path, 'rb', buffering=_READ_BUFFER_SIZE)
+        return open(path, buffering=_READ_BUFFER_SIZE, newline=newline)
+
+    module = next(module for name, _, _, module in _CODECS if name == codec)
+    f = io.BufferedReader(module.open(path, 'rb'), buffer_size=_READ_BUFFER_SIZE)
+    return f if binary else io.TextIOWrapper(f, newline=newline)
+
+
+def load_neos(neo_csv_path, extra_columns=()):
     """
     Read near-Earth object information from a CSV file.
 
+    The positions of the columns we need are resolved once from the header, and
+    each row is projected down to just those columns, instead of building a
+    dictionary of every one of the file's 75 columns for each NEO.
+
+    The file may be compressed with gzip, bzip2 or xz.
+
     :param neo_csv_path: A path to a CSV file containing data about near-Earth objects.
+    :param extra_columns: Names of additional columns to keep on each NEO's `extra` mapping.
     :return: A list of `NearEarthObject`s.
     """
     try:
-        with open(neo_csv_path) as f:
-            reader = csv.DictReader(f)
+        with open_data_file(neo_csv_path, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+
+            pdes = header.index('pdes')
+            name = header.index('name')
+            diameter = header.index('diameter')
+            pha = header.index('pha')
+            extras = [(column, header.index(column)) for column in extra_columns]
 
             neos = []
-            for neo in reader:
+            for row in reader:
+                if not row:
+                    continue
                 neos.append(
                     NearEarthObject(
-                        **{
-                            'designation':
-                            neo.get('pdes', ''),
-                            'name':
-                            neo.get('name') if neo.get('name') != '' else None,
-                            'diameter':
-                            float('nan' if neo.get('diameter') ==
-                                  '' else neo.get('diameter')),
-                            'hazardous':
-                            bool(True if neo.get('pha') == 'Y' else False)
-                        }))
+                        designation=row[pdes],
+                        name=row[name] or None,
+                        diameter=float(row[diameter] or 'nan'),
+                        hazardous=row[pha] == 'Y',
+                        extra={column: row[index] for column, index in extras} if extras else None))
             return neos
     except Exception as e:
         print('Something went wrong!', e)
 
 
+class _JSONStream:
+    """Incrementally decode a JSON document from a text file, one value at a time.
+
+    Only as much of the file as is needed to decode the next value is held in
+    memory, so arbitrarily large arrays can be walked in constant memory.
+    """
+
+    def __init__(self, f, chunk_size=None):
+        """Create a new `_JSONStream` over an open text file.
+
+        :param f: A file object opened in text mode.
+        :param chunk_size: The number of characters to read from `f` at a time.
+        """
+        self._f = f
+        self._chunk_size = chunk_size or _CHUNK_SIZE
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+
+    def _fill(self):
+        """Read another chunk from the file, discarding consumed input.
+
+        :return: Whether any more input was read.
+        """
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at end of input."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be `char`."""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON: expected {char!r}, found {found or 'end of file'!r}.")
+        self._pos += 1
+
+    def value(self):
+        """Decode and return the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A bare number or literal may continue into the next chunk.
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def members(self):
+        """Walk the members of the JSON object starting at the current position.
+
+        Yields `(key, stream)` pairs. The consumer must read exactly one value
+        (with `value` or `items`) from the stream before advancing.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key, self
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def items(self):
+        """Decode the elements of the JSON array at the current position one by one."""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self._pos += 1
+                continue
+            self.expect(']')
+            return
+
+
+def _probe_cad_fields(cad_json_path):
+    """Look for the `fields` header near the end of a close approach file.
+
+    NASA's API serializes its keys in alphabetical order, so `fields` follows
+    the (potentially huge) `data` array. Rather than walk the whole array just
+    to learn the column layout, read the header straight out of the file's tail.
+
+    A compressed file can't be seeked into cheaply, so its tail is found by
+    decompressing it through to the end, which is still much faster than
+    decoding the JSON along the way.
+
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :return: The list of field names, or None if they could not be located.
+    """
+    if compression(cad_json_path) is None:
+        with open(cad_json_path, 'rb') as f:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - _TAIL_PROBE_SIZE))
+            tail = f.read()
+    else:
+        tail = b''
+        with open_data_file(cad_json_path, binary=True) as f:
+            for block in iter(lambda: f.read(_TAIL_PROBE_SIZE), b''):
+                tail = tail[-_TAIL_PROBE_SIZE:] + block
+
+    for match in reversed(list(_FIELDS_KEY.finditer(tail))):
+        text = tail[match.end():].decode('utf-8', errors='replace')
+        try:
+            fields, _ = json.JSONDecoder().raw_decode(text.lstrip())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(fields, list) and all(isinstance(field, str) for field in fields):
+            return fields
+    return None
+
+
+def _scan_cad_fields(cad_json_path):
+    """Find the `fields` header by walking the top level of a close approach file.
+
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :return: The list of field names, or None if the file has none.
+    """
+    with open_data_file(cad_json_path) as f:
+        for key, stream in _JSONStream(f).members():
+            if key == 'fields':
+                return stream.value()
+            if key == 'data':
+                for _ in stream.items():
+                    pass
+            else:
+                stream.value()
+    return None
+
+
+def iter_approaches(cad_json_path):
+    """
+    Stream close approach data from a JSON file.
+
+    Rows of the `data` array are decoded one at a time and turned into
+    `CloseApproach`es using column positions resolved once from the `fields`
+    header, so memory use doesn't grow with the size of the file. The file may
+    be compressed with gzip, bzip2 or xz.
+
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :yield: Each `CloseApproach` in the file, in order.
+    """
+    fields = None
+
+    with open_data_file(cad_json_path) as f:
+        for key, stream in _JSONStream(f).members():
+            if key == 'fields':
+                fields = stream.value()
+            elif key == 'data':
+                if fields is None:
+                    fields = _probe_cad_fields(cad_json_path) or _scan_cad_fields(cad_json_path)
+                if fields is None:
+                    raise ValueError(f"{cad_json_path} has no `fields` header.")
+
+                des, dist, v_rel = fields.index('des'), fields.index('dist'), fields.index('v_rel')
+                # Prefer the numeric Julian Date to parsing the calendar date.
+                key, time = ('jd', fields.index('jd')) if 'jd' in fields else ('time', fields.index('cd'))
+                for row in stream.items():
+                    yield CloseApproach(designation=row[des],
+                                        distance=float(row[dist]),
+                                        velocity=float(row[v_rel]),
+                                        **{key: row[time]})
+            else:
+                stream.value()
+
+
 def load_approaches(cad_json_path):
     """
     Read close approach data from a JSON file.
@@ -44,30 +308,6 @@ def load_approaches(cad_json_path):
     :return: A list of `CloseApproach`es.
     """
     try:
-        with open(cad_json_path) as f:
-            reader = json.load(f)
-
-            # Get the fields and data for the close approaches
-            fields = reader.get('fields')
-            data = reader.get('data')
-
-            close_approaches = []
-            for approach in data:
-                # Create a close approach dictionary
-                close_approach = {
-                    fields[index]: value
-                    for index, value in enumerate(approach)
-                }
-                # Add it to the list of all close approaches
-                close_approaches.append(
-                    CloseApproach(
-                        **{
-                            'designation': close_approach.get('des'),
-                            'time': close_approach.get('cd'),
-                            'distance': float(close_approach.get('dist')),
-                            'velocity': float(close_approach.get('v_rel'))
-                        }))
-
-        return close_approaches
+        return list(iter_approaches(cad_json_path))
     except Exception as e:
         print('Something went wrong!', e)
@@ -1,14 +1,58 @@
 """Classes to instantiate filters during query operations by the user."""
 
+import datetime
+import itertools
+import math
 import operator
 
+from helpers import MINUTES_PER_DAY, date_to_day
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+# For each comparison a `DateFilter` can make, the [first, last + 1) range of
+# dates it admits, relative to its reference date (None for an open bound).
+_DATE_RANGES = {
+    operator.eq: lambda date: (date, date + _ONE_DAY),
+    operator.ge: lambda date: (date, None),
+    operator.gt: lambda date: (date + _ONE_DAY, None),
+    operator.le: lambda date: (None, date + _ONE_DAY),
+    operator.lt: lambda date: (None, date),
+}
+
+
+# The source-code spelling of each comparison `compile_filters` can inline.
+_OPERATOR_SYMBOLS = {
+    operator.eq: '==',
+    operator.ne: '!=',
+    operator.ge: '>=',
+    operator.gt: '>',
+    operator.le: '<=',
+    operator.lt: '<',
+}
+
 
 class UnsupportedCriterionError(NotImplementedError):
     """A filter criterion is unsupported."""
 
 
 class AttributeFilter:
-    """A general superclass for filters on comparable attributes."""
+    """A general superclass for filters on comparable attributes.
+
+    Subclasses that read their attribute with a simple expression in terms of
+    `approach` can advertise it as `expression`, so that `compile_filters` can
+    inline it instead of calling `get`.
+    """
+
+    expression = None
+
+    @classmethod
+    def key(cls, value):
+        """Return a reference value on the same scale as `expression`.
+
+        :param value: A reference value, as given to the constructor.
+        :return: The value to compare `expression` against.
+        """
+        return value
 
     def __init__(self, op, value):
         """Construct a new `AttributeFilter` from an binary predicate and a reference value.
@@ -37,9 +81,35 @@ class AttributeFilter:
         return f"{self.__class__.__name__}(op=operator.{self.op.__name__}, value={self.value})"
 
 
+def _as_date(value):
+    """Return the date of a `datetime`, or any other value as it is."""
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
 class DateFilter(AttributeFilter):
     """Class to instantiate date filters."""
 
+    expression = f'approach.minutes // {MINUTES_PER_DAY}'
+
+    def __init__(self, op, value):
+        """Construct a new `DateFilter` comparing approach dates against a reference `date`.
+
+        :param op: A 2-argument predicate comparator (such as `operator.le`).
+        :param value: The reference `date` to compare against. A `datetime` is compared by its date.
+        """
+        value = _as_date(value)
+        super().__init__(op, value)
+        self.day = date_to_day(value)
+
+    def __call__(self, approach):
+        """Invoke `self(approach)`, comparing whole days since the epoch rather than `date`s."""
+        return self.op(approach.minutes // MINUTES_PER_DAY, self.day)
+
+    @classmethod
+    def key(cls, value):
+        """Return a reference `date` as whole days since the epoch, as `expression` measures."""
+        return date_to_day(_as_date(value))
+
     @classmethod
     def get(cls, approach):
         """Get the date of a close approach.
@@ -53,6 +123,8 @@ class DateFilter(AttributeFilter):
 class DistanceFilter(AttributeFilter):
     """Class to instantiate distance filters."""
 
+    expression = 'approach.distance'
+
     @classmethod
     def get(cls, approach):
         """Get the distance of a close approach.
@@ -66,6 +138,8 @@ class DistanceFilter(AttributeFilter):
 class VelocityFilter(AttributeFilter):
     """Class to instantiate velocity filters."""
 
+    expression = 'approach.velocity'
+
     @classmethod
     def get(cls, approach):
         """Get the velocity of a close approach.
@@ -79,6 +153,8 @@ class VelocityFilter(AttributeFilter):
 class DiameterFilter(AttributeFilter):
     """Class to instantiate diameter filters."""
 
+    expression = 'approach.neo.diameter'
+
     @classmethod
     def get(cls, approach):
         """Get the diameter of the NEO assigned to the close approach.
@@ -92,6 +168,8 @@ class DiameterFilter(AttributeFilter):
 class HazardousFilter(AttributeFilter):
     """Class to instantiate hazardous filter."""
 
+    expression = 'approach.neo.hazardous'
+
     @classmethod
     def get(cls, approach):
         """Get the hazardous state of the NEO assigned to the close approach.
@@ -102,6 +180,36 @@ class HazardousFilter(AttributeFilter):
         return approach.neo.hazardous
 
 
+class RangeFilter:
+    """A filter admitting approaches whose attribute lies within inclusive bounds.
+
+    A `RangeFilter` stands in for a `>=` and a `<=` filter on the same attribute,
+    reading the attribute once instead of twice.
+    """
+
+    def __init__(self, attribute, low=None, high=None):
+        """Construct a new `RangeFilter`.
+
+        :param attribute: The `AttributeFilter` subclass whose `get` reads the attribute.
+        :param low: The least admitted value, or None for no lower bound.
+        :param high: The greatest admitted value, or None for no upper bound.
+        """
+        self.attribute = attribute
+        self.low = low
+        self.high = high
+
+    def __call__(self, approach):
+        """Invoke `self(approach)`."""
+        value = self.attribute.get(approach)
+        if self.low is not None and not value >= self.low:
+            return False
+        return self.high is None or value <= self.high
+
+    def __repr__(self):
+        """return: a computer-readable string representation of this object."""
+        return f"{self.__class__.__name__}(attribute={self.attribute.__name__}, low={self.low}, high={self.high})"
+
+
 def create_filters(date=None,
                    start_date=None,
                    end_date=None,
@@ -152,14 +260,98 @@ def create_filters(date=None,
     return filters
 
 
-def limit(iterator, n=None):
+def split_date_range(filters):
+    """Collapse the date filters in a collection into a single time range.
+
+    Every `DateFilter` comparing with `==`, `>=`, `>`, `<=` or `<` admits a
+    contiguous range of approach times, so together they admit the intersection
+    of those ranges. That range can be answered by an index over approach times,
+    leaving only the other filters to be checked approach by approach.
+
+    :param filters: A collection of filters, as produced by `create_filters`.
+    :return: A tuple `(start, end, residual)`, where approaches at times in
+        `[start, end)` satisfy every collapsed date filter (`None` marking an open
+        bound), and `residual` lists the filters that were not collapsed.
+    """
+    start = end = None
+    residual = []
+    for f in filters:
+        if type(f) is not DateFilter or f.op not in _DATE_RANGES:
+            residual.append(f)
+            continue
+        first, last = _DATE_RANGES[f.op](f.value)
+        if first is not None:
+            first = datetime.datetime.combine(first, datetime.time())
+            start = first if start is None else max(start, first)
+        if last is not None:
+            last = datetime.datetime.combine(last, datetime.time())
+            end = last if end is None else min(end, last)
+    return start, end, residual
+
+
+def compile_filters(filters):
+    """Fuse a collection of filters into a single specialized predicate function.
+
+    Calling each filter on each approach costs a method call, a classmethod
+    dispatch to `get` and an `operator` call per filter. Instead, generate the
+    source of one function that tests every filter in a single boolean
+    expression, reading attributes straight off the approach and comparing them
+    against inlined constants:
+
+        def predicate(approach):
+            return (approach.neo.hazardous == True) and (0.1 <= approach.distance <= 0.3)
+
+    Filters are tested in the given order, short-circuiting on the first that
+    fails. Filters with no `expression` (or an unusual comparison) are called
+    as they are.
+
+    :param filters: A collection of filters, such as those from `create_filters`.
+    :return: A function from a `CloseApproach` to whether it matches every filter.
+    """
+    namespace = {}
+
+    def constant(value):
+        # Literals are inlined; anything else is bound to a name in the namespace.
+        if type(value) in (bool, int) or (type(value) is float and math.isfinite(value)):
+            return repr(value)
+        name = f"_c{len(namespace)}"
+        namespace[name] = value
+        return name
+
+    clauses = []
+    for f in filters:
+        if isinstance(f, RangeFilter) and f.attribute.expression:
+            bounds = [f.attribute.expression]
+            if f.low is not None:
+                bounds.insert(0, f"{constant(f.attribute.key(f.low))} <=")
+            if f.high is not None:
+                bounds.append(f"<= {constant(f.attribute.key(f.high))}")
+            clauses.append(' '.join(bounds))
+        elif getattr(f, 'expression', None) and f.op in _OPERATOR_SYMBOLS:
+            clauses.append(f"{f.expression} {_OPERATOR_SYMBOLS[f.op]} {constant(f.key(f.value))}")
+        else:
+            clauses.append(f"{constant(f)}(approach)")
+
+    body = ' and '.join(f"({clause})" for clause in clauses) or 'True'
+    source = f"def predicate(approach):\n    return {body}\n"
+    exec(compile(source, '<compiled filters>', 'exec'), namespace)
+    predicate = namespace['predicate']
+    predicate.source = source
+    return predicate
+
+
+def limit(iterator, n=None, offset=0):
     """Produce a limited stream of values from an iterator.
 
+    Values are pulled from `iterator` lazily, and no more are pulled once the
+    last wanted value has been produced.
+
     :param iterator: An iterator of values.
     :param n: The maximum number of values to produce.
-    :yield: The first (at most) `n` values from the iterator.
+    :param offset: The number of values to skip before producing any, for paging.
+    :yield: The first (at most) `n` values from the iterator, after the first `offset`.
+    :raises ValueError: If `n` or `offset` is negative.
     """
-    if n == 0 or n is None:
-        return iterator
-
-    return [x for i, x in enumerate(iterator) if i < n]
+    if (n is not None and n < 0) or offset < 0:
+        raise ValueError(f"The limit and offset must not be negative, not {n} and {offset}.")
+    return itertools.islice(iterator, offset, offset + n if n else None)
@@ -9,8 +9,53 @@ The `datetime_to_str` function converts a Python `datetime` into a string.
 Although `datetime`s already have human-readable string representations, those
 representations display seconds, but NASA's data (and our datetimes!) don't
 provide that level of resolution, so the output format also will not.
+
+For compact storage, the `datetime_to_minutes` and `minutes_to_datetime`
+functions convert between a `datetime` and a whole number of minutes since the
+Unix epoch - again, the resolution of NASA's data. The `jd_to_minutes` function
+converts the Julian Date in the `jd` field of close approach data to the same
+scale without any string parsing, and `date_to_day` converts a `date` into
+whole days since the epoch, for comparison with `minutes // MINUTES_PER_DAY`.
 """
 import datetime
+import functools
+
+EPOCH = datetime.datetime(1970, 1, 1)
+_MINUTE = datetime.timedelta(minutes=1)
+MINUTES_PER_DAY = 24 * 60
+
+# The Julian Date of the Unix epoch.
+_EPOCH_JD = 2440587.5
+
+# English month abbreviations, as used in the `cd` field, and their numbers.
+_MONTHS = {
+    month: number
+    for number, month in enumerate(
+        ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), start=1)
+}
+
+# How many distinct calendar days `cd_to_datetime` remembers.
+_DAY_CACHE_SIZE = 1 << 14
+
+
+@functools.lru_cache(maxsize=_DAY_CACHE_SIZE)
+def _parse_day(day):
+    """Parse and validate the YYYY-bb-DD day of a NASA-formatted calendar date.
+
+    Many close approaches happen on the same day, so the parsed days are cached.
+
+    :param day: A calendar day in YYYY-bb-DD format.
+    :return: A `(year, month, day)` tuple, or None if `day` is malformed.
+    """
+    year, month, date = day[:4], day[5:8], day[9:]
+    number = _MONTHS.get(month) or _MONTHS.get(month.title())
+    if day[4] != '-' or day[8] != '-' or not number or not (year.isdigit() and date.isdigit()):
+        return None
+    try:
+        datetime.date(int(year), number, int(date))
+    except ValueError:
+        return None
+    return int(year), number, int(date)
 
 
 def cd_to_datetime(calendar_date):
@@ -23,10 +68,22 @@ def cd_to_datetime(calendar_date):
 
     This will become the Python object `datetime.datetime(2020, 12, 31, 12, 0)`.
 
+    Rather than run the locale-aware `strptime` for every close approach, the
+    fixed layout is sliced apart directly, month names are looked up in a table,
+    and the days are cached.
+
     :param calendar_date: A calendar date in YYYY-bb-DD hh:mm format.
     :return: A naive `datetime` corresponding to the given calendar date and time.
+    :raises ValueError: If `calendar_date` isn't a valid date in that format.
     """
-    return datetime.datetime.strptime(calendar_date, "%Y-%b-%d %H:%M")
+    day = _parse_day(calendar_date[:11]) if len(calendar_date) == 17 and calendar_date[11] == ' ' else None
+    hour, minute = calendar_date[12:14], calendar_date[15:]
+    if day is None or calendar_date[14] != ':' or not (hour.isdigit() and minute.isdigit()):
+        raise ValueError(f"{calendar_date!r} is not a calendar date in YYYY-bb-DD hh:mm format.")
+    try:
+        return datetime.datetime(*day, int(hour), int(minute))
+    except ValueError:
+        raise ValueError(f"{calendar_date!r} is not a valid time of day.") from None
 
 
 def datetime_to_str(dt):
@@ -41,4 +98,44 @@ def datetime_to_str(dt):
     :param dt: A naive Python datetime.
     :return: That datetime, as a human-readable string without seconds.
     """
-    return datetime.datetime.strftime(dt, "%Y-%m-%d %H:%M")
+    # Equivalent to `strftime("%Y-%m-%d %H:%M")`, without parsing the format.
+    return '%04d-%02d-%02d %02d:%02d' % (dt.year, dt.month, dt.day, dt.hour, dt.minute)
+
+
+def datetime_to_minutes(dt):
+    """Convert a naive Python datetime into whole minutes since the Unix epoch.
+
+    :param dt: A naive Python datetime.
+    :return: The number of whole minutes between the epoch and `dt`.
+    """
+    return (dt - EPOCH) // _MINUTE
+
+
+def minutes_to_datetime(minutes):
+    """Convert whole minutes since the Unix epoch into a naive Python datetime.
+
+    :param minutes: A number of minutes since the epoch.
+    :return: The corresponding naive `datetime`.
+    """
+    return EPOCH + minutes * _MINUTE
+
+
+def jd_to_minutes(jd):
+    """Convert a Julian Date into whole minutes since the Unix epoch.
+
+    NASA's `cd` field is the `jd` field rounded to the nearest minute, so this
+    agrees with `datetime_to_minutes(cd_to_datetime(cd))`.
+
+    :param jd: A Julian Date, as a number or a numeric string.
+    :return: The number of minutes between the epoch and `jd`, rounded to the nearest minute.
+    """
+    return round((float(jd) - _EPOCH_JD) * MINUTES_PER_DAY)
+
+
+def date_to_day(date):
+    """Convert a `date` into whole days since the Unix epoch.
+
+    :param date: A Python `date`.
+    :return: The number of days between the epoch and `date`.
+    """
+    return (date - EPOCH.date()).days
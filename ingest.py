@@ -0,0 +1,239 @@
+"""Load the data files in parallel, across a pool of worker processes.
+
+`load_neos` and `iter_approaches` parse their files on a single core, one after
+the other. `load` instead splits each file into byte ranges that start and end
+on record boundaries - lines of `neos.csv`, rows of the `data` array of
+`cad.json` - and parses the chunks of both files at the same time in a
+`ProcessPoolExecutor`.
+
+Workers don't send back `NearEarthObject`s and `CloseApproach`es, which would
+be slow to pickle and unpickle. Each returns the columns of its chunk as flat
+buffers instead: NUL-separated UTF-8 strings and native `array`s of numbers,
+laid out just like the sections of a snapshot. The parent stitches the chunks
+back together in file order and builds the objects, so the result is the same
+as that of the serial loaders.
+"""
+import array
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import re
+
+from extract import _TAIL_PROBE_SIZE, _probe_cad_fields, _scan_cad_fields, compression, load_neos, load_approaches
+from helpers import cd_to_datetime, datetime_to_minutes, jd_to_minutes
+from models import NearEarthObject, CloseApproach
+from snapshot import encode_strings, decode_strings
+
+# The fewest bytes worth handing to a worker as one chunk.
+MIN_CHUNK_SIZE = 1 << 20
+
+_DATA_KEY = re.compile(rb'"data"\s*:\s*\[')
+_ROW_SEPARATOR = re.compile(rb'\]\s*,\s*\[')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _split(start, stop, jobs, align):
+    """Divide the byte range `[start, stop)` into about `jobs` aligned chunks.
+
+    :param start: The offset of the first record.
+    :param stop: The offset just past the last record.
+    :param jobs: The number of worker processes.
+    :param align: A function from an offset to the offset of the next record boundary at or after it.
+    :return: A list of `(start, stop)` byte ranges that together cover `[start, stop)`.
+    """
+    size = max(MIN_CHUNK_SIZE, -(-(stop - start) // jobs))
+    bounds = [start]
+    while bounds[-1] + size < stop:
+        boundary = align(bounds[-1] + size)
+        if boundary is None or boundary >= stop:
+            break
+        bounds.append(boundary)
+    bounds.append(stop)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _read(path, start, stop):
+    """Read the bytes `[start, stop)` of a file."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(stop - start)
+
+
+def _next_line(path, offset):
+    """Return the offset of the first line that starts at or after `offset`."""
+    with open(path, 'rb') as f:
+        f.seek(offset - 1)
+        f.readline()
+        return f.tell()
+
+
+def _next_row(path, offset):
+    """Return the offset of the first `data` row that starts after `offset`, or None."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            block = f.read(MIN_CHUNK_SIZE)
+            match = _ROW_SEPARATOR.search(block)
+            if match:
+                return offset + match.end() - 1
+            if len(block) < MIN_CHUNK_SIZE:
+                return None
+            # Back up a little, in case a separator straddles the blocks.
+            offset += len(block) - 64
+            f.seek(offset)
+
+
+def _neo_chunks(neo_csv_path, jobs):
+    """Split a CSV file of NEOs into chunks of whole lines, after its header.
+
+    :return: A tuple of the header row and a list of `(start, stop)` byte ranges,
+             or None if the file is compressed and so can't be split.
+    """
+    if compression(neo_csv_path) is not None:
+        return None
+    with open(neo_csv_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8')]))
+        start = f.tell()
+        stop = f.seek(0, os.SEEK_END)
+    return header, _split(start, stop, jobs, lambda offset: _next_line(neo_csv_path, offset))
+
+
+def _cad_chunks(cad_json_path, jobs):
+    """Split the `data` array of a close approach file into chunks of whole rows.
+
+    :return: A tuple of the list of field names and a list of `(start, stop)`
+             byte ranges, or None if the file is compressed or the `data` array
+             could not be located.
+    """
+    if compression(cad_json_path) is not None:
+        return None
+    with open(cad_json_path, 'rb') as f:
+        match = _DATA_KEY.search(f.read(_TAIL_PROBE_SIZE))
+        stop = f.seek(0, os.SEEK_END)
+    if match is None:
+        return None
+    fields = _probe_cad_fields(cad_json_path) or _scan_cad_fields(cad_json_path)
+    if fields is None:
+        raise ValueError(f"{cad_json_path} has no `fields` header.")
+    # The last chunk runs to the end of the file; its parser stops at the `]`.
+    return fields, _split(match.end(), stop, jobs, lambda offset: _next_row(cad_json_path, offset))
+
+
+def _parse_neo_chunk(neo_csv_path, start, stop, header, extra_columns):
+    """Parse a chunk of lines of a CSV file of NEOs into columns.
+
+    :return: A tuple of the chunk's row count, designations, names, diameters,
+             hazard statuses and (a list of) extra columns, each as a buffer.
+    """
+    pdes, name = header.index('pdes'), header.index('name')
+    diameter, pha = header.index('diameter'), header.index('pha')
+    extras = [header.index(column) for column in extra_columns]
+
+    text = _read(neo_csv_path, start, stop).decode('utf-8')
+    rows = [row for row in csv.reader(io.StringIO(text, newline='')) if row]
+    return (
+        len(rows),
+        encode_strings(row[pdes] for row in rows),
+        encode_strings(row[name] for row in rows),
+        array.array('d', (float(row[diameter] or 'nan') for row in rows)).tobytes(),
+        array.array('b', (row[pha] == 'Y' for row in rows)).tobytes(),
+        [encode_strings(row[index] for row in rows) for index in extras],
+    )
+
+
+def _parse_cad_chunk(cad_json_path, start, stop, fields):
+    """Parse a chunk of rows of the `data` array of a close approach file into columns.
+
+    :return: A tuple of the chunk's row count, designations, times (in minutes),
+             distances and velocities, each as a buffer.
+    """
+    des, dist, v_rel = fields.index('des'), fields.index('dist'), fields.index('v_rel')
+    if 'jd' in fields:
+        time, to_minutes = fields.index('jd'), jd_to_minutes
+    else:
+        time, to_minutes = fields.index('cd'), lambda cd: datetime_to_minutes(cd_to_datetime(cd))
+
+    text = _read(cad_json_path, start, stop).decode('utf-8')
+    decoder = json.JSONDecoder()
+    designations, minutes, distances, velocities = [], array.array('q'), array.array('d'), array.array('d')
+    position = _WHITESPACE.match(text).end()
+    while position < len(text) and text[position] != ']':
+        row, position = decoder.raw_decode(text, position)
+        designations.append(row[des])
+        minutes.append(to_minutes(row[time]))
+        distances.append(float(row[dist]))
+        velocities.append(float(row[v_rel]))
+        position = _WHITESPACE.match(text, position).end()
+        if text.startswith(',', position):
+            position = _WHITESPACE.match(text, position + 1).end()
+    return (len(designations), encode_strings(designations),
+            minutes.tobytes(), distances.tobytes(), velocities.tobytes())
+
+
+def _build_neos(chunks, extra_columns):
+    """Turn the columns of each chunk of a CSV file of NEOs into `NearEarthObject`s, in order."""
+    neos = []
+    for count, designations, names, diameters, hazardous, extras in chunks:
+        extras = [decode_strings(column, count) for column in extras]
+        for index, (designation, name, diameter, pha) in enumerate(zip(
+                decode_strings(designations, count), decode_strings(names, count),
+                array.array('d', diameters), array.array('b', hazardous))):
+            neos.append(NearEarthObject(
+                designation=designation,
+                name=name or None,
+                diameter=diameter,
+                hazardous=bool(pha),
+                extra={column: values[index] for column, values in zip(extra_columns, extras)}
+                if extras else None))
+    return neos
+
+
+def _build_approaches(chunks):
+    """Turn the columns of each chunk of a close approach file into `CloseApproach`es, in order."""
+    approaches = []
+    for count, designations, minutes, distances, velocities in chunks:
+        approaches.extend(
+            CloseApproach(designation=designation, minutes=minute, distance=distance, velocity=velocity)
+            for designation, minute, distance, velocity in zip(
+                decode_strings(designations, count), array.array('q', minutes),
+                array.array('d', distances), array.array('d', velocities)))
+    return approaches
+
+
+def load(neo_csv_path, cad_json_path, jobs, extra_columns=()):
+    """Load both data files at once, parsing chunks of each in worker processes.
+
+    A compressed file can't be split into byte ranges, so it is parsed as a
+    whole in this process while the workers parse the chunks of the other.
+
+    :param neo_csv_path: A path to a CSV file containing data about near-Earth objects.
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :param jobs: The number of worker processes to parse with.
+    :param extra_columns: Names of additional NEO columns to keep on each NEO's `extra` mapping.
+    :return: A tuple of a list of `NearEarthObject`s and a list of `CloseApproach`es,
+             equal to the output of `load_neos` and `load_approaches`.
+    """
+    neo = _neo_chunks(neo_csv_path, jobs)
+    header, neo_ranges = neo or (None, [])
+    cad = _cad_chunks(cad_json_path, jobs)
+    fields, cad_ranges = cad or (None, [])
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Submit the chunks of the larger close approach file first, so that
+        # the pool never sits waiting on a long tail of its chunks.
+        cad_futures = [pool.submit(_parse_cad_chunk, cad_json_path, start, stop, fields)
+                       for start, stop in cad_ranges]
+        neo_futures = [pool.submit(_parse_neo_chunk, neo_csv_path, start, stop, header, tuple(extra_columns))
+                       for start, stop in neo_ranges]
+        if neo is None:
+            neos = load_neos(neo_csv_path, extra_columns)
+        else:
+            neos = _build_neos((future.result() for future in neo_futures), extra_columns)
+        if cad is None:
+            # The file is compressed, or its `data` array isn't where NASA puts it.
+            approaches = load_approaches(cad_json_path)
+        else:
+            approaches = _build_approaches(future.result() for future in cad_futures)
+    return neos, approaches
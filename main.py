@@ -5,7 +5,7 @@ See `README.md` for a detailed discussion of this project.
 
 This script can be invoked from the command line::
 
-    $ python3 main.py {inspect,query,interactive} [args]
+    $ python3 main.py {inspect,query,interactive,serve,serve-http} [args]
 
 The `inspect` subcommand looks up an NEO by name or by primary designation, and
 optionally lists all of that NEO's known close approaches:
@@ -29,12 +29,48 @@ or JSON format:
     $ python3 main.py query --limit 5 --outfile results.csv
     $ python3 main.py query --limit 15 --outfile results.json
 
+The matches can be ordered by `distance`, `velocity`, `time` or `diameter`
+with `--sort-by`, smallest first or, with `--desc`, largest first:
+
+    $ python3 main.py query --start-date 2020-01-01 --end-date 2020-12-31 --sort-by distance --limit 20
+    $ python3 main.py query --hazardous --sort-by velocity --desc --limit 10
+
+A query's scan can be spread across worker processes with `--scan-jobs`:
+
+    $ python3 main.py query --min-velocity 40 --scan-jobs 4 --outfile fast.csv
+
+The `serve` subcommand loads the NEO database once and keeps it resident, to
+answer `inspect` and `query` commands sent to it over a Unix domain socket by
+later runs given `--via-daemon`, which then skip loading the data files:
+
+    $ python3 main.py serve &
+    $ python3 main.py --via-daemon query --date 2020-03-14
+
+Similarly, the `serve-http` subcommand answers NEO lookups and queries over a
+local HTTP endpoint, for dashboards (see `service.py`):
+
+    $ python3 main.py serve-http --port 8020 &
+    $ curl 'http://127.0.0.1:8020/query?date=2020-03-14&limit=5'
+
 The `interactive` subcommand loads the NEO database and spawns an interactive
 command shell that can repeatedly execute `inspect` and `query` commands without
 having to wait to reload the database each time. However, it doesn't hot-reload.
 
 If needed, the script can load data from data files other than the default with
 `--neofile` or `--cadfile`.
+
+After the data files are first loaded, a binary snapshot of the database is
+cached, and later runs rebuild the database from it until either data file
+changes. Use `--no-cache` to bypass the snapshot entirely, or `--rebuild-cache`
+to force it to be rewritten from the data files. With `--jobs N`, the data files
+are parsed in chunks across `N` worker processes while the database loads; it
+doesn't affect queries, whose scans `query --scan-jobs` spreads out instead.
+
+The `--cadfile` may also be a directory, or a quoted glob pattern, of close
+approach files - one per year, say. Each shard is then only read from disk once
+a query's dates overlap the approaches it holds:
+
+    $ python3 main.py --cadfile 'data/cad-*.json' query --start-date 2031-01-01 --end-date 2031-12-31
 """
 import argparse
 import cmd
@@ -44,8 +80,15 @@ import shlex
 import sys
 import time
 
-from extract import load_neos, load_approaches
+from extract import load_neos, load_approaches, iter_approaches
 from database import NEODatabase
+import daemon
+import ingest
+import ordering
+import rowsets
+import service
+import shards
+import snapshot
 from filters import create_filters, limit
 from write import write_to_csv, write_to_json
 
@@ -75,6 +118,21 @@ def date_fromisoformat(date_string):
             f"'{date_string}' is not a valid date. Use YYYY-MM-DD.")
 
 
+def non_negative_int(string):
+    """Return the non-negative integer that a string spells out.
+
+    :param string: A count, such as a limit or an offset, in decimal.
+    :return: The count, as an `int`.
+    """
+    try:
+        value = int(string)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{string}' is not an integer.")
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"'{string}' must not be negative.")
+    return value
+
+
 def make_parser():
     """Create an ArgumentParser for this script.
 
@@ -92,7 +150,31 @@ def make_parser():
     parser.add_argument('--cadfile',
                         default=(DATA_ROOT / 'cad.json'),
                         type=pathlib.Path,
-                        help="Path to JSON file of close approach data.")
+                        help="Path to JSON file of close approach data, or to a directory "
+                        "(or a quoted glob pattern) of JSON files that each hold a shard of it.")
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--no-cache',
+                       action='store_true',
+                       help="Neither read nor write a cached snapshot of the database.")
+    cache.add_argument('--rebuild-cache',
+                       action='store_true',
+                       help="Reload the data files and rewrite the cached snapshot of the database.")
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help="Parse the data files in chunks across this many worker processes while loading "
+                             "the database (see `query --scan-jobs` to parallelize a query's scan).")
+    parser.add_argument('--columnar',
+                        action='store_true',
+                        help="Answer queries from a vectorized, column-oriented store (requires NumPy).")
+    parser.add_argument('--via-daemon',
+                        action='store_true',
+                        help="Send `inspect` and `query` commands to a running `serve` daemon, "
+                        "instead of loading the data files.")
+    parser.add_argument('--socket',
+                        default=daemon.DEFAULT_SOCKET,
+                        type=pathlib.Path,
+                        help="The Unix domain socket on which the daemon listens.")
     subparsers = parser.add_subparsers(dest='cmd')
 
     # Add the `inspect` subcommand parser.
@@ -195,9 +277,26 @@ def make_parser():
         "are not potentially hazardous.")
     query.add_argument('-l',
                        '--limit',
-                       type=int,
+                       type=non_negative_int,
                        help="The maximum number of matches to return. "
                        "Defaults to 10 if no --outfile is given.")
+    query.add_argument('--offset',
+                       type=non_negative_int,
+                       default=0,
+                       help="The number of matches to skip before returning any, "
+                       "to page through results.")
+    query.add_argument('--sort-by',
+                       choices=sorted(ordering.SORT_ATTRIBUTES),
+                       help="Order the matches by this attribute, rather than as they appear in the data file.")
+    query.add_argument('--desc',
+                       action='store_true',
+                       help="With --sort-by, order the matches from the largest value to the smallest.")
+    query.add_argument('--scan-jobs',
+                       metavar='JOBS',
+                       type=int,
+                       default=1,
+                       help="Scan the close approaches for matches in partitions across this many worker processes "
+                            "(see the top-level `--jobs` to parallelize loading the data files).")
     query.add_argument('-o',
                        '--outfile',
                        type=pathlib.Path,
@@ -214,10 +313,30 @@ def make_parser():
         action='store_true',
         help=
         "If specified, kill the session whenever a project file is modified.")
+
+    subparsers.add_parser(
+        'serve',
+        description="Load the NEO database once, and answer `inspect` and "
+        "`query` commands sent with `--via-daemon` until interrupted.")
+
+    http = subparsers.add_parser(
+        'serve-http',
+        description="Load the NEO database once, and answer NEO lookups and "
+        "queries over HTTP, streaming matches as newline-delimited JSON.")
+    http.add_argument('--host',
+                      default=service.DEFAULT_HOST,
+                      help="The address to listen on.")
+    http.add_argument('--port',
+                      type=int,
+                      default=service.DEFAULT_PORT,
+                      help="The port to listen on.")
+    http.add_argument('--workers',
+                      type=int,
+                      help="The most worker threads to scan and encode results on.")
     return parser, inspect, query
 
 
-def inspect(database, pdes=None, name=None, verbose=False):
+def inspect(database, pdes=None, name=None, verbose=False, stdout=None, stderr=None):
     """Perform the `inspect` subcommand.
 
     This function fetches an NEO by designation or by name. If a matching NEO is
@@ -232,8 +351,13 @@ def inspect(database, pdes=None, name=None, verbose=False):
     :param pdes: The primary designation of an NEO for which to search.
     :param name: The name of an NEO for which to search.
     :param verbose: Whether to additionally print all of a matching NEO's close approaches.
+    :param stdout: The stream to print the NEO to; by default, standard output.
+    :param stderr: The stream to print errors to; by default, standard error.
     :return: The matching `NearEarthObject`, or None if not found.
     """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
     # Fetch the NEO of interest.
     if pdes:
         neo = database.get_neo_by_designation(pdes)
@@ -242,18 +366,36 @@ def inspect(database, pdes=None, name=None, verbose=False):
 
     # Ensure that we have received an NEO.
     if not neo:
-        print("No matching NEOs exist in the database.", file=sys.stderr)
+        print("No matching NEOs exist in the database.", file=stderr)
         return None
 
     # Display information about this NEO, and optionally its close approaches if verbose.
-    print(neo)
+    print(neo, file=stdout)
     if verbose:
         for approach in neo.approaches:
-            print(f"- {approach}")
+            print(f"- {approach}", file=stdout)
     return neo
 
 
-def query(database, args):
+def filters_from_args(args):
+    """Create the collection of filters described by the arguments of the `query` subcommand.
+
+    :param args: The arguments of the `query` subcommand.
+    :return: A collection of filters, as produced by `create_filters`.
+    """
+    return create_filters(date=args.date,
+                          start_date=args.start_date,
+                          end_date=args.end_date,
+                          distance_min=args.distance_min,
+                          distance_max=args.distance_max,
+                          velocity_min=args.velocity_min,
+                          velocity_max=args.velocity_max,
+                          diameter_min=args.diameter_min,
+                          diameter_max=args.diameter_max,
+                          hazardous=args.hazardous)
+
+
+def query(database, args, rows=None, stdout=None, stderr=None):
     """Perform the `query` subcommand.
 
     Create a collection of filters with `create_filters` and supply them to the
@@ -266,35 +408,77 @@ def query(database, args):
 
     :param database: The `NEODatabase` containing data on NEOs and their close approaches.
     :param args: All arguments from the command line, as parsed by the top-level parser.
+    :param rows: The positions of already-found matches to show instead, such as those from `NEODatabase.refine`.
+    :param stdout: The stream to print the results to; by default, standard output.
+    :param stderr: The stream to print errors to; by default, standard error.
     """
-    # Construct a collection of filters from arguments supplied at the command line.
-    filters = create_filters(date=args.date,
-                             start_date=args.start_date,
-                             end_date=args.end_date,
-                             distance_min=args.distance_min,
-                             distance_max=args.distance_max,
-                             velocity_min=args.velocity_min,
-                             velocity_max=args.velocity_max,
-                             diameter_min=args.diameter_min,
-                             diameter_max=args.diameter_max,
-                             hazardous=args.hazardous)
-    # Query the database with the collection of filters.
-    results = database.query(filters)
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    # Limit stdout to 10 entries if not specified.
+    n = args.limit if args.outfile else args.limit or 10
+
+    if rows is None:
+        # Query the database with the collection of filters, telling it how many
+        # results are wanted so that it can stop scanning once it has found them.
+        matches = database.query(filters_from_args(args), limit=args.offset + n if n else None, jobs=args.scan_jobs,
+                                 sort_by=args.sort_by, descending=args.desc)
+    else:
+        if args.sort_by:
+            rows = database.order(rows, args.sort_by, args.desc, limit=args.offset + n if n else None)
+        matches = database.approaches_at(rows)
+    results = limit(matches, n, args.offset)
 
     if not args.outfile:
-        # Write the results to stdout, limiting to 10 entries if not specified.
-        for result in limit(results, args.limit or 10):
-            print(result)
+        # Write the results to stdout.
+        for result in results:
+            print(result, file=stdout)
     else:
         # Write the results to a file.
         if args.outfile.suffix == '.csv':
-            write_to_csv(limit(results, args.limit), args.outfile)
+            write_to_csv(results, args.outfile)
         elif args.outfile.suffix == '.json':
-            write_to_json(limit(results, args.limit), args.outfile)
+            write_to_json(results, args.outfile)
         else:
             print(
                 "Please use an output file that ends with `.csv` or `.json`.",
-                file=sys.stderr)
+                file=stderr)
+
+
+def load_database(neofile, cadfile, use_cache=True, rebuild_cache=False, jobs=1, **options):
+    """Build the `NEODatabase`, preferring an up-to-date cached snapshot.
+
+    :param neofile: A path to a CSV file containing data about near-Earth objects.
+    :param cadfile: A path to a JSON file containing data about close approaches.
+    :param use_cache: Whether to read and write a snapshot of the database.
+    :param rebuild_cache: Whether to ignore any existing snapshot and write a new one.
+    :param jobs: The number of worker processes to parse the data files with.
+    :param options: Additional keyword arguments for the `NEODatabase` constructor.
+    :return: The linked `NEODatabase`.
+    """
+    if shards.is_sharded(cadfile):
+        # Shards are read lazily, as queries need them, so there's nothing to cache.
+        return NEODatabase(load_neos(neofile), (), shards=shards.open_shards(cadfile), **options)
+
+    if use_cache and not rebuild_cache:
+        database = snapshot.load(neofile, cadfile, **options)
+        if database is not None:
+            return database
+
+    if jobs > 1:
+        # Parse chunks of both data files at once, across a pool of processes.
+        database = NEODatabase(*ingest.load(neofile, cadfile, jobs), **options)
+    else:
+        # Extract data from the data files into structured Python objects,
+        # streaming the close approaches straight into the database.
+        database = NEODatabase(load_neos(neofile), iter_approaches(cadfile), **options)
+
+    if use_cache:
+        try:
+            snapshot.save(database, neofile, cadfile)
+        except OSError as err:
+            print(f"Unable to cache the database: {err}", file=sys.stderr)
+    return database
 
 
 class NEOShell(cmd.Cmd):
@@ -333,9 +517,21 @@ class NEOShell(cmd.Cmd):
         super().__init__(**kwargs)
         self.db = database
         self.inspect = inspect_parser
-        self.query = query_parser
+        self.query = argparse.ArgumentParser(prog=query_parser.prog,
+                                             description=query_parser.description,
+                                             parents=[query_parser],
+                                             add_help=False)
+        self.query.add_argument('--refine',
+                                action='store_true',
+                                help="Only look among the matches of the previous query in this session.")
         self.aggressive = aggressive
 
+        # The last query's matches: the database generation they were found
+        # in, its filters, and their positions, which are only found on demand.
+        self.last = None
+        # The saved sets of matches, from each name to a generation and positions.
+        self.results = {}
+
     @classmethod
     def parse_arg_with(cls, arg, parser):
         """Parse the additional text passed to a command, using a given parser.
@@ -411,13 +607,158 @@ class NEOShell(cmd.Cmd):
 
             (neo) query --limit 5 --outfile results.csv
             (neo) query --limit 5 --outfile results.json
+
+        Narrow down the previous query's matches, examining only those, with
+        `--refine` and further filters:
+
+            (neo) query --start-date 2020-01-01 --end-date 2020-12-31
+            (neo) query --refine --max-distance 0.1
+            (neo) query --refine --hazardous
         """
         args = self.parse_arg_with(arg, self.query)
         if not args:
             return
 
-        # Run the `inspect` subcommand.
-        query(self.db, args)
+        if not args.refine:
+            # Run the `query` subcommand, remembering its filters in case it is refined.
+            query(self.db, args)
+            self.last = (self.db.generation, filters_from_args(args), None)
+            return
+
+        rows = self.last_rows()
+        if rows is not None:
+            rows = self.db.refine(rows, filters_from_args(args))
+            self.last = (self.db.generation, None, rows)
+            query(self.db, args, rows)
+
+    def last_rows(self):
+        """Return the positions of every match of the last query, finding them if need be.
+
+        :return: An `array` of positions, or None (after explaining why) if there is no usable last result.
+        """
+        if self.last is None:
+            print("There are no earlier matches; run a query first.", file=sys.stderr)
+            return None
+        generation, filters, rows = self.last
+        if generation != self.db.generation:
+            print("The database has changed since the last query; run it again.", file=sys.stderr)
+            return None
+        if rows is None:
+            rows = self.db.match(filters)
+            self.last = (self.db.generation, filters, rows)
+        return rows
+
+    def named_rows(self, name):
+        """Return the positions of a saved set of matches, or of the last query's as `last`."""
+        if name == 'last':
+            return self.last_rows()
+        if name not in self.results:
+            print(f"There is no saved result named {name!r}.", file=sys.stderr)
+            return None
+        generation, rows = self.results[name]
+        if generation != self.db.generation:
+            print(f"The database has changed since {name!r} was saved.", file=sys.stderr)
+            return None
+        return rows
+
+    def do_results(self, arg):
+        """Save, combine and reuse the sets of matches of earlier queries.
+
+        List the saved sets of matches, or save the last query's as a name:
+
+            (neo) results
+            (neo) results save close
+
+        Make a saved set, or the union or intersection of several, the last
+        result, to be shown or narrowed down with `query --refine`:
+
+            (neo) results load close
+            (neo) results union close fast
+            (neo) results intersect close fast last
+            (neo) query --refine --hazardous --limit 5
+
+        Forget a saved set:
+
+            (neo) results drop close
+        """
+        try:
+            words = shlex.split(arg)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return
+
+        if not words:
+            for name, (_, rows) in sorted(self.results.items()):
+                print(f"{name}: {len(rows)} matches")
+            return
+        action, names = words[0], words[1:]
+        if action == 'save' and len(names) == 1:
+            rows = self.last_rows()
+            if rows is not None:
+                self.results[names[0]] = (self.db.generation, rows)
+                print(f"Saved {len(rows)} matches as {names[0]!r}.")
+        elif action == 'drop' and len(names) == 1:
+            if self.results.pop(names[0], None) is None:
+                print(f"There is no saved result named {names[0]!r}.", file=sys.stderr)
+        elif action in ('load', 'union', 'intersect') and names and (action != 'load' or len(names) == 1):
+            sets = [self.named_rows(name) for name in names]
+            if any(rows is None for rows in sets):
+                return
+            if action == 'union':
+                rows = rowsets.union(*sets)
+            elif action == 'intersect':
+                rows = rowsets.intersection(*sets)
+            else:
+                rows = sets[0]
+            self.last = (self.db.generation, None, rows)
+            print(f"{len(rows)} matches.")
+        else:
+            print("Usage: results [save NAME | drop NAME | load NAME | union NAME... | intersect NAME...]",
+                  file=sys.stderr)
+
+    def do_load(self, arg):
+        """Add the close approaches from a JSON file to the session's database.
+
+        Load a file of newly published close approaches, such as a delta from
+        JPL, without restarting the session:
+
+            (neo) load data/cad-delta.json
+        """
+        try:
+            paths = shlex.split(arg)
+        except ValueError as err:
+            print(err, file=sys.stderr)
+            return
+        if len(paths) != 1:
+            print("Usage: load PATH", file=sys.stderr)
+            return
+
+        approaches = load_approaches(paths[0])
+        if approaches is None:
+            return
+        count = self.db.add_approaches(approaches)
+        print(f"Added {count} close approaches from {paths[0]}.")
+
+    def do_cache(self, arg):
+        """Show how well the cache of recent query results is doing, or empty it.
+
+        Repeating a query, even with a different `--limit` or `--outfile`,
+        reads its matches back from the cache instead of scanning again:
+
+            (neo) cache
+            (neo) cache clear
+        """
+        cache = self.db.cache
+        if arg.strip() == 'clear':
+            print(f"Evicted {cache.clear()} cached results.")
+        elif arg.strip():
+            print("Usage: cache [clear]", file=sys.stderr)
+        else:
+            requests = cache.hits + cache.misses
+            print(f"{len(cache)} of at most {cache.max_entries} results cached, "
+                  f"in {cache.size / 1024:,.0f} of at most {cache.max_bytes / 1024:,.0f} KiB.")
+            print(f"{cache.hits} hits and {cache.misses} misses "
+                  f"({cache.hits / requests if requests else 0:.0%} hit rate), {cache.evictions} evictions.")
 
     def do_EOF(self, _arg):
         """Exit the interactive session."""
@@ -448,25 +789,59 @@ class NEOShell(cmd.Cmd):
         return line
 
 
+def run(database, args, stdout=None, stderr=None):
+    """Perform the `inspect` or `query` subcommand, as chosen by the command line.
+
+    :param database: The `NEODatabase` containing data on NEOs and their close approaches.
+    :param args: All arguments from the command line, as parsed by the top-level parser.
+    :param stdout: The stream to print the command's output to; by default, standard output.
+    :param stderr: The stream to print its errors to; by default, standard error.
+    """
+    if args.cmd == 'inspect':
+        inspect(database, pdes=args.pdes, name=args.name, verbose=args.verbose, stdout=stdout, stderr=stderr)
+    elif args.cmd == 'query':
+        query(database, args, stdout=stdout, stderr=stderr)
+
+
 def main():
     """Run the main script."""
     parser, inspect_parser, query_parser = make_parser()
     args = parser.parse_args()
 
-    # Extract data from the data files into structured Python objects.
-    database = NEODatabase(load_neos(args.neofile),
-                           load_approaches(args.cadfile))
+    if args.via_daemon and args.cmd in ('inspect', 'query'):
+        if daemon.is_listening(args.socket):
+            daemon.request(args, args.socket)
+            return
+        print(f"No daemon is listening on {args.socket}; loading the database instead.", file=sys.stderr)
+
+    database = load_database(args.neofile, args.cadfile,
+                             use_cache=not args.no_cache,
+                             rebuild_cache=args.rebuild_cache,
+                             jobs=args.jobs,
+                             columnar=args.columnar)
 
     # Run the chosen subcommand.
-    if args.cmd == 'inspect':
-        inspect(database, pdes=args.pdes, name=args.name, verbose=args.verbose)
-    elif args.cmd == 'query':
-        query(database, args)
-    elif args.cmd == 'interactive':
-        NEOShell(database,
-                 inspect_parser,
-                 query_parser,
-                 aggressive=args.aggressive).cmdloop()
+    try:
+        if args.cmd in ('inspect', 'query'):
+            run(database, args)
+        elif args.cmd == 'serve':
+            try:
+                daemon.serve(database, run, args.neofile, args.cadfile, args.socket)
+            except KeyboardInterrupt:
+                pass
+        elif args.cmd == 'serve-http':
+            try:
+                service.serve(database, args.host, args.port, args.workers)
+            except KeyboardInterrupt:
+                pass
+        elif args.cmd == 'interactive':
+            NEOShell(database,
+                     inspect_parser,
+                     query_parser,
+                     aggressive=args.aggressive).cmdloop()
+    finally:
+        # Stop any worker processes that parallel scans started.
+        database.close()
 
 
 if __name__ == '__main__':
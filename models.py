@@ -1,21 +1,108 @@
 """Classes to instantiate Near Earth Objects and Close Approaches."""
 
-from helpers import cd_to_datetime, datetime_to_str
+import collections.abc
+import datetime
+import sys
+import types
+
+from helpers import cd_to_datetime, datetime_to_str, datetime_to_minutes, jd_to_minutes, minutes_to_datetime
+
+# Shared by every NEO loaded without extra columns.
+_NO_EXTRA = types.MappingProxyType({})
+
+
+def _intern(designation):
+    """Intern a designation, so the NEO and each of its approaches share one string."""
+    return sys.intern(designation) if type(designation) is str else designation
+
+
+class ApproachSlice(collections.abc.Sequence):
+    """A read-only view of a contiguous run of a list of close approaches.
+
+    The database keeps every NEO's approaches together in one shared list, so an
+    NEO's approaches are just a range of it - no per-NEO list is needed.
+    """
+
+    __slots__ = ('_items', '_start', '_stop')
+
+    def __init__(self, items, start, stop):
+        """Create a new `ApproachSlice` of `items[start:stop]`.
+
+        :param items: The shared list of close approaches.
+        :param start: The position of the first approach in the view.
+        :param stop: The position just past the last approach in the view.
+        """
+        self._items = items
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        """Return the number of approaches in the view."""
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        """Return the approach (or a list of the approaches) at `index` in the view."""
+        if isinstance(index, slice):
+            return self._items[self._start:self._stop][index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('approach index out of range')
+        return self._items[self._start + index]
+
+    def __iter__(self):
+        """Iterate over the approaches in the view, without copying them."""
+        return map(self._items.__getitem__, range(self._start, self._stop))
+
+    def __repr__(self):
+        """return: a computer-readable string representation of this object."""
+        return f"ApproachSlice({list(self)!r})"
 
 
 class NearEarthObject:
-    """A Near-Earth object (NEO)."""
+    """A Near-Earth object (NEO).
+
+    NEOs are slotted, as there are hundreds of thousands of them. Most have no
+    close approaches at all, so they hold no approaches container; the rest
+    usually hold an `ApproachSlice` of the database's shared approach list.
+    """
+
+    __slots__ = ('designation', 'diameter', 'name', 'hazardous', 'extra', '_approaches')
 
     def __init__(self, **info):
         """Create a new `NearEarthObject`.
 
         :param info: A dictionary of excess keyword arguments supplied to the constructor.
         """
-        self.designation = info.get('designation')
+        self.designation = _intern(info.get('designation'))
         self.diameter = info.get('diameter')
         self.name = info.get('name')
         self.hazardous = info.get('hazardous')
-        self.approaches = []
+        self.extra = info.get('extra') or _NO_EXTRA
+        self._approaches = None
+
+    @property
+    def approaches(self):
+        """return: this NEO's close approaches (an empty tuple if it has none)."""
+        return self._approaches if self._approaches is not None else ()
+
+    @approaches.setter
+    def approaches(self, approaches):
+        """Replace this NEO's close approaches with a sequence (such as an `ApproachSlice`)."""
+        self._approaches = approaches if len(approaches) else None
+
+    def add_approach(self, approach):
+        """Record a close approach made by this NEO, keeping its approaches in time order.
+
+        :param approach: A `CloseApproach` of this NEO.
+        """
+        if not isinstance(self._approaches, list):
+            self._approaches = list(self.approaches)
+        # New approaches are usually the latest, so search from the end.
+        index = len(self._approaches)
+        while index and self._approaches[index - 1].minutes > approach.minutes:
+            index -= 1
+        self._approaches.insert(index, approach)
 
     def serialize(self):
         """Serialize the NEO's data to a neat way.
@@ -55,13 +142,26 @@ class NearEarthObject:
 class CloseApproach:
     """A close approach to Earth by an NEO."""
 
+    __slots__ = ('_designation', 'minutes', 'distance', 'velocity', 'neo')
+
     def __init__(self, **info):
         """Create a new `CloseApproach`.
 
+        The approach time is stored compactly, as `minutes` since the Unix epoch.
+        It may be given directly as `minutes`, as a Julian Date `jd` (which
+        needs no string parsing), or as a `time` that is either a NASA-formatted
+        calendar date or an already-parsed `datetime`.
+
         :param info: A dictionary of excess keyword arguments supplied to the constructor.
         """
-        self._designation = info.get('designation')
-        self.time = cd_to_datetime(info.get('time'))
+        self._designation = _intern(info.get('designation'))
+        if info.get('minutes') is not None:
+            self.minutes = info['minutes']
+        elif info.get('jd') is not None:
+            self.minutes = jd_to_minutes(info['jd'])
+        else:
+            time = info.get('time')
+            self.minutes = datetime_to_minutes(time if isinstance(time, datetime.datetime) else cd_to_datetime(time))
         self.distance = info.get('distance')
         self.velocity = info.get('velocity')
         self.neo = None
@@ -78,6 +178,11 @@ class CloseApproach:
             'velocity_km_s': self.velocity
         }
 
+    @property
+    def time(self):
+        """return: this `CloseApproach`'s approach time, as a naive `datetime`."""
+        return minutes_to_datetime(self.minutes)
+
     @property
     def time_str(self):
         """return: a formatted representation of this `CloseApproach`'s approach time."""
@@ -0,0 +1,116 @@
+"""Order the matches of a query by one of their attributes.
+
+A query's matches normally come out in the order of the data file. To order
+them instead by distance, velocity, time or NEO diameter:
+
+- When only the first `k` are wanted, `top_k` keeps a bounded heap of the best
+  `k` seen so far while the matches stream past, instead of sorting them all.
+- When every match is wanted, `sort` sorts them, but only `RUN_SIZE` at a time
+  in memory: each sorted run beyond the first is spilled to a temporary file as
+  packed keys and positions, and the runs are merged back together lazily.
+
+Both work on the positions of the matches in the database, with a `sort_key`
+reading the attribute of the approach at each position. Equal keys keep the
+order of the data file, in either direction, and approaches whose NEO has no
+known diameter come last when sorting by diameter.
+"""
+import heapq
+import math
+import tempfile
+from array import array
+
+# How many matches are sorted in memory at once before a run is spilled to disk.
+RUN_SIZE = 1 << 18
+
+# How many entries of each run are read back from disk at a time while merging.
+_READ_SIZE = 1 << 12
+
+# How to read each attribute that matches can be ordered by.
+SORT_ATTRIBUTES = {
+    'distance': lambda approach: approach.distance,
+    'velocity': lambda approach: approach.velocity,
+    'time': lambda approach: approach.minutes,
+    'diameter': lambda approach: approach.neo.diameter if approach.neo else math.nan,
+}
+
+
+def sort_key(approaches, attribute, descending=False):
+    """Make a function from an approach's position to the number to order it by.
+
+    :param approaches: The sequence of approaches that positions index.
+    :param attribute: The attribute to order by, one of `SORT_ATTRIBUTES`.
+    :param descending: Whether larger values should come first.
+    :return: A function from a position to a float, smaller for approaches that come first.
+    """
+    read = SORT_ATTRIBUTES[attribute]
+    sign = -1 if descending else 1
+
+    def key(position):
+        value = read(approaches[position])
+        # Unknown values come last in either direction.
+        return math.inf if value is None or value != value else sign * value
+    return key
+
+
+def top_k(rows, key, k):
+    """Find the first `k` positions in order, holding only `k` at a time.
+
+    :param rows: A stream of positions, in ascending order.
+    :param key: A function from a position to the number to order it by.
+    :param k: How many positions are wanted.
+    :return: A list of (at most) `k` positions, in order.
+    """
+    return heapq.nsmallest(k, rows, key=key)
+
+
+def _spill(run, directory=None):
+    """Write a sorted run of `(key, position)` pairs to a temporary file, in blocks.
+
+    :return: The file, and the number of pairs in it.
+    """
+    f = tempfile.TemporaryFile(dir=directory)
+    for start in range(0, len(run), _READ_SIZE):
+        block = run[start:start + _READ_SIZE]
+        array('d', (key for key, _ in block)).tofile(f)
+        array('q', (position for _, position in block)).tofile(f)
+    f.seek(0)
+    return f, len(run)
+
+
+def _read_run(f, count):
+    """Generate the `(key, position)` pairs of a run written by `_spill`, a block at a time."""
+    while count:
+        size = min(count, _READ_SIZE)
+        keys, positions = array('d'), array('q')
+        keys.fromfile(f, size)
+        positions.fromfile(f, size)
+        yield from zip(keys, positions)
+        count -= size
+
+
+def sort(rows, key, run_size=RUN_SIZE, directory=None):
+    """Generate positions in order, spilling sorted runs to disk when there are many.
+
+    :param rows: A stream of positions, in ascending order.
+    :param key: A function from a position to the number to order it by.
+    :param run_size: The most positions to sort in memory at once.
+    :param directory: Where to write the spilled runs; by default, the system's temporary directory.
+    :yield: The positions, in order.
+    """
+    runs = []
+    run = []
+    try:
+        for position in rows:
+            # Ties are broken by position, which keeps the order of the data file.
+            run.append((key(position), position))
+            if len(run) >= run_size:
+                run.sort()
+                runs.append(_spill(run, directory))
+                run = []
+        run.sort()
+        merged = heapq.merge(*(_read_run(f, count) for f, count in runs), run) if runs else run
+        for _, position in merged:
+            yield position
+    finally:
+        for f, _ in runs:
+            f.close()
@@ -0,0 +1,146 @@
+"""Scan the close approaches for a query across a pool of worker processes.
+
+A query that no index can narrow down evaluates its filters on every approach,
+on a single core. `scan` instead splits the approaches to be scanned into
+contiguous partitions, and has a `ProcessPoolExecutor` evaluate the filters
+over each partition in parallel. The database keeps one pool for all of its
+scans, so only the first parallel query pays to start the worker processes.
+
+Workers aren't sent `CloseApproach`es, which would be slow to pickle. Each is
+sent just the columns its filters read, packed into native `array`s - the same
+columns, with the same meanings, as those of `ApproachColumns` - and sends back
+the positions of the matching rows. Partitions are handed out in order, one
+per worker at a time, and their matches are merged back in order, so the
+results come out in the same order as a serial scan, and a scan for a limited
+number of matches stops handing out partitions once it has them.
+"""
+import array
+import collections
+import itertools
+import math
+
+from columnar import column_for
+from filters import RangeFilter
+from helpers import MINUTES_PER_DAY
+
+# The fewest rows worth handing to a worker as one partition.
+MIN_PARTITION_SIZE = 1 << 14
+
+# How many partitions to split a scan into for each worker, so that the
+# workers stay evenly loaded and a limited scan can stop early.
+PARTITIONS_PER_JOB = 4
+
+# The type code of each packed column, and how to read it from an approach.
+_COLUMNS = {
+    'day': ('q', lambda approach: approach.minutes // MINUTES_PER_DAY),
+    'distance': ('d', lambda approach: approach.distance),
+    'velocity': ('d', lambda approach: approach.velocity),
+    'diameter': ('d', lambda approach: approach.neo.diameter if approach.neo else math.nan),
+    'hazardous': ('b', lambda approach: bool(approach.neo and approach.neo.hazardous)),
+}
+
+
+def columns_for(predicates):
+    """Return the names of the columns read by a collection of predicates.
+
+    :param predicates: A collection of filters.
+    :return: A set of column names, or None if some predicate can't be evaluated over columns.
+    """
+    names = set()
+    for predicate in predicates:
+        name = column_for(predicate)
+        if name is None:
+            return None
+        names.add(name)
+    return names
+
+
+def pack_column(approaches, name):
+    """Pack one attribute of every approach into a native array.
+
+    :param approaches: A sequence of `CloseApproach`es.
+    :param name: The name of the column, as given by `columnar.column_for`.
+    :return: An `array` with one entry per approach.
+    """
+    typecode, read = _COLUMNS[name]
+    return array.array(typecode, map(read, approaches))
+
+
+def _scan_partition(predicates, columns):
+    """Evaluate predicates over the packed columns of one partition.
+
+    The predicates are evaluated in turn, each over the rows that survived the
+    ones before it, as the planner ordered them.
+
+    :param predicates: A collection of filters.
+    :param columns: A dictionary from the name of each column the predicates read to its packed values.
+    :return: An `array` of the positions, within the partition, of the matching rows.
+    """
+    rows = None
+    for predicate in predicates:
+        values = columns[column_for(predicate)]
+        candidates = range(len(values)) if rows is None else rows
+        if isinstance(predicate, RangeFilter):
+            key = predicate.attribute.key
+            low = -math.inf if predicate.low is None else key(predicate.low)
+            high = math.inf if predicate.high is None else key(predicate.high)
+            rows = [row for row in candidates if low <= values[row] <= high]
+        else:
+            op, value = predicate.op, predicate.key(predicate.value)
+            rows = [row for row in candidates if op(values[row], value)]
+    return array.array('q', rows)
+
+
+def partition(rows, jobs):
+    """Split the rows to scan into contiguous partitions.
+
+    :param rows: The positions of the approaches to scan, in order.
+    :param jobs: The number of worker processes.
+    :return: A list of slices of `rows`.
+    """
+    size = max(MIN_PARTITION_SIZE, -(-len(rows) // (jobs * PARTITIONS_PER_JOB)))
+    return [rows[start:start + size] for start in range(0, len(rows), size)]
+
+
+def _submit(pool, predicates, columns, part):
+    """Hand one partition to the pool to scan.
+
+    :return: A tuple of the partition and the future of its matches' positions within it.
+    """
+    if isinstance(part, range):
+        packed = {name: values[part.start:part.stop] for name, values in columns.items()}
+    else:
+        packed = {name: array.array(values.typecode, map(values.__getitem__, part))
+                  for name, values in columns.items()}
+    return part, pool.submit(_scan_partition, predicates, packed)
+
+
+def scan(pool, column, rows, predicates, jobs, limit=None):
+    """Generate the positions of the approaches matching every predicate, in order.
+
+    :param pool: The `ProcessPoolExecutor` to scan on.
+    :param column: A function from a column name to that column, packed over every approach.
+    :param rows: The positions of the approaches to scan, in ascending order (a `range` or a list).
+    :param predicates: A collection of filters, each of which has a column.
+    :param jobs: The number of partitions to scan at once.
+    :param limit: The most matches wanted, or None for all of them.
+    :yield: The positions of the matching approaches.
+    """
+    names = columns_for(predicates)
+    columns = {name: column(name) for name in names}
+    parts = iter(partition(rows, jobs))
+    pending = collections.deque(_submit(pool, predicates, columns, part) for part in itertools.islice(parts, jobs))
+    found = 0
+    try:
+        while pending:
+            part, future = pending.popleft()
+            matches = future.result()
+            found += len(matches)
+            # Keep the workers busy with the next partition, unless the matches in hand are enough.
+            if not (limit and found >= limit):
+                pending.extend(_submit(pool, predicates, columns, part) for part in itertools.islice(parts, 1))
+            yield from map(part.__getitem__, matches)
+    finally:
+        # Once the caller has all the matches it wants, skip the partitions not yet started.
+        for _, future in pending:
+            future.cancel()
@@ -0,0 +1,221 @@
+"""Plan how `NEODatabase.query` evaluates a collection of filters.
+
+`create_filters` returns its filters in a fixed order, one per command-line
+option. Before a query runs, `plan_query` rewrites that collection:
+
+- The date filters are collapsed into a single time range, which becomes the
+  access path - a slice of the database's time index - when it is bounded.
+- Each pair of `>=` and `<=` filters on the same attribute (such as
+  `--min-distance` with `--max-distance`) is merged into one `RangeFilter`.
+- The remaining predicates are ordered so that those that are cheap to evaluate
+  and reject the most approaches run first, using selectivities estimated from
+  `Statistics` gathered when the database was loaded.
+"""
+import collections
+import datetime
+import operator
+from bisect import bisect_left, bisect_right, insort
+
+from filters import (AttributeFilter, DateFilter, DistanceFilter, VelocityFilter, DiameterFilter, HazardousFilter,
+                     RangeFilter, split_date_range)
+
+# The most values of each attribute sampled into its histogram.
+SAMPLE_SIZE = 1024
+
+# The relative cost of reading each attribute from an approach. Attributes of
+# the NEO cost an extra hop, and a date costs a method call and an allocation.
+ATTRIBUTE_COSTS = {
+    DistanceFilter: 1.0,
+    VelocityFilter: 1.0,
+    DiameterFilter: 1.5,
+    HazardousFilter: 1.5,
+    DateFilter: 3.0,
+}
+DEFAULT_COST = 4.0
+
+# The assumed selectivity of a predicate for which there are no statistics.
+DEFAULT_SELECTIVITY = 0.5
+
+QueryPlan = collections.namedtuple('QueryPlan', ['start', 'end', 'estimated_rows', 'predicates'])
+QueryPlan.__doc__ = """How to evaluate a query.
+
+Approaches with a time in `[start, end)` (where None is an open bound) are read
+from the time index, and each is checked against `predicates` in order.
+`estimated_rows` is how many approaches the plan is expected to produce.
+"""
+
+
+class Histogram:
+    """An equi-depth histogram over a sample of an attribute's values."""
+
+    def __init__(self, values):
+        """Build a histogram from an attribute's values.
+
+        :param values: A sequence of the attribute's values; NaNs are ignored.
+        """
+        self.step = max(1, len(values) // SAMPLE_SIZE)
+        self.sample = sorted(value for value in values[::self.step] if value == value)
+        self._seen = len(values)
+        self._sampled = len(values[::self.step])
+
+    @property
+    def defined(self):
+        """The fraction of sampled values that aren't NaN."""
+        # NaNs never satisfy a comparison, so they shrink every range's share.
+        return len(self.sample) / self._sampled if self._sampled else 0.0
+
+    def extend(self, values):
+        """Add further values to the histogram, sampled at the same rate as the first.
+
+        :param values: A sequence of the attribute's new values; NaNs are ignored.
+        """
+        sampled = values[-self._seen % self.step::self.step]
+        for value in sampled:
+            if value == value:
+                insort(self.sample, value)
+        self._seen += len(values)
+        self._sampled += len(sampled)
+
+    def selectivity(self, low=None, high=None):
+        """Estimate the fraction of values within the inclusive range `[low, high]`.
+
+        :param low: The least admitted value, or None for no lower bound.
+        :param high: The greatest admitted value, or None for no upper bound.
+        :return: The estimated fraction of all values, NaNs included, that lie in the range.
+        """
+        if not self.sample:
+            return 0.0
+        lo = 0 if low is None else bisect_left(self.sample, low)
+        hi = len(self.sample) if high is None else bisect_right(self.sample, high)
+        # Never estimate exactly zero from a sample: an unsampled value may match.
+        fraction = max(hi - lo, 0.5) / len(self.sample)
+        return min(fraction, 1.0) * self.defined
+
+
+class Statistics:
+    """Statistics about a database's approaches, for estimating selectivities."""
+
+    def __init__(self, approaches):
+        """Gather statistics over a sequence of linked `CloseApproach`es.
+
+        :param approaches: A sequence of `CloseApproach`es.
+        """
+        self.count = len(approaches)
+        linked = [approach for approach in approaches if approach.neo is not None]
+        self.histograms = {
+            DistanceFilter: Histogram([approach.distance for approach in approaches]),
+            VelocityFilter: Histogram([approach.velocity for approach in approaches]),
+            DiameterFilter: Histogram([approach.neo.diameter for approach in linked]),
+        }
+        self._hazardous = sum(1 for approach in linked if approach.neo.hazardous)
+
+    @property
+    def hazardous(self):
+        """The fraction of approaches made by a potentially hazardous NEO."""
+        return self._hazardous / self.count if self.count else 0.0
+
+    def extend(self, approaches):
+        """Update the statistics with newly added, linked approaches.
+
+        :param approaches: A sequence of `CloseApproach`es.
+        """
+        self.count += len(approaches)
+        linked = [approach for approach in approaches if approach.neo is not None]
+        self.histograms[DistanceFilter].extend([approach.distance for approach in approaches])
+        self.histograms[VelocityFilter].extend([approach.velocity for approach in approaches])
+        self.histograms[DiameterFilter].extend([approach.neo.diameter for approach in linked])
+        self._hazardous += sum(1 for approach in linked if approach.neo.hazardous)
+
+    def selectivity(self, predicate):
+        """Estimate the fraction of approaches that satisfy a predicate.
+
+        :param predicate: An `AttributeFilter` or a `RangeFilter`.
+        :return: The estimated fraction, between 0 and 1.
+        """
+        if isinstance(predicate, RangeFilter):
+            histogram = self.histograms.get(predicate.attribute)
+            if histogram is not None:
+                return histogram.selectivity(predicate.low, predicate.high)
+        elif type(predicate) is HazardousFilter and predicate.op is operator.eq:
+            return self.hazardous if predicate.value else 1.0 - self.hazardous
+        elif type(predicate) in self.histograms and predicate.op in (operator.ge, operator.le):
+            histogram = self.histograms[type(predicate)]
+            if predicate.op is operator.ge:
+                return histogram.selectivity(low=predicate.value)
+            return histogram.selectivity(high=predicate.value)
+        return DEFAULT_SELECTIVITY
+
+
+def _bounds(f):
+    """Return the inclusive `(low, high)` bounds of a `>=`, `<=` or range filter."""
+    if isinstance(f, RangeFilter):
+        return f.low, f.high
+    return (f.value, None) if f.op is operator.ge else (None, f.value)
+
+
+def merge_ranges(filters):
+    """Merge the `>=` and `<=` filters on each attribute into a single `RangeFilter`.
+
+    :param filters: A collection of filters.
+    :return: A list of equivalent filters, with at most one range per attribute.
+    """
+    bounds = collections.OrderedDict()
+    merged = []
+    for f in filters:
+        if isinstance(f, RangeFilter):
+            bounds.setdefault(f.attribute, []).append(f)
+        elif isinstance(f, AttributeFilter) and type(f) is not DateFilter and f.op in (operator.ge, operator.le):
+            bounds.setdefault(type(f), []).append(f)
+        else:
+            merged.append(f)
+
+    for attribute, group in bounds.items():
+        if len(group) == 1:
+            # A lone bound is just as cheap to evaluate as it is.
+            merged.append(group[0])
+            continue
+        lows = [low for low, _ in map(_bounds, group) if low is not None]
+        highs = [high for _, high in map(_bounds, group) if high is not None]
+        merged.append(RangeFilter(attribute, max(lows) if lows else None, min(highs) if highs else None))
+    return merged
+
+
+def _cost(predicate):
+    """Return the relative cost of evaluating a predicate on one approach."""
+    attribute = predicate.attribute if isinstance(predicate, RangeFilter) else type(predicate)
+    return ATTRIBUTE_COSTS.get(attribute, DEFAULT_COST)
+
+
+def plan_query(filters, statistics, count_between):
+    """Choose how to evaluate a collection of filters.
+
+    Predicates are ordered by `cost / (1 - selectivity)` - the expected cost of
+    evaluating a predicate per approach that it rejects - so that the work spent
+    on approaches that will be rejected anyway is as small as possible.
+
+    :param filters: A collection of filters, as produced by `create_filters`.
+    :param statistics: The database's `Statistics`.
+    :param count_between: A function from a `(start, end)` time range to the exact number of approaches in it.
+    :return: A `QueryPlan`.
+    """
+    start, end, residual = split_date_range(filters)
+    predicates = merge_ranges(residual)
+    if (start is not None and end is not None and start >= end) or any(
+            isinstance(predicate, RangeFilter) and predicate.low is not None and predicate.high is not None
+            and predicate.low > predicate.high for predicate in predicates):
+        # Contradictory bounds admit nothing, so read an empty slice of the index.
+        return QueryPlan(datetime.datetime.min, datetime.datetime.min, 0, [])
+
+    rows = count_between(start, end) if start is not None or end is not None else statistics.count
+    selectivities = {id(predicate): statistics.selectivity(predicate) for predicate in predicates}
+
+    def rank(predicate):
+        rejected = 1.0 - selectivities[id(predicate)]
+        return _cost(predicate) / rejected if rejected > 0 else float('inf')
+
+    predicates.sort(key=rank)
+
+    estimate = float(rows)
+    for selectivity in selectivities.values():
+        estimate *= selectivity
+    return QueryPlan(start, end, round(estimate), predicates)
@@ -0,0 +1,158 @@
+"""Remember the results of recent queries, so that repeating one skips the scan.
+
+In an interactive session the same query is often run again and again with only
+its `--limit` or `--outfile` changed. A `ResultCache` keeps the matches of the
+most recently used queries as compact arrays of approach positions, keyed by a
+normal form of their filters from `cache_key`, so that filters given in another
+order, or the same bounds spelled another way, find the same entry.
+
+The cache is bounded both by its number of entries and by the memory its
+arrays take up, evicting the least recently used entries to stay within both.
+The positions are only meaningful for the data they were found in, so the
+database clears its cache whenever approaches are added to it.
+"""
+import collections
+import operator
+import sys
+import threading
+from array import array
+
+from filters import AttributeFilter, DateFilter, RangeFilter, split_date_range
+from planner import merge_ranges
+
+# The most queries whose results are kept, and the most memory their positions may take.
+MAX_ENTRIES = 64
+MAX_BYTES = 32 << 20
+
+# The memory taken by an empty entry, roughly, on top of its positions.
+_ENTRY_OVERHEAD = sys.getsizeof(array('q')) + 64
+
+
+def cache_key(filters):
+    """Return a normal form of a collection of filters, equal for every equivalent spelling.
+
+    Date filters are collapsed into a single time range, and the bounds on each
+    other attribute into a single inclusive range, and the remaining filters
+    are sorted, so that neither the order of the filters nor the way a bound
+    is spelled matters.
+
+    :param filters: A collection of filters, as produced by `create_filters`.
+    :return: A hashable key, or None if some filter has no normal form.
+    """
+    if not all(isinstance(f, (AttributeFilter, RangeFilter)) for f in filters):
+        return None
+    start, end, residual = split_date_range(filters)
+    terms = []
+    for f in merge_ranges(residual):
+        if isinstance(f, RangeFilter):
+            terms.append(('range', f.attribute.__name__, f.low, f.high))
+        elif type(f) is not DateFilter and f.op is operator.ge:
+            terms.append(('range', type(f).__name__, f.value, None))
+        elif type(f) is not DateFilter and f.op is operator.le:
+            terms.append(('range', type(f).__name__, None, f.value))
+        else:
+            terms.append((type(f).__name__, f.op.__name__, f.value))
+    return start, end, tuple(sorted(terms, key=repr))
+
+
+class _Entry:
+    """The positions of a query's matches, and whether they are all of them."""
+
+    __slots__ = ('rows', 'complete')
+
+    def __init__(self, rows, complete):
+        self.rows = rows
+        self.complete = complete
+
+    @property
+    def size(self):
+        return _ENTRY_OVERHEAD + len(self.rows) * self.rows.itemsize
+
+
+class ResultCache:
+    """A least-recently-used cache of the positions of queries' matches."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        """Create a new, empty `ResultCache`.
+
+        :param max_entries: The most queries whose results are kept.
+        :param max_bytes: The most memory, in bytes, that the kept results may take.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        # Queries may be answered from several threads, as by `QueryService`.
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        # Bumped by `clear`, so that results found in data since changed are recognized.
+        self.epoch = 0
+
+    def __len__(self):
+        """Return the number of queries whose results are kept."""
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """The memory, in bytes, taken by the kept results."""
+        return self._bytes
+
+    def get(self, key, limit=None):
+        """Find the positions of a query's matches, if enough of them are known.
+
+        :param key: The query's `cache_key`.
+        :param limit: The most matches wanted, or None for all of them.
+        :return: An `array` of the positions of (at least `limit` of) the matches, in order, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not (entry.complete or (limit and limit <= len(entry.rows))):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.rows
+
+    def put(self, key, rows, complete, epoch=None):
+        """Remember the positions of a query's matches, evicting older results to make room.
+
+        :param key: The query's `cache_key`.
+        :param rows: An `array` of the positions of the matches, in order.
+        :param complete: Whether `rows` holds every match, rather than just the first few.
+        :param epoch: The cache's `epoch` when the scan for the matches started, if
+            known. If the cache has been cleared since, the matches are stale and aren't kept.
+        """
+        entry = _Entry(rows, complete)
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def clear(self):
+        """Forget every kept result, as when the data they were found in changes.
+
+        :return: The number of results forgotten.
+        """
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self.evictions += count
+            self.epoch += 1
+            return count
+
+    def __repr__(self):
+        requests = self.hits + self.misses
+        rate = self.hits / requests if requests else 0.0
+        return (f"ResultCache(entries={len(self)}/{self.max_entries}, bytes={self.size}/{self.max_bytes}, "
+                f"hits={self.hits}, misses={self.misses}, hit_rate={rate:.1%}, evictions={self.evictions})")
@@ -0,0 +1,46 @@
+"""Combine sets of matching close approaches, kept as sorted arrays of their positions.
+
+`NEODatabase.match` and `NEODatabase.refine` describe a set of matches by the
+ascending positions of the approaches in the database. Two such sets are
+combined by merging their positions in a single pass, so the cost grows with
+the sizes of the sets and never with the size of the database.
+"""
+import heapq
+import itertools
+from array import array
+
+
+def union(*sets):
+    """Return the positions in any of several sorted sets.
+
+    :param sets: Sequences of positions, each in ascending order without duplicates.
+    :return: An `array` of the positions in at least one set, in ascending order.
+    """
+    return array('q', (position for position, _ in itertools.groupby(heapq.merge(*sets))))
+
+
+def intersection(*sets):
+    """Return the positions in every one of several sorted sets.
+
+    :param sets: Sequences of positions, each in ascending order without duplicates.
+    :return: An `array` of the positions in every set, in ascending order.
+    """
+    if not sets:
+        return array('q')
+    # Start from the smallest set, so every merge is as short as possible.
+    sets = sorted(sets, key=len)
+    common = array('q', sets[0])
+    for other in sets[1:]:
+        merged = array('q')
+        i = j = 0
+        while i < len(common) and j < len(other):
+            if common[i] < other[j]:
+                i += 1
+            elif common[i] > other[j]:
+                j += 1
+            else:
+                merged.append(common[i])
+                i += 1
+                j += 1
+        common = merged
+    return common
@@ -0,0 +1,232 @@
+"""Answer NEO lookups and close approach queries over a small local HTTP service.
+
+`QueryService` puts the database behind an asyncio HTTP/1.1 server, for
+dashboards and other local clients. It answers:
+
+    GET /neo?designation=433          the NEO, and its close approaches, as JSON
+    GET /neo?name=Eros
+    GET /query?start_date=2020-01-01&max_distance=0.1&limit=20&offset=40
+
+where `/query` takes the filters of the `query` subcommand - `date`,
+`start_date`, `end_date`, `min_distance`, `max_distance`, `min_velocity`,
+`max_velocity`, `min_diameter`, `max_diameter` and `hazardous` (`true` or
+`false`) - and streams its matches as newline-delimited JSON, in a chunked
+response, each line shaped like an element of `write_to_json`'s output.
+
+Scanning and encoding run on a pool of worker threads, a batch of matches at a
+time, so the event loop stays free to serve other requests while a large
+export streams out. A client that reads slowly only holds up its own response.
+"""
+import asyncio
+import concurrent.futures
+import datetime
+import itertools
+import json
+import threading
+import urllib.parse
+
+from filters import create_filters, limit
+from write import json_row
+
+# `asyncio.get_running_loop` is new in Python 3.7; before it, `get_event_loop`
+# also returns the running loop when called from a coroutine.
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8020
+
+# How many matches a worker encodes for each chunk of a `/query` response.
+BATCH_SIZE = 256
+
+# The `/query` parameters that map onto the keyword arguments of `create_filters`.
+_DATE_PARAMETERS = {'date': 'date', 'start_date': 'start_date', 'end_date': 'end_date'}
+_FLOAT_PARAMETERS = {
+    'min_distance': 'distance_min', 'max_distance': 'distance_max',
+    'min_velocity': 'velocity_min', 'max_velocity': 'velocity_max',
+    'min_diameter': 'diameter_min', 'max_diameter': 'diameter_max',
+}
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class BadRequest(Exception):
+    """A request whose path or parameters can't be answered."""
+
+
+def parse_query(params):
+    """Turn the parameters of a `/query` request into filters and paging options.
+
+    :param params: A dictionary from each parameter to its (last) value.
+    :return: A tuple of the collection of filters, the limit (or None) and the offset.
+    :raises BadRequest: If a parameter is unknown or malformed.
+    """
+    options = {}
+    for name, value in params.items():
+        try:
+            if name in _DATE_PARAMETERS:
+                options[_DATE_PARAMETERS[name]] = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            elif name in _FLOAT_PARAMETERS:
+                options[_FLOAT_PARAMETERS[name]] = float(value)
+            elif name == 'hazardous':
+                options['hazardous'] = {'true': True, 'false': False}[value.lower()]
+            elif name not in ('limit', 'offset'):
+                raise BadRequest(f"Unknown parameter {name!r}.")
+        except (ValueError, KeyError):
+            raise BadRequest(f"Malformed value {value!r} for {name!r}.")
+
+    try:
+        n = int(params['limit']) if 'limit' in params else None
+        offset = int(params.get('offset', 0))
+    except ValueError:
+        raise BadRequest("The limit and offset must be integers.")
+    if (n is not None and n < 0) or offset < 0:
+        raise BadRequest("The limit and offset must not be negative.")
+    return create_filters(**options), n, offset
+
+
+class QueryService:
+    """An asyncio HTTP server over an `NEODatabase`."""
+
+    def __init__(self, database, workers=None):
+        """Create a new `QueryService`.
+
+        :param database: The `NEODatabase` to answer requests from.
+        :param workers: The most worker threads to scan and encode results on.
+        """
+        self.database = database
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        # Planning a query or looking up an NEO may load shards into the database.
+        self._lock = threading.Lock()
+        self._encode = json.JSONEncoder().encode
+
+    def _run(self, func, *args):
+        """Run a function on the worker pool, returning an awaitable of its result."""
+        return _running_loop().run_in_executor(self._pool, func, *args)
+
+    def _lookup(self, params):
+        """Find an NEO by designation or by name, and describe it and its close approaches."""
+        with self._lock:
+            if 'designation' in params:
+                neo = self.database.get_neo_by_designation(params['designation'])
+            elif 'name' in params:
+                neo = self.database.get_neo_by_name(params['name'])
+            else:
+                raise BadRequest("Give either a designation or a name.")
+        if neo is None:
+            return None
+        return dict(neo.serialize(), approaches=[approach.serialize() for approach in neo.approaches])
+
+    def _start_query(self, filters, n, offset):
+        """Plan a query and return the stream of its matches.
+
+        The stream is read a batch at a time later, without the lock. It holds
+        on to the approaches and columns the database had when it was planned,
+        so another request loading shards meanwhile doesn't disturb it.
+        """
+        with self._lock:
+            return limit(self.database.query(filters, limit=offset + n if n else None), n, offset)
+
+    def _next_batch(self, results):
+        """Encode the next batch of matches from a stream as NDJSON, or return b'' at its end."""
+        return ''.join(self._encode(json_row(result)) + '\n'
+                       for result in itertools.islice(results, BATCH_SIZE)).encode('utf-8')
+
+    async def handle(self, reader, writer):
+        """Serve the requests that arrive on one connection, in turn."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                await self._respond(request_line.decode('latin-1').split(), writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line, writer):
+        """Answer one request, given its split request line."""
+        if len(request_line) != 3:
+            return await self._send_json(writer, 400, {'error': "Malformed request line."})
+        method, target, _ = request_line
+        if method != 'GET':
+            return await self._send_json(writer, 405, {'error': "Only GET is supported."})
+
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            if url.path == '/neo':
+                neo = await self._run(self._lookup, params)
+                if neo is None:
+                    return await self._send_json(writer, 404, {'error': "No matching NEOs exist in the database."})
+                return await self._send_json(writer, 200, neo)
+            if url.path == '/query':
+                results = await self._run(self._start_query, *parse_query(params))
+                return await self._stream(writer, results)
+            return await self._send_json(writer, 404, {'error': f"No such endpoint {url.path!r}."})
+        except BadRequest as e:
+            return await self._send_json(writer, 400, {'error': str(e)})
+
+    async def _send_json(self, writer, status, document):
+        """Send a complete JSON response."""
+        body = self._encode(document).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def _stream(self, writer, results):
+        """Send a stream of matches as chunked NDJSON, encoding each batch on the worker pool."""
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        while True:
+            chunk = await self._run(self._next_batch, results)
+            if not chunk:
+                break
+            writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            # Wait for a slow client here, without blocking anyone else.
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start listening for connections.
+
+        :param host: The address to listen on.
+        :param port: The port to listen on; 0 picks a free one.
+        :return: The `asyncio.Server`.
+        """
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def serve(database, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    """Serve HTTP requests against a database until interrupted.
+
+    :param database: The `NEODatabase` to answer requests from.
+    :param host: The address to listen on.
+    :param port: The port to listen on.
+    :param workers: The most worker threads to scan and encode results on.
+    """
+    service = QueryService(database, workers)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(service.start(host, port))
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        asyncio.set_event_loop(None)
+        loop.close()
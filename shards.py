@@ -0,0 +1,138 @@
+"""Split a dataset of close approaches across many files, each read only when needed.
+
+Rather than one huge `cad.json`, close approaches may be kept as a set of
+shards - say, one file per year - named by a directory or a glob pattern. Each
+shard is described by a `CADShard`, which records the range of approach times
+it holds, so that `NEODatabase` can skip reading any shard whose range a
+query's dates don't overlap.
+
+Learning a shard's time range means reading the shard once: a shard need not
+be sorted by time (the CAD API can sort by distance, say), so only its every
+row bounds it. The ranges are remembered in a manifest alongside the database
+snapshots, keyed by each shard's path, size and modification time, so later
+runs know every shard's range without opening it.
+"""
+import glob
+import json
+import os
+import pathlib
+
+from extract import iter_approaches
+from snapshot import CACHE_ROOT
+
+MANIFEST_NAME = 'shards.json'
+
+# The characters that make a `--cadfile` a glob pattern rather than a path.
+_GLOB_CHARACTERS = frozenset('*?[')
+
+
+class CADShard:
+    """A file of close approaches, and the range of approach times it holds."""
+
+    def __init__(self, path, start, end, count):
+        """Create a new `CADShard`.
+
+        :param path: A path to a JSON file containing data about close approaches.
+        :param start: The earliest approach time in the file, in minutes since the epoch, or None if it is empty.
+        :param end: The latest approach time in the file, in minutes since the epoch, or None if it is empty.
+        :param count: The number of close approaches in the file.
+        """
+        self.path = pathlib.Path(path)
+        self.start = start
+        self.end = end
+        self.count = count
+
+    def overlaps(self, start=None, end=None):
+        """Return whether the shard may hold an approach with a time in `[start, end)`.
+
+        :param start: The earliest time wanted, in minutes since the epoch, or None for no lower bound.
+        :param end: The first time not wanted, in minutes since the epoch, or None for no upper bound.
+        """
+        if not self.count:
+            return False
+        return (start is None or self.end >= start) and (end is None or self.start < end)
+
+    def load(self):
+        """Read the shard's close approaches from disk.
+
+        :return: A list of `CloseApproach`es.
+        """
+        return list(iter_approaches(self.path))
+
+    def __repr__(self):
+        return f"CADShard({str(self.path)!r}, start={self.start!r}, end={self.end!r}, count={self.count!r})"
+
+
+def is_sharded(cad_path):
+    """Return whether a `--cadfile` names a set of shards rather than a single file.
+
+    :param cad_path: A path to a file or a directory, or a glob pattern.
+    """
+    return pathlib.Path(cad_path).is_dir() or not _GLOB_CHARACTERS.isdisjoint(str(cad_path))
+
+
+def discover(cad_path):
+    """List the shards named by a directory or a glob pattern, in name order.
+
+    :param cad_path: A directory of JSON (or compressed JSON) files, or a glob pattern.
+    :return: A list of the paths of the shards.
+    """
+    if pathlib.Path(cad_path).is_dir():
+        return sorted(path for path in pathlib.Path(cad_path).glob('*.json*') if path.is_file())
+    return sorted(pathlib.Path(path) for path in glob.glob(str(cad_path)) if os.path.isfile(path))
+
+
+def _scan(path):
+    """Read a shard through once to find its range of approach times.
+
+    :return: A tuple of the earliest and latest approach times, in minutes, and the approach count.
+    """
+    start = end = None
+    count = 0
+    for approach in iter_approaches(path):
+        if start is None or approach.minutes < start:
+            start = approach.minutes
+        if end is None or approach.minutes > end:
+            end = approach.minutes
+        count += 1
+    return start, end, count
+
+
+def open_shards(cad_path, cache_dir=CACHE_ROOT):
+    """Describe the shards named by a directory or glob, without loading their approaches.
+
+    :param cad_path: A directory of JSON (or compressed JSON) files, or a glob pattern.
+    :param cache_dir: The directory holding the manifest of shard time ranges.
+    :return: A list of `CADShard`s, in name order.
+    """
+    manifest_path = pathlib.Path(cache_dir) / MANIFEST_NAME
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    shards = []
+    changed = False
+    for path in discover(cad_path):
+        key = str(path.resolve())
+        stat = path.stat()
+        entry = manifest.get(key)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            start, end, count = _scan(path)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'start': start, 'end': end, 'count': count}
+            manifest[key] = entry
+            changed = True
+        shards.append(CADShard(path, entry['start'], entry['end'], entry['count']))
+
+    if changed:
+        # The manifest is only a cache, so failing to write it isn't fatal.
+        try:
+            manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            partial = manifest_path.with_name(f"{manifest_path.name}.{os.getpid()}.tmp")
+            with open(partial, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(partial, manifest_path)
+        except OSError:
+            pass
+    return shards
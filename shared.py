@@ -0,0 +1,314 @@
+"""Share one read-only copy of a database's data among many worker processes.
+
+Each worker process that builds its own `NEODatabase` holds its own copy of
+every NEO and close approach. Instead, `publish` writes a database's NEOs and
+close approaches once, as flat columns, to an image file - ideally on a RAM
+disk such as `/dev/shm`. Each worker then calls `SharedDatabase.attach`, which
+memory-maps the image and wraps its columns in read-only NumPy arrays without
+copying them, so the operating system keeps a single copy of the data in memory
+however many workers attach.
+
+A `SharedDatabase` answers `get_neo_by_designation`, `get_neo_by_name` and
+`query` like an `NEODatabase`, building `NearEarthObject`s and `CloseApproach`es
+only for the results it hands back, in the same order. Date ranges are binary
+searches of an index of the approaches by time, and the other filters are
+evaluated over the columns with `ApproachColumns`. NumPy is required.
+"""
+import array
+import itertools
+import math
+import mmap
+import sys
+import traceback
+from bisect import bisect_right
+
+from columnar import ApproachColumns, column_for, np
+from filters import compile_filters, split_date_range
+from helpers import MINUTES_PER_DAY, datetime_to_minutes
+from models import NearEarthObject, CloseApproach
+import ordering
+from planner import merge_ranges
+from snapshot import CACHE_ROOT, read_header, write_image
+
+MAGIC = b'NEOSHM\x00\x01'
+
+# Where an image is published, unless another path is requested.
+DEFAULT_IMAGE = CACHE_ROOT / 'shared.img'
+
+
+def _encode_strings(strings):
+    """Pack strings as one UTF-8 blob and the offsets at which each one starts and ends.
+
+    :return: A tuple of the blob and an `array` of `len(strings) + 1` offsets.
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = array.array('q', itertools.accumulate(itertools.chain((0,), map(len, encoded))))
+    return b''.join(encoded), offsets
+
+
+def publish(database, path=DEFAULT_IMAGE):
+    """Write a database's NEOs and close approaches to an image for workers to attach.
+
+    :param database: A linked `NEODatabase`.
+    :param path: Where to write the image.
+    :return: The path of the image.
+    :raises ImportError: If NumPy is not installed.
+    """
+    # Every approach must be in the image, including those of unread shards.
+    database._load_shards()
+    neos = database._neos
+    approaches = database._approaches
+    columns = ApproachColumns(neos, approaches)
+    neo = columns.neo
+
+    # Keep the approaches in the database's order, with an index of them by time.
+    time_order = np.asarray(database._time_order, dtype=np.int64)
+
+    # Group the approaches by NEO, in time order within each NEO.
+    by_neo = time_order[np.argsort(neo[time_order], kind='stable')]
+    by_neo = by_neo[neo[by_neo] >= 0]
+    counts = np.bincount(neo[neo >= 0], minlength=len(neos))
+    neo_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    designations, designation_offsets = _encode_strings([neo.designation for neo in neos])
+    names, name_offsets = _encode_strings([neo.name or '' for neo in neos])
+    approach_designations, approach_offsets = _encode_strings([approach._designation or '' for approach in approaches])
+    by_designation = sorted(range(len(neos)), key=lambda index: neos[index].designation)
+    by_name = sorted((index for index in range(len(neos)) if neos[index].name), key=lambda index: neos[index].name)
+
+    def section(name, values, typecode):
+        data = values if isinstance(values, bytes) else np.ascontiguousarray(values, dtype=typecode).tobytes()
+        return name, typecode, len(values), data
+
+    sections = [
+        section('neo_designations', designations, 'B'),
+        section('neo_designation_offsets', designation_offsets, 'q'),
+        section('neo_names', names, 'B'),
+        section('neo_name_offsets', name_offsets, 'q'),
+        section('neo_diameters', [neo.diameter for neo in neos], 'd'),
+        section('neo_hazardous', [bool(neo.hazardous) for neo in neos], '?'),
+        section('neo_by_designation', by_designation, 'q'),
+        section('neo_by_name', by_name, 'q'),
+        section('neo_approach_offsets', neo_offsets, 'q'),
+        section('neo_approaches', by_neo, 'q'),
+        section('designations', approach_designations, 'B'),
+        section('designation_offsets', approach_offsets, 'q'),
+        section('time_order', time_order, 'q'),
+        section('time_keys', columns.time[time_order], 'q'),
+        section('time', columns.time, 'q'),
+        section('day', columns.time // MINUTES_PER_DAY, 'q'),
+        section('distance', columns.distance, 'd'),
+        section('velocity', columns.velocity, 'd'),
+        section('neo', neo, 'q'),
+        section('diameter', columns.diameter, 'd'),
+        section('hazardous', columns.hazardous, '?'),
+    ]
+    header = {
+        'byteorder': sys.byteorder,
+        'neos': len(neos),
+        'approaches': len(approaches),
+        'time_order_is_identity': database._time_order_is_identity,
+    }
+    return write_image(path, sections, header, magic=MAGIC)
+
+
+class _Strings:
+    """A read-only sequence of the strings packed by `_encode_strings`, decoded on access."""
+
+    def __init__(self, data, offsets, order=None):
+        self._data = data
+        self._offsets = offsets
+        self._order = order
+
+    def __len__(self):
+        return len(self._offsets) - 1 if self._order is None else len(self._order)
+
+    def __getitem__(self, index):
+        if self._order is not None:
+            index = self._order[index]
+        return bytes(self._data[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+
+class SharedDatabase:
+    """A read-only database over a memory-mapped image written by `publish`."""
+
+    def __init__(self, mm, header):
+        """Wrap a mapped image; use `attach` instead.
+
+        :param mm: An `mmap` of the image.
+        :param header: The image's decoded header.
+        """
+        self._mm = mm
+        arrays = {
+            name: np.frombuffer(mm, dtype=np.dtype(typecode), count=count, offset=offset)
+            for name, (offset, _, typecode, count) in header['sections'].items()
+        }
+        self._arrays = arrays
+        self._designations = _Strings(arrays['neo_designations'], arrays['neo_designation_offsets'])
+        self._names = _Strings(arrays['neo_names'], arrays['neo_name_offsets'])
+        self._approach_designations = _Strings(arrays['designations'], arrays['designation_offsets'])
+        self._time_order_is_identity = header['time_order_is_identity']
+        self._sorted_designations = _Strings(arrays['neo_designations'], arrays['neo_designation_offsets'],
+                                             arrays['neo_by_designation'])
+        self._sorted_names = _Strings(arrays['neo_names'], arrays['neo_name_offsets'], arrays['neo_by_name'])
+        self._columns = ApproachColumns.from_arrays(
+            arrays['time'], arrays['distance'], arrays['velocity'], arrays['neo'],
+            arrays['diameter'], arrays['hazardous'], day=arrays['day'])
+        # The NEOs built so far, by index, so each is only built once.
+        self._neos = {}
+
+    @classmethod
+    def attach(cls, path=DEFAULT_IMAGE):
+        """Map an image written by `publish`, without reading or copying its contents.
+
+        :param path: The path of the image.
+        :return: A `SharedDatabase`.
+        :raises ValueError: If the file is not such an image.
+        :raises ImportError: If NumPy is not installed.
+        """
+        if np is None:
+            raise ImportError("Shared database images require NumPy; install it with `pip install numpy`.")
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = read_header(mm, magic=MAGIC)
+            if header is None or header.get('byteorder') != sys.byteorder:
+                raise ValueError(f"{path} is not a shared database image.")
+            return cls(mm, header)
+        except Exception as e:
+            # A truncated or foreign image fails part way through wrapping its
+            # sections. The views taken by then live on in the traceback's
+            # frames, and the map can't be closed until they are dropped.
+            traceback.clear_frames(e.__traceback__)
+            mm.close()
+            raise
+
+    def _neo(self, index):
+        """Build (or recall) the `NearEarthObject` at an index of the image."""
+        neo = self._neos.get(index)
+        if neo is None:
+            neo = NearEarthObject(designation=self._designations[index],
+                                  name=self._names[index] or None,
+                                  diameter=float(self._arrays['neo_diameters'][index]),
+                                  hazardous=bool(self._arrays['neo_hazardous'][index]))
+            self._neos[index] = neo
+        return neo
+
+    def _approach(self, row):
+        """Build the `CloseApproach` at a row of the image, linked to its NEO."""
+        arrays = self._arrays
+        index = int(arrays['neo'][row])
+        approach = CloseApproach(designation=self._approach_designations[row] or None,
+                                 minutes=int(arrays['time'][row]),
+                                 distance=float(arrays['distance'][row]),
+                                 velocity=float(arrays['velocity'][row]))
+        if index >= 0:
+            approach.neo = self._neo(index)
+        return approach
+
+    def _find(self, keys, key):
+        """Find the NEO whose sorted key equals `key`, with its approaches attached.
+
+        Should several NEOs share the key, the last one in the data file wins, as in `NEODatabase`.
+        """
+        at = bisect_right(keys, key)
+        if not at or keys[at - 1] != key:
+            return None
+        index = int(keys._order[at - 1])
+        neo = self._neo(index)
+        if not neo.approaches:
+            offsets = self._arrays['neo_approach_offsets']
+            rows = self._arrays['neo_approaches'][offsets[index]:offsets[index + 1]]
+            neo.approaches = [self._approach(int(row)) for row in rows]
+        return neo
+
+    def get_neo_by_designation(self, designation):
+        """Find and return an NEO by its primary designation.
+
+        :param designation: The primary designation of the NEO to search for.
+        :return: The `NearEarthObject` with the desired primary designation, or `None`.
+        """
+        return self._find(self._sorted_designations, designation.upper())
+
+    def get_neo_by_name(self, name):
+        """Find and return an NEO by its name.
+
+        :param name: The name, as a string, of the NEO to search for.
+        :return: The `NearEarthObject` with the desired name, or `None`.
+        """
+        return self._find(self._sorted_names, name.capitalize())
+
+    def query(self, filters=(), limit=None, jobs=1, sort_by=None, descending=False):
+        """Query close approaches to generate those that match a collection of filters.
+
+        This takes the same arguments as `NEODatabase.query`, and hands back
+        the same approaches in the same order.
+
+        :param filters: A collection of filters capturing user-specified criteria.
+        :param limit: The most matching approaches wanted, or None for all of them.
+        :param jobs: Accepted for compatibility with `NEODatabase.query`, but
+            ignored: the columns are already evaluated a block at a time with
+            NumPy, and handing them to more processes would copy them.
+        :param sort_by: The attribute to order matches by - 'distance', 'velocity', 'time' or 'diameter' - or None.
+        :param descending: Whether to order matches from the largest value of `sort_by` to the smallest.
+        :return: A stream of matching `CloseApproach` objects.
+        :raises ValueError: If `limit` is negative.
+        """
+        if limit is not None and limit < 0:
+            raise ValueError(f"The limit must not be negative, not {limit}.")
+        if sort_by is None:
+            rows = self._matching_rows(filters, limit)
+        else:
+            key = self._sort_key(sort_by, descending)
+            rows = self._matching_rows(filters)
+            rows = ordering.top_k(rows, key, limit) if limit else ordering.sort(rows, key)
+        results = map(self._approach, rows)
+        return itertools.islice(results, limit) if limit else results
+
+    def _matching_rows(self, filters, limit=None):
+        """Generate the rows of the approaches matching a collection of filters, in order."""
+        start, end, residual = split_date_range(filters)
+        rows = None
+        if start is not None or end is not None:
+            keys = self._arrays['time_keys']
+            lo = 0 if start is None else int(np.searchsorted(keys, datetime_to_minutes(start)))
+            hi = len(keys) if end is None else int(np.searchsorted(keys, datetime_to_minutes(end)))
+            if self._time_order_is_identity:
+                rows = range(lo, max(lo, hi))
+            else:
+                # Hand approaches back in the database's order, as `NEODatabase` does.
+                rows = np.sort(self._arrays['time_order'][lo:max(lo, hi)])
+
+        predicates = merge_ranges(residual)
+        vectorized = [f for f in predicates if column_for(f) is not None]
+        others = [f for f in predicates if column_for(f) is None]
+        matches = compile_filters(others)
+        for indices in self._columns.iter_select(vectorized, rows, block=limit):
+            for row in indices.tolist():
+                if not others or matches(self._approach(row)):
+                    yield row
+
+    def _sort_key(self, attribute, descending=False):
+        """Make a function from a row to the number to order it by, read straight from the image's columns.
+
+        The keys are those of `ordering.sort_key`, so that ties and unknown values are ordered the same way.
+        """
+        if attribute not in ordering.SORT_ATTRIBUTES:
+            raise KeyError(attribute)
+        # Each attribute has a column of the same name in the image.
+        values = self._arrays[attribute]
+        sign = -1 if descending else 1
+
+        def key(row):
+            value = float(values[row])
+            # Unknown values come last in either direction.
+            return math.inf if value != value else sign * value
+        return key
+
+    def close(self):
+        """Unmap the image. Arrays and strings taken from it must no longer be used."""
+        # Release every view of the map first, or it can't be closed.
+        self._arrays = self._columns = None
+        self._designations = self._names = self._approach_designations = None
+        self._sorted_designations = self._sorted_names = None
+        self._mm.close()
@@ -0,0 +1,214 @@
+"""Cache a linked `NEODatabase` as a compact binary image on disk.
+
+Parsing `neos.csv` and `cad.json` dominates the running time of a one-line
+`inspect` or `query`. After the first load, `save` writes the database's NEOs
+and close approaches to a snapshot file as a handful of flat columns. On later
+runs, `load` memory-maps that file and rebuilds the database from the columns
+directly, without touching the original data files beyond hashing them.
+
+A snapshot is keyed by the path, size, modification time and a content hash of
+each data file, so it is ignored (and then rewritten) as soon as either of them
+changes.
+
+The layout of a snapshot file is:
+
+    magic (8 bytes) | header offset (uint64) | header length (uint64) | sections | JSON header
+
+where each section starts on an 8-byte boundary, and the header records the data
+files the snapshot was built from, the byte order of the machine that wrote it,
+and the offset, length and type code of each section. Numeric sections are
+native `array`s; string sections are NUL-separated UTF-8.
+"""
+import array
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+import sys
+
+from database import NEODatabase
+from models import NearEarthObject, CloseApproach
+
+MAGIC = b'NEOSNAP\x01'
+_PREAMBLE = struct.Struct('<8sQQ')
+_ALIGNMENT = 8
+_HASH_CHUNK_SIZE = 1 << 20
+
+# The directory holding snapshot files, unless another is requested.
+CACHE_ROOT = pathlib.Path(__file__).parent.resolve() / '.neo-cache'
+
+
+def _fingerprint(path):
+    """Describe a data file by its path, size, modification time and contents.
+
+    :param path: A path to a data file.
+    :return: A JSON-serializable dictionary identifying the file's current state.
+    """
+    path = pathlib.Path(path).resolve()
+    stat = path.stat()
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return {
+        'path': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': digest.hexdigest(),
+    }
+
+
+def snapshot_path(neo_csv_path, cad_json_path, cache_dir=CACHE_ROOT):
+    """Return where the snapshot for a pair of data files lives.
+
+    :param neo_csv_path: A path to a CSV file containing data about near-Earth objects.
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :param cache_dir: The directory holding snapshot files.
+    :return: The path of the snapshot file for these data files.
+    """
+    paths = f"{pathlib.Path(neo_csv_path).resolve()}\0{pathlib.Path(cad_json_path).resolve()}"
+    name = hashlib.blake2b(paths.encode(), digest_size=8).hexdigest()
+    return pathlib.Path(cache_dir) / f"{name}.snap"
+
+
+def encode_strings(strings):
+    """Pack a sequence of strings into NUL-separated UTF-8."""
+    return '\0'.join(strings).encode('utf-8')
+
+
+def decode_strings(buf, count):
+    """Unpack `count` strings packed by `encode_strings`."""
+    return bytes(buf).decode('utf-8').split('\0') if count else []
+
+
+def save(database, neo_csv_path, cad_json_path, cache_dir=CACHE_ROOT):
+    """Write a snapshot of a linked database built from the given data files.
+
+    :param database: The `NEODatabase` to snapshot.
+    :param neo_csv_path: The CSV file of NEOs the database was built from.
+    :param cad_json_path: The JSON file of close approaches the database was built from.
+    :param cache_dir: The directory holding snapshot files.
+    :return: The path of the written snapshot.
+    """
+    neos = database._neos
+    approaches = database._approaches
+
+    sections = [
+        ('neo_designations', 's', len(neos), encode_strings(neo.designation for neo in neos)),
+        ('neo_names', 's', len(neos), encode_strings(neo.name or '' for neo in neos)),
+        ('neo_diameters', 'd', len(neos), array.array('d', (neo.diameter for neo in neos)).tobytes()),
+        ('neo_hazardous', 'b', len(neos), array.array('b', (bool(neo.hazardous) for neo in neos)).tobytes()),
+        ('approach_designations', 's', len(approaches),
+         encode_strings(approach._designation for approach in approaches)),
+        ('approach_times', 'q', len(approaches),
+         array.array('q', (approach.minutes for approach in approaches)).tobytes()),
+        ('approach_distances', 'd', len(approaches),
+         array.array('d', (approach.distance for approach in approaches)).tobytes()),
+        ('approach_velocities', 'd', len(approaches),
+         array.array('d', (approach.velocity for approach in approaches)).tobytes()),
+    ]
+
+    header = {
+        'byteorder': sys.byteorder,
+        'neofile': _fingerprint(neo_csv_path),
+        'cadfile': _fingerprint(cad_json_path),
+    }
+
+    return write_image(snapshot_path(neo_csv_path, cad_json_path, cache_dir), sections, header)
+
+
+def write_image(target, sections, header, magic=MAGIC):
+    """Write an image file of aligned sections, followed by a JSON header describing them.
+
+    The image is written to a temporary file and then moved into place, so a
+    concurrent or interrupted run never observes a partially written image.
+
+    :param target: The path of the image file.
+    :param sections: A sequence of `(name, typecode, count, data)` tuples, where `data` is a bytes-like object.
+    :param header: A JSON-serializable dictionary, to which the offset, length,
+                   type code and count of each section are added under 'sections'.
+    :param magic: The 8 bytes that identify the kind of image.
+    :return: The path of the written image.
+    """
+    target = pathlib.Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    header = dict(header, sections={})
+    try:
+        with open(partial, 'wb') as f:
+            f.write(_PREAMBLE.pack(magic, 0, 0))
+            for name, typecode, count, data in sections:
+                header['sections'][name] = [f.tell(), len(data), typecode, count]
+                f.write(data)
+                f.write(b'\0' * (-len(data) % _ALIGNMENT))
+            encoded = json.dumps(header).encode('utf-8')
+            header_offset = f.tell()
+            f.write(encoded)
+            f.seek(0)
+            f.write(_PREAMBLE.pack(magic, header_offset, len(encoded)))
+        os.replace(partial, target)
+    finally:
+        if partial.exists():
+            partial.unlink()
+    return target
+
+
+def read_header(mm, magic=MAGIC):
+    """Validate an image's preamble and return its decoded header, or None."""
+    if len(mm) < _PREAMBLE.size:
+        return None
+    found, offset, length = _PREAMBLE.unpack_from(mm)
+    if found != magic:
+        return None
+    return json.loads(bytes(mm[offset:offset + length]).decode('utf-8'))
+
+
+def load(neo_csv_path, cad_json_path, cache_dir=CACHE_ROOT, **options):
+    """Rebuild a database from its snapshot, if an up-to-date one exists.
+
+    :param neo_csv_path: A path to a CSV file containing data about near-Earth objects.
+    :param cad_json_path: A path to a JSON file containing data about close approaches.
+    :param cache_dir: The directory holding snapshot files.
+    :param options: Additional keyword arguments for the `NEODatabase` constructor.
+    :return: A linked `NEODatabase`, or None if there is no usable snapshot.
+    """
+    path = snapshot_path(neo_csv_path, cad_json_path, cache_dir)
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = read_header(mm)
+            if (header is None or header.get('byteorder') != sys.byteorder
+                    or header.get('neofile') != _fingerprint(neo_csv_path)
+                    or header.get('cadfile') != _fingerprint(cad_json_path)):
+                return None
+
+            view = memoryview(mm)
+            try:
+                columns = {}
+                for name, (offset, length, typecode, count) in header['sections'].items():
+                    section = view[offset:offset + length]
+                    if typecode == 's':
+                        columns[name] = decode_strings(section, count)
+                    else:
+                        # Copy out of the map so no view outlives it.
+                        columns[name] = section.cast(typecode).tolist()
+                    section.release()
+            finally:
+                view.release()
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+    neos = [
+        NearEarthObject(designation=designation, name=name or None, diameter=diameter, hazardous=bool(hazardous))
+        for designation, name, diameter, hazardous in zip(columns['neo_designations'], columns['neo_names'],
+                                                          columns['neo_diameters'], columns['neo_hazardous'])
+    ]
+    approaches = (
+        CloseApproach(designation=designation, minutes=minutes, distance=distance, velocity=velocity)
+        for designation, minutes, distance, velocity in zip(columns['approach_designations'],
+                                                            columns['approach_times'],
+                                                            columns['approach_distances'],
+                                                            columns['approach_velocities'])
+    )
+    return NEODatabase(neos, approaches, **options)
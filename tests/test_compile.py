@@ -0,0 +1,99 @@
+"""Check that compiled filter predicates agree with the filters they replace.
+
+Also measure the per-approach cost of a compiled predicate against calling each
+filter in turn, on the 2020 test data.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_compile
+"""
+import datetime
+import math
+import operator
+import pathlib
+import timeit
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters, compile_filters, RangeFilter, DistanceFilter, VelocityFilter, AttributeFilter
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class NameLengthFilter(AttributeFilter):
+    """A filter without an inlinable expression."""
+
+    @classmethod
+    def get(cls, approach):
+        return len(approach._designation)
+
+
+def matches_each(filters):
+    return lambda approach: all(map(lambda f: f(approach), filters))
+
+
+class TestCompileFilters(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+        NEODatabase(load_neos(TEST_NEO_FILE), cls.approaches)
+
+    def assertAgrees(self, filters):
+        predicate = compile_filters(filters)
+        expected = [approach for approach in self.approaches if matches_each(filters)(approach)]
+        self.assertEqual([approach for approach in self.approaches if predicate(approach)], expected)
+
+    def test_no_filters_match_everything(self):
+        self.assertTrue(compile_filters([])(self.approaches[0]))
+
+    def test_compiled_filters_agree_with_each_filter(self):
+        self.assertAgrees(create_filters(date=datetime.date(2020, 3, 2)))
+        self.assertAgrees(create_filters(start_date=datetime.date(2020, 3, 1), end_date=datetime.date(2020, 5, 31),
+                                         distance_min=0.05, velocity_max=20, diameter_max=1.5, hazardous=False))
+        self.assertAgrees(create_filters(hazardous=True, diameter_min=0.5))
+
+    def test_compiled_ranges_agree(self):
+        self.assertAgrees([RangeFilter(DistanceFilter, 0.1, 0.3)])
+        self.assertAgrees([RangeFilter(VelocityFilter, high=10)])
+
+    def test_constants_are_inlined(self):
+        predicate = compile_filters(create_filters(distance_max=0.25, hazardous=True))
+        self.assertIn('approach.distance <= 0.25', predicate.source)
+        self.assertIn('approach.neo.hazardous == True', predicate.source)
+
+    def test_non_finite_constants_are_bound(self):
+        predicate = compile_filters([DistanceFilter(operator.le, math.inf)])
+        self.assertNotIn('inf', predicate.source)
+        self.assertTrue(predicate(self.approaches[0]))
+
+    def test_filters_without_expressions_are_called(self):
+        self.assertAgrees([NameLengthFilter(operator.gt, 8), DistanceFilter(operator.le, 0.2)])
+
+
+class TestCompiledPredicateBenchmark(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+        NEODatabase(load_neos(TEST_NEO_FILE), cls.approaches)
+
+    def per_row_cost(self, predicate):
+        seconds = min(timeit.repeat(lambda: sum(1 for approach in self.approaches if predicate(approach)),
+                                    number=3, repeat=3)) / 3
+        return seconds / len(self.approaches)
+
+    def test_compiled_predicate_is_cheaper_per_row(self):
+        filters = create_filters(start_date=datetime.date(2020, 1, 1), end_date=datetime.date(2020, 12, 31),
+                                 distance_min=0.01, distance_max=0.5, velocity_min=1, velocity_max=60,
+                                 diameter_max=100, hazardous=False)
+        interpreted = self.per_row_cost(matches_each(filters))
+        compiled = self.per_row_cost(compile_filters(filters))
+        self.assertLess(compiled, interpreted,
+                        msg=f"compiled: {compiled * 1e9:.0f}ns/row, interpreted: {interpreted * 1e9:.0f}ns/row")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""Check that commands sent to a query daemon print what they would print locally.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_daemon
+"""
+import contextlib
+import io
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+import daemon
+import main
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        cls.parser = main.make_parser()[0]
+        cls.tmp = pathlib.Path(tempfile.mkdtemp())
+        cls.socket = cls.tmp / 'daemon.sock'
+        cls.server = threading.Thread(target=daemon.serve, daemon=True,
+                                      args=(cls.db, main.run, TEST_NEO_FILE, TEST_CAD_FILE, cls.socket))
+        cls.server.start()
+        for _ in range(100):
+            if daemon.is_listening(cls.socket):
+                break
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def parse(self, *argv):
+        return self.parser.parse_args(['--neofile', str(TEST_NEO_FILE), '--cadfile', str(TEST_CAD_FILE)] + list(argv))
+
+    def locally(self, args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            main.run(self.db, args)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def remotely(self, args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        daemon.request(args, self.socket, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_daemon_is_listening(self):
+        self.assertTrue(daemon.is_listening(self.socket))
+        self.assertFalse(daemon.is_listening(self.tmp / 'missing.sock'))
+
+    def test_query_through_daemon(self):
+        args = self.parse('query', '--start-date', '2020-03-01', '--max-distance', '0.1', '--limit', '2000')
+        self.assertEqual(self.remotely(args), self.locally(args))
+
+    def test_inspect_through_daemon(self):
+        for argv in (('inspect', '--verbose', '--pdes', '433'), ('inspect', '--name', 'not-real-name')):
+            with self.subTest(argv=argv):
+                args = self.parse(*argv)
+                self.assertEqual(self.remotely(args), self.locally(args))
+
+    def test_query_outfile_is_relative_to_the_client(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.ExitStack() as stack:
+                stack.callback(os.chdir, os.getcwd())
+                os.chdir(tmp)
+                self.remotely(self.parse('query', '--limit', '5', '--outfile', 'results.csv'))
+            self.assertEqual(len((pathlib.Path(tmp) / 'results.csv').read_text().splitlines()), 6)
+
+    def test_daemon_refuses_other_data_files(self):
+        args = self.parse('query')
+        args.cadfile = TESTS_ROOT / 'other-cad.json'
+        stdout, stderr = self.remotely(args)
+        self.assertEqual(stdout, '')
+        self.assertIn('The daemon serves', stderr)
+
+    def test_concurrent_clients(self):
+        args = self.parse('query', '--hazardous', '--limit', '500')
+        expected = self.locally(args)
+        results = [None] * 8
+
+        def client(index):
+            results[index] = self.remotely(args)
+
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * len(results))
+
+    def test_commands_run_at_the_same_time(self):
+        # Each command waits for the other to start, which only works if they run at once.
+        barrier = threading.Barrier(2, timeout=10)
+
+        def run(database, args, stdout=None, stderr=None):
+            barrier.wait()
+            main.run(database, args, stdout=stdout, stderr=stderr)
+
+        socket = self.tmp / 'concurrent.sock'
+        threading.Thread(target=daemon.serve, daemon=True,
+                         args=(self.db, run, TEST_NEO_FILE, TEST_CAD_FILE, socket)).start()
+        for _ in range(100):
+            if daemon.is_listening(socket):
+                break
+            time.sleep(0.05)
+
+        queries = [self.parse('query', '--hazardous', '--limit', '50'), self.parse('inspect', '--pdes', '433')]
+        results = [None] * len(queries)
+
+        def client(index):
+            stdout, stderr = io.StringIO(), io.StringIO()
+            daemon.request(queries[index], socket, stdout=stdout, stderr=stderr)
+            results[index] = stdout.getvalue(), stderr.getvalue()
+
+        threads = [threading.Thread(target=client, args=(index,)) for index in range(len(queries))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.locally(args) for args in queries])
+
+
+if __name__ == '__main__':
+    unittest.main()
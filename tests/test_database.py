@@ -10,13 +10,19 @@ To run these tests from the project root, run:
 
 These tests should pass when Task 2 is complete.
 """
+import datetime
 import pathlib
 import math
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from extract import load_neos, load_approaches
 from database import NEODatabase
+from filters import create_filters
 
 
 # Paths to the test data files.
@@ -54,6 +60,28 @@ class TestDatabase(unittest.TestCase):
                     self.fail(f"{approach} appears in the approaches of multiple NEOs.")
                 seen.add(approach)
 
+    def test_database_construction_orders_each_neos_approaches_by_time(self):
+        for neo in self.neos:
+            times = [approach.minutes for approach in neo.approaches]
+            self.assertEqual(times, sorted(times))
+
+    def test_database_construction_groups_approaches_contiguously(self):
+        neo = self.db.get_neo_by_designation('68347')
+        self.assertEqual(len(neo.approaches), 3)
+        self.assertEqual(list(neo.approaches), [neo.approaches[0], neo.approaches[1], neo.approaches[-1]])
+        self.assertEqual(neo.approaches[1:], list(neo.approaches)[1:])
+        for approach in neo.approaches:
+            self.assertIs(approach.neo, neo)
+
+    def test_relinking_without_arguments_keeps_the_approaches(self):
+        db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        before = {neo.designation: list(neo.approaches) for neo in db._neos}
+        results = list(db.query(create_filters(start_date=datetime.date(2020, 6, 1), distance_max=0.1)))
+        db.link_neos_and_approaches()
+        self.assertEqual({neo.designation: list(neo.approaches) for neo in db._neos}, before)
+        self.assertEqual(list(db.query(create_filters(start_date=datetime.date(2020, 6, 1), distance_max=0.1))),
+                         results)
+
     def test_get_neo_by_designation(self):
         cerberus = self.db.get_neo_by_designation('1865')
         self.assertIsNotNone(cerberus)
@@ -115,5 +143,115 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNone(nonexistent)
 
 
+class TestAddApproaches(unittest.TestCase):
+    columnar = False
+
+    QUERIES = (
+        {},
+        {'date': datetime.date(2020, 3, 14)},
+        {'start_date': datetime.date(2020, 6, 1), 'end_date': datetime.date(2020, 7, 15), 'distance_max': 0.2},
+        {'velocity_min': 20, 'hazardous': True},
+    )
+
+    def setUp(self):
+        # Build one database from every approach, and another from some of
+        # them, to which the rest are then added.
+        self.full = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE), columnar=self.columnar)
+        self.neos = load_neos(TEST_NEO_FILE)
+        self.approaches = load_approaches(TEST_CAD_FILE)
+
+    def assertSameAnswers(self, db):
+        for options in self.QUERIES:
+            filters = create_filters(**options)
+            self.assertEqual([str(approach) for approach in db.query(filters)],
+                             [str(approach) for approach in self.full.query(filters)])
+        for neo in self.full._neos:
+            self.assertEqual([str(approach) for approach in db.get_neo_by_designation(neo.designation).approaches],
+                             [str(approach) for approach in neo.approaches])
+
+    def test_add_later_approaches(self):
+        db = NEODatabase(self.neos, self.approaches[:3000], columnar=self.columnar)
+        self.assertEqual(db.add_approaches(self.approaches[3000:]), 1700)
+        self.assertTrue(db._time_order_is_identity)
+        self.assertSameAnswers(db)
+
+    def test_add_earlier_approaches(self):
+        db = NEODatabase(self.neos, self.approaches[1000:], columnar=self.columnar)
+        db.add_approaches(self.approaches[:1000])
+        self.assertEqual(db._time_keys, sorted(db._time_keys))
+        filters = create_filters(start_date=datetime.date(2020, 1, 1), end_date=datetime.date(2020, 1, 31))
+        self.assertEqual(sorted(str(approach) for approach in db.query(filters)),
+                         sorted(str(approach) for approach in self.full.query(filters)))
+        for neo in self.full._neos:
+            self.assertEqual([str(approach) for approach in db.get_neo_by_designation(neo.designation).approaches],
+                             [str(approach) for approach in neo.approaches])
+
+    def test_add_unsorted_approaches(self):
+        db = NEODatabase(self.neos, self.approaches[::2], columnar=self.columnar)
+        added = self.approaches[1::2][::-1]
+        db.add_approaches(added)
+        self.assertEqual(db._time_keys, [db._approaches[index].minutes for index in db._time_order])
+        # A stable sort of every approach by time, with those already known before those added.
+        by_time = sorted(range(len(db._approaches)), key=lambda index: db._approaches[index].minutes)
+        self.assertEqual(db._time_order, by_time)
+        filters = create_filters(start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2020, 6, 30))
+        self.assertEqual(sorted(str(approach) for approach in db.query(filters)),
+                         sorted(str(approach) for approach in self.full.query(filters)))
+
+    def test_add_approaches_updates_statistics(self):
+        db = NEODatabase(self.neos, self.approaches[:3000], columnar=self.columnar)
+        db.add_approaches(self.approaches[3000:])
+        self.assertEqual(db._statistics.count, self.full._statistics.count)
+        self.assertAlmostEqual(db._statistics.hazardous, self.full._statistics.hazardous)
+
+
+@unittest.skipIf(numpy is None, "The columnar backend requires NumPy.")
+class TestAddApproachesColumnar(TestAddApproaches):
+    columnar = True
+
+
+class TestRefine(unittest.TestCase):
+    columnar = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE), columnar=cls.columnar)
+
+    def assertRefines(self, first, then):
+        rows = self.db.refine(self.db.match(create_filters(**first)), create_filters(**then))
+        expected = list(self.db.query(create_filters(**dict(first, **then))))
+        self.assertEqual(list(self.db.approaches_at(rows)), expected)
+
+    def test_match_finds_every_match_in_order(self):
+        rows = self.db.match(create_filters(velocity_min=20))
+        self.assertEqual(list(rows), sorted(rows))
+        self.assertEqual(list(self.db.approaches_at(rows)), list(self.db.query(create_filters(velocity_min=20))))
+
+    def test_refine_with_attributes(self):
+        self.assertRefines({'start_date': datetime.date(2020, 3, 1), 'end_date': datetime.date(2020, 6, 30)},
+                           {'distance_max': 0.1})
+        self.assertRefines({'distance_max': 0.2}, {'hazardous': True, 'velocity_min': 15})
+        self.assertRefines({'hazardous': False}, {'diameter_min': 0.1, 'diameter_max': 1.0})
+
+    def test_refine_with_dates(self):
+        self.assertRefines({'velocity_min': 15}, {'start_date': datetime.date(2020, 5, 1)})
+        self.assertRefines({'velocity_min': 15}, {'date': datetime.date(2020, 5, 5)})
+
+    def test_refine_with_contradictory_filters(self):
+        rows = self.db.match(create_filters(distance_max=0.2))
+        self.assertEqual(len(self.db.refine(rows, create_filters(distance_min=0.3))), 0)
+        self.assertEqual(len(self.db.refine(rows, create_filters(start_date=datetime.date(2020, 6, 1),
+                                                                 end_date=datetime.date(2020, 5, 1)))), 0)
+
+    def test_refine_without_filters(self):
+        rows = self.db.match(create_filters(velocity_min=20))
+        self.assertEqual(self.db.refine(rows), rows)
+
+
+@unittest.skipIf(numpy is None, "The columnar backend requires NumPy.")
+class TestRefineColumnar(TestRefine):
+    columnar = True
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -10,13 +10,21 @@ To run these tests from the project root, run:
 
 These tests should pass when Task 2 is complete.
 """
+import bz2
 import collections.abc
 import datetime
+import gzip
+import json
+import lzma
 import pathlib
 import math
+import operator
+import tempfile
 import unittest
+import unittest.mock
 
-from extract import load_neos, load_approaches
+from extract import load_neos, load_approaches, iter_approaches, compression
+from filters import DateFilter, compile_filters
 from models import NearEarthObject, CloseApproach
 
 
@@ -77,6 +85,14 @@ class TestLoadNEOs(unittest.TestCase):
         self.assertEqual(neo.diameter, 0.6)
         self.assertEqual(neo.hazardous, True)
 
+    def test_neos_have_no_extra_columns_by_default(self):
+        self.assertEqual(self.neos_by_designation['2101'].extra, {})
+
+    def test_neos_keep_requested_extra_columns(self):
+        neos = {neo.designation: neo for neo in load_neos(TEST_NEO_FILE, extra_columns=('full_name', 'albedo'))}
+        self.assertEqual(neos['1865'].extra, {'full_name': '  1865 Cerberus (1971 UA)', 'albedo': '0.22'})
+        self.assertEqual(neos['1865'].name, 'Cerberus')
+
 
 class TestLoadApproaches(unittest.TestCase):
     @classmethod
@@ -107,6 +123,27 @@ class TestLoadApproaches(unittest.TestCase):
         self.assertIsNotNone(approach)
         self.assertIsInstance(approach.time, datetime.datetime)
 
+    def test_approach_minutes_is_int(self):
+        approach = self.get_first_approach_or_none()
+        self.assertIsNotNone(approach)
+        self.assertIsInstance(approach.minutes, int)
+
+    def test_approach_time_from_jd_matches_calendar_date(self):
+        approach = CloseApproach(jd='2458849.537524496', distance=0.02, velocity=5.6)
+        self.assertEqual(approach.time, CloseApproach(time='2020-Jan-01 00:54', distance=0.02, velocity=5.6).time)
+
+    def test_date_filters_compare_datetimes_by_their_date(self):
+        moment = datetime.datetime(2020, 3, 2, 18, 30)
+        for op in (operator.eq, operator.ne, operator.ge, operator.lt):
+            with self.subTest(op=op):
+                by_date = DateFilter(op, moment.date())
+                by_datetime = DateFilter(op, moment)
+                expected = [by_date(approach) for approach in self.approaches]
+                self.assertEqual([by_datetime(approach) for approach in self.approaches], expected)
+                predicate = compile_filters([by_datetime])
+                self.assertEqual([predicate(approach) for approach in self.approaches], expected)
+                self.assertEqual(DateFilter.key(moment), DateFilter.key(moment.date()))
+
     def test_approach_distance_is_float(self):
         approach = self.get_first_approach_or_none()
         self.assertIsNotNone(approach)
@@ -118,5 +155,93 @@ class TestLoadApproaches(unittest.TestCase):
         self.assertIsInstance(approach.velocity, float)
 
 
+class TestIterApproaches(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(TEST_CAD_FILE) as f:
+            cls.document = json.load(f)
+        cls.expected = [(row[0], row[3], float(row[4]), float(row[7]))
+                        for row in cls.document['data']]
+
+    @staticmethod
+    def as_tuples(approaches):
+        return [(approach._designation, approach.time.strftime('%Y-%b-%d %H:%M'),
+                 approach.distance, approach.velocity) for approach in approaches]
+
+    def test_iter_approaches_is_a_stream(self):
+        stream = iter_approaches(TEST_CAD_FILE)
+        self.assertIsInstance(stream, collections.abc.Iterator)
+        self.assertIsInstance(next(stream), CloseApproach)
+
+    def test_iter_approaches_matches_the_json_document(self):
+        self.assertEqual(self.as_tuples(iter_approaches(TEST_CAD_FILE)), self.expected)
+
+    def test_iter_approaches_across_small_chunks(self):
+        with unittest.mock.patch('extract._CHUNK_SIZE', 7):
+            self.assertEqual(self.as_tuples(iter_approaches(TEST_CAD_FILE)), self.expected)
+
+    def test_iter_approaches_with_fields_before_data(self):
+        reordered = {'fields': self.document['fields'], 'data': self.document['data'][:50]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp) / 'cad.json'
+            path.write_text(json.dumps(reordered))
+            self.assertEqual(self.as_tuples(iter_approaches(path)), self.expected[:50])
+
+    def test_iter_approaches_with_reordered_columns(self):
+        order = [3, 0, 7, 4]
+        reordered = {
+            'data': [[row[i] for i in order] for row in self.document['data'][:50]],
+            'fields': [self.document['fields'][i] for i in order],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp) / 'cad.json'
+            path.write_text(json.dumps(reordered, indent=2))
+            with unittest.mock.patch('extract._TAIL_PROBE_SIZE', 16):
+                self.assertEqual(self.as_tuples(iter_approaches(path)), self.expected[:50])
+
+
+class TestCompressedFiles(unittest.TestCase):
+    CODECS = {'gzip': (gzip, '.gz'), 'bzip2': (bz2, '.bz2'), 'xz': (lzma, '.xz')}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def compress(self, path, codec, suffix=None):
+        module, extension = self.CODECS[codec]
+        target = pathlib.Path(self.tmp.name) / (path.name + (extension if suffix is None else suffix))
+        with module.open(target, 'wb') as f:
+            f.write(path.read_bytes())
+        return target
+
+    def test_compression_is_detected(self):
+        self.assertIsNone(compression(TEST_CAD_FILE))
+        for codec in self.CODECS:
+            with self.subTest(codec=codec):
+                self.assertEqual(compression(self.compress(TEST_CAD_FILE, codec)), codec)
+
+    def test_compression_is_detected_by_magic_bytes_without_an_extension(self):
+        for codec in self.CODECS:
+            with self.subTest(codec=codec):
+                self.assertEqual(compression(self.compress(TEST_CAD_FILE, codec, suffix='.data')), codec)
+
+    def test_load_compressed_neos(self):
+        expected = [(neo.designation, neo.name, repr(neo.diameter), neo.hazardous) for neo in load_neos(TEST_NEO_FILE)]
+        for codec in self.CODECS:
+            with self.subTest(codec=codec):
+                neos = load_neos(self.compress(TEST_NEO_FILE, codec))
+                self.assertEqual([(neo.designation, neo.name, repr(neo.diameter), neo.hazardous) for neo in neos],
+                                 expected)
+
+    def test_load_compressed_approaches(self):
+        expected = [(approach._designation, approach.minutes, approach.distance, approach.velocity)
+                    for approach in load_approaches(TEST_CAD_FILE)]
+        for codec in self.CODECS:
+            with self.subTest(codec=codec):
+                approaches = load_approaches(self.compress(TEST_CAD_FILE, codec))
+                self.assertEqual([(approach._designation, approach.minutes, approach.distance, approach.velocity)
+                                  for approach in approaches], expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+"""Check that NASA calendar dates are converted to and from datetimes exactly.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_helpers
+"""
+import datetime
+import json
+import pathlib
+import unittest
+
+from helpers import cd_to_datetime, datetime_to_str, datetime_to_minutes, minutes_to_datetime
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestCalendarDates(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(TEST_CAD_FILE) as f:
+            cls.calendar_dates = [row[3] for row in json.load(f)['data']]
+
+    def test_cd_to_datetime_agrees_with_strptime(self):
+        for calendar_date in self.calendar_dates:
+            self.assertEqual(cd_to_datetime(calendar_date),
+                             datetime.datetime.strptime(calendar_date, "%Y-%b-%d %H:%M"))
+
+    def test_cd_to_datetime_across_months_and_years(self):
+        self.assertEqual(cd_to_datetime('1900-Dec-31 23:59'), datetime.datetime(1900, 12, 31, 23, 59))
+        self.assertEqual(cd_to_datetime('2000-Feb-29 00:00'), datetime.datetime(2000, 2, 29, 0, 0))
+
+    def test_cd_to_datetime_accepts_any_month_case(self):
+        self.assertEqual(cd_to_datetime('2020-MAR-02 12:30'), datetime.datetime(2020, 3, 2, 12, 30))
+
+    def test_cd_to_datetime_rejects_malformed_dates(self):
+        for malformed in ('', '2020-03-02 12:30', '2020-Mar-2 12:30', '2020-Mar-02T12:30', '2020-Mar-02 12:30:00',
+                          '2020-Foo-02 12:30', '2019-Feb-29 12:30', '2200-Feb-29 12:30', '2020-Mar-02 24:00', '2020-Mar-02 12:60',
+                          '2020-Mar-02 +1:30', ' 2020-Mar-02 12:3'):
+            with self.assertRaises(ValueError, msg=malformed):
+                cd_to_datetime(malformed)
+
+    def test_datetime_to_str_agrees_with_strftime(self):
+        for calendar_date in self.calendar_dates:
+            dt = cd_to_datetime(calendar_date)
+            self.assertEqual(datetime_to_str(dt), dt.strftime("%Y-%m-%d %H:%M"))
+
+    def test_minutes_round_trip(self):
+        for calendar_date in self.calendar_dates[:100]:
+            dt = cd_to_datetime(calendar_date)
+            self.assertEqual(minutes_to_datetime(datetime_to_minutes(dt)), dt)
+
+
+if __name__ == '__main__':
+    unittest.main()
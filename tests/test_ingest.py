@@ -0,0 +1,99 @@
+"""Check that loading the data files in parallel matches loading them serially.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_ingest
+"""
+import gzip
+import json
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from extract import load_neos, load_approaches
+import ingest
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+def describe_neos(neos):
+    return [(neo.designation, neo.name, repr(neo.diameter), neo.hazardous, dict(neo.extra)) for neo in neos]
+
+
+def describe_approaches(approaches):
+    return [(approach._designation, approach.minutes, approach.distance, approach.velocity)
+            for approach in approaches]
+
+
+# Split the small test files into many chunks.
+@mock.patch.object(ingest, 'MIN_CHUNK_SIZE', 1 << 12)
+class TestParallelLoad(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.neos = load_neos(TEST_NEO_FILE, extra_columns=('id',))
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+
+    def setUp(self):
+        self.tmp = pathlib.Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_chunks_cover_the_files(self):
+        _, ranges = ingest._neo_chunks(TEST_NEO_FILE, 4)
+        self.assertGreater(len(ranges), 1)
+        _, ranges = ingest._cad_chunks(TEST_CAD_FILE, 4)
+        self.assertGreater(len(ranges), 1)
+        for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(stop, start)
+
+    def test_parallel_load_matches_serial_load(self):
+        neos, approaches = ingest.load(TEST_NEO_FILE, TEST_CAD_FILE, 3, extra_columns=('id',))
+        self.assertEqual(describe_neos(neos), describe_neos(self.neos))
+        self.assertEqual(describe_approaches(approaches), describe_approaches(self.approaches))
+
+    def test_parallel_load_of_compact_json(self):
+        cadfile = self.tmp / 'cad.json'
+        with open(TEST_CAD_FILE) as f:
+            contents = json.load(f)
+        with open(cadfile, 'w') as f:
+            json.dump(contents, f, separators=(',', ':'))
+
+        _, approaches = ingest.load(TEST_NEO_FILE, cadfile, 2)
+        self.assertEqual(describe_approaches(approaches), describe_approaches(self.approaches))
+
+    def test_parallel_load_falls_back_without_a_data_key_up_front(self):
+        cadfile = self.tmp / 'cad.json'
+        with open(TEST_CAD_FILE) as f:
+            contents = json.load(f)
+        with open(cadfile, 'w') as f:
+            json.dump({'fields': contents['fields'], 'padding': ' ' * (1 << 18), 'data': contents['data']}, f)
+
+        _, approaches = ingest.load(TEST_NEO_FILE, cadfile, 2)
+        self.assertEqual(describe_approaches(approaches), describe_approaches(self.approaches))
+
+    def test_parallel_load_of_compressed_files(self):
+        cadfile = self.tmp / 'cad.json.gz'
+        with gzip.open(cadfile, 'wb') as f:
+            f.write(TEST_CAD_FILE.read_bytes())
+
+        neos, approaches = ingest.load(TEST_NEO_FILE, cadfile, 2, extra_columns=('id',))
+        self.assertEqual(describe_neos(neos), describe_neos(self.neos))
+        self.assertEqual(describe_approaches(approaches), describe_approaches(self.approaches))
+
+    def test_parallel_load_of_empty_data(self):
+        cadfile = self.tmp / 'cad.json'
+        with open(cadfile, 'w') as f:
+            json.dump({'count': 0, 'data': [], 'fields': ['des', 'jd', 'dist', 'v_rel']}, f)
+
+        _, approaches = ingest.load(TEST_NEO_FILE, cadfile, 2)
+        self.assertEqual(approaches, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,9 +10,12 @@ implement it imperatively with the tools from the `itertools` module.
 These tests should pass when Task 3c is complete.
 """
 import collections.abc
+import contextlib
+import io
 import unittest
 
 from filters import limit
+import main
 
 
 class TestLimit(unittest.TestCase):
@@ -41,6 +44,22 @@ class TestLimit(unittest.TestCase):
         self.assertEqual(tuple(limit(iter(self.iterable), 0)), (0, 1, 2, 3, 4))
         self.assertEqual(tuple(limit(iter(self.iterable), None)), (0, 1, 2, 3, 4))
 
+    def test_limit_iterator_with_offset(self):
+        self.assertEqual(tuple(limit(iter(self.iterable), 2, 1)), (1, 2))
+        self.assertEqual(tuple(limit(iter(self.iterable), 10, 3)), (3, 4))
+        self.assertEqual(tuple(limit(iter(self.iterable), None, 3)), (3, 4))
+
+    def test_limit_stops_pulling_after_the_limit(self):
+        pulled = []
+
+        def stream():
+            for value in self.iterable:
+                pulled.append(value)
+                yield value
+
+        self.assertEqual(tuple(limit(stream(), 2)), (0, 1))
+        self.assertEqual(pulled, [0, 1])
+
     def test_limit_produces_an_iterable(self):
         self.assertIsInstance(limit(self.iterable, 3), collections.abc.Iterable)
         self.assertIsInstance(limit(self.iterable, 5), collections.abc.Iterable)
@@ -49,6 +68,28 @@ class TestLimit(unittest.TestCase):
         self.assertIsInstance(limit(self.iterable, 0), collections.abc.Iterable)
         self.assertIsInstance(limit(self.iterable, None), collections.abc.Iterable)
 
+    def test_limit_rejects_negative_counts(self):
+        with self.assertRaises(ValueError):
+            limit(self.iterable, -1)
+        with self.assertRaises(ValueError):
+            limit(self.iterable, 3, -1)
+
+
+class TestLimitArguments(unittest.TestCase):
+    def setUp(self):
+        self.parser, _, _ = main.make_parser()
+
+    def test_limit_and_offset_are_parsed(self):
+        args = self.parser.parse_args(['query', '--limit', '5', '--offset', '0'])
+        self.assertEqual((args.limit, args.offset), (5, 0))
+
+    def test_negative_limit_and_offset_are_rejected(self):
+        for argv in (['query', '--limit', '-1'], ['query', '--offset', '-3'], ['query', '--limit', 'many']):
+            with self.subTest(argv=argv), contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit) as raised:
+                    self.parser.parse_args(argv)
+                self.assertEqual(raised.exception.code, 2)
+
 
 if __name__ == '__main__':
     unittest.main()
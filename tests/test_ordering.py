@@ -0,0 +1,91 @@
+"""Check that ordered and top-k queries match a plain sort of the unordered results.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_ordering
+"""
+import datetime
+import math
+import pathlib
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters
+import ordering
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+QUERIES = (
+    {},
+    {'start_date': datetime.date(2020, 3, 1), 'end_date': datetime.date(2020, 8, 31)},
+    {'hazardous': True},
+    {'distance_max': 0.1, 'velocity_min': 10},
+)
+
+
+def expected_order(approaches, attribute, descending):
+    # A plain stable sort, with unknown values last either way.
+    read = ordering.SORT_ATTRIBUTES[attribute]
+    known = [approach for approach in approaches if not math.isnan(read(approach))]
+    unknown = [approach for approach in approaches if math.isnan(read(approach))]
+    return sorted(known, key=lambda approach: -read(approach) if descending else read(approach)) + unknown
+
+
+class TestOrderedQueries(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+
+    def test_full_sort(self):
+        for options in QUERIES:
+            unordered = list(self.db.query(create_filters(**options)))
+            for attribute in ordering.SORT_ATTRIBUTES:
+                for descending in (False, True):
+                    with self.subTest(options=options, sort_by=attribute, descending=descending):
+                        ordered = list(self.db.query(create_filters(**options), sort_by=attribute,
+                                                     descending=descending))
+                        self.assertEqual(ordered, expected_order(unordered, attribute, descending))
+
+    def test_top_k(self):
+        for options in QUERIES:
+            unordered = list(self.db.query(create_filters(**options)))
+            for attribute in ordering.SORT_ATTRIBUTES:
+                for descending in (False, True):
+                    with self.subTest(options=options, sort_by=attribute, descending=descending):
+                        ordered = list(self.db.query(create_filters(**options), limit=20, sort_by=attribute,
+                                                     descending=descending))
+                        self.assertEqual(ordered, expected_order(unordered, attribute, descending)[:20])
+
+    def test_closest_approaches(self):
+        closest = list(self.db.query(create_filters(start_date=datetime.date(2020, 1, 1),
+                                                    end_date=datetime.date(2020, 12, 31)),
+                                     limit=5, sort_by='distance'))
+        self.assertEqual(len(closest), 5)
+        self.assertLessEqual(closest[-1].distance, min(approach.distance for approach in self.db._approaches
+                                                       if approach not in closest))
+
+    def test_order_of_refined_rows(self):
+        rows = self.db.match(create_filters(hazardous=True))
+        ordered = list(self.db.approaches_at(self.db.order(rows, 'velocity', descending=True, limit=3)))
+        self.assertEqual(ordered, expected_order(list(self.db.approaches_at(rows)), 'velocity', True)[:3])
+
+
+class TestSpillingSort(unittest.TestCase):
+    def test_runs_spilled_to_disk_merge_in_order(self):
+        values = [(position * 7919) % 1000 / 10 for position in range(5000)]
+        key = values.__getitem__
+        self.assertEqual(list(ordering.sort(range(5000), key, run_size=300)),
+                         sorted(range(5000), key=key))
+
+    def test_ties_keep_their_order(self):
+        key = [1.0, 0.0, 1.0, 0.0, 1.0].__getitem__
+        self.assertEqual(list(ordering.sort(range(5), key, run_size=2)), [1, 3, 0, 2, 4])
+        self.assertEqual(ordering.top_k(range(5), key, 3), [1, 3, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
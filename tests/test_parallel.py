@@ -0,0 +1,118 @@
+"""Check that a query scanned across worker processes matches a serial scan.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_parallel
+"""
+import datetime
+import functools
+import operator
+import pathlib
+import unittest
+from unittest import mock
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters, DateFilter, RangeFilter, VelocityFilter
+from models import CloseApproach
+import main
+import parallel
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestParallelScan(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        # Split even the small test dataset into several partitions.
+        cls.partition_size = parallel.MIN_PARTITION_SIZE
+        parallel.MIN_PARTITION_SIZE = 256
+
+    @classmethod
+    def tearDownClass(cls):
+        parallel.MIN_PARTITION_SIZE = cls.partition_size
+        cls.db.close()
+
+    def assertSameResults(self, filters, limit=None):
+        expected = list(self.db.query(filters, limit))
+        received = list(self.db.query(filters, limit, jobs=2))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual([id(approach) for approach in received], [id(approach) for approach in expected])
+
+    def test_attribute_filters(self):
+        self.assertSameResults(create_filters(velocity_min=20))
+        self.assertSameResults(create_filters(distance_min=0.1, distance_max=0.3, velocity_max=15))
+        self.assertSameResults(create_filters(hazardous=True, diameter_min=0.2))
+        self.assertSameResults(create_filters(hazardous=False, diameter_max=1.0))
+
+    def test_date_range(self):
+        self.assertSameResults(create_filters(start_date=datetime.date(2020, 3, 1),
+                                              end_date=datetime.date(2020, 8, 31), velocity_min=15))
+
+    def test_residual_date_filter(self):
+        # A `!=` date can't become a time range, so it is evaluated over the `day` column.
+        self.assertSameResults([DateFilter(operator.ne, datetime.date(2020, 1, 1)), RangeFilter(VelocityFilter, 10, 30)])
+
+    def test_limit(self):
+        self.assertSameResults(create_filters(velocity_min=20), limit=5)
+        self.assertSameResults(create_filters(distance_max=0.05), limit=1000)
+
+    def test_workers_are_kept_between_queries(self):
+        list(self.db.query(create_filters(velocity_min=20), jobs=2))
+        pool = self.db._pool
+        self.assertIsNotNone(pool)
+        list(self.db.query(create_filters(velocity_max=10), jobs=2))
+        self.assertIs(self.db._pool, pool)
+
+    def test_limited_scan_stops_handing_out_partitions(self):
+        submitted = []
+        pool = self.db._scan_pool(2)
+        submit = pool.submit
+
+        def record(*args):
+            submitted.append(args)
+            return submit(*args)
+
+        rows = range(len(self.db._approaches))
+        column = functools.partial(parallel.pack_column, self.db._approaches)
+        with mock.patch.object(pool, 'submit', record):
+            matches = list(parallel.scan(pool, column, rows, create_filters(distance_max=1), 2, limit=5))
+        self.assertGreaterEqual(len(matches), 5)
+        self.assertLess(len(submitted), len(parallel.partition(rows, 2)))
+
+    def test_no_predicates_scan_serially(self):
+        self.assertEqual(len(list(self.db.query((), jobs=2))), len(self.db._approaches))
+
+    def test_after_adding_approaches(self):
+        db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        filters = create_filters(velocity_min=25)
+        before = len(list(db.query(filters, jobs=2)))
+        db.add_approaches([CloseApproach(designation='433', time='2021-Jan-01 00:00', distance=0.3, velocity=30.0)])
+        self.assertEqual(len(list(db.query(filters, jobs=2))), before + 1)
+        self.assertEqual([id(approach) for approach in db.query(filters, jobs=2)],
+                         [id(approach) for approach in db.query(filters)])
+
+    def test_partition(self):
+        parts = parallel.partition(range(1000), jobs=2)
+        self.assertEqual([part.start for part in parts], [0, 256, 512, 768])
+        self.assertEqual(parts[-1].stop, 1000)
+
+
+
+class TestJobsArguments(unittest.TestCase):
+    def setUp(self):
+        self.parser, _, _ = main.make_parser()
+
+    def test_loading_and_scanning_jobs_are_separate_options(self):
+        args = self.parser.parse_args(['--jobs', '3', 'query', '--scan-jobs', '4'])
+        self.assertEqual((args.jobs, args.scan_jobs), (3, 4))
+        args = self.parser.parse_args(['query'])
+        self.assertEqual((args.jobs, args.scan_jobs), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
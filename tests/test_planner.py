@@ -0,0 +1,92 @@
+"""Check that queries are planned into merged, well-ordered predicates.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_planner
+"""
+import datetime
+import operator
+import pathlib
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters, RangeFilter, DistanceFilter, VelocityFilter, HazardousFilter
+from planner import merge_ranges
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestMergeRanges(unittest.TestCase):
+    def test_min_and_max_merge_into_a_range(self):
+        merged = merge_ranges(create_filters(distance_min=0.1, distance_max=0.3))
+        self.assertEqual(len(merged), 1)
+        self.assertIsInstance(merged[0], RangeFilter)
+        self.assertIs(merged[0].attribute, DistanceFilter)
+        self.assertEqual((merged[0].low, merged[0].high), (0.1, 0.3))
+
+    def test_single_bounds_are_left_alone(self):
+        filters = create_filters(distance_min=0.1, velocity_max=20)
+        self.assertEqual(merge_ranges(filters), filters)
+
+    def test_repeated_bounds_tighten(self):
+        filters = create_filters(velocity_min=10, velocity_max=30) + [VelocityFilter(operator.le, 20)]
+        merged = merge_ranges(filters)
+        self.assertEqual((merged[0].low, merged[0].high), (10, 20))
+
+
+class TestPlanQuery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), cls.approaches)
+
+    def test_date_range_becomes_the_access_path(self):
+        plan = self.db.plan(create_filters(start_date=datetime.date(2020, 3, 1), end_date=datetime.date(2020, 3, 31),
+                                           velocity_min=10))
+        self.assertEqual(plan.start, datetime.datetime(2020, 3, 1))
+        self.assertEqual(plan.end, datetime.datetime(2020, 4, 1))
+        self.assertEqual([type(f) for f in plan.predicates], [VelocityFilter])
+
+    def test_full_scan_without_date_bounds(self):
+        plan = self.db.plan(create_filters(hazardous=True))
+        self.assertIsNone(plan.start)
+        self.assertIsNone(plan.end)
+
+    def test_more_selective_predicates_run_first(self):
+        # Few approaches are of hazardous NEOs, and most are slower than 50 km/s.
+        plan = self.db.plan(create_filters(velocity_max=50, hazardous=True))
+        self.assertEqual([type(f) for f in plan.predicates], [HazardousFilter, VelocityFilter])
+
+    def test_estimates_are_in_the_right_ballpark(self):
+        filters = create_filters(distance_min=0.1, distance_max=0.3)
+        actual = sum(1 for _ in self.db.query(filters))
+        estimate = self.db.plan(filters).estimated_rows
+        self.assertLess(abs(estimate - actual), 0.1 * len(self.approaches))
+
+    def test_contradictory_bounds_plan_an_empty_scan(self):
+        plan = self.db.plan(create_filters(distance_min=0.3, distance_max=0.1))
+        self.assertEqual(plan.estimated_rows, 0)
+        self.assertEqual(list(self.db.query(create_filters(distance_min=0.3, distance_max=0.1))), [])
+
+    def test_plain_callables_are_checked_as_they_are(self):
+        close = lambda approach: approach.distance < 0.1  # noqa: E731
+        expected = [approach for approach in self.approaches if approach.distance < 0.1]
+        self.assertEqual(list(self.db.query([close])), expected)
+        self.assertEqual(list(self.db.query([close, VelocityFilter(operator.ge, 10)])),
+                         [approach for approach in expected if approach.velocity >= 10])
+
+    def test_bounds_in_the_same_direction_merge_into_an_open_range(self):
+        filters = [DistanceFilter(operator.ge, 0.1), DistanceFilter(operator.ge, 0.2)]
+        expected = [approach for approach in self.approaches if approach.distance >= 0.2]
+        self.assertEqual(list(self.db.query(filters)), expected)
+        filters = [VelocityFilter(operator.le, 30), VelocityFilter(operator.le, 20)]
+        expected = [approach for approach in self.approaches if approach.velocity <= 20]
+        self.assertEqual(list(self.db.query(filters)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,12 @@ import unittest
 
 from database import NEODatabase
 from extract import load_neos, load_approaches
-from filters import create_filters
+from filters import create_filters, split_date_range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
@@ -529,5 +534,65 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(expected, received, msg="Computed results do not match expected results.")
 
 
+class TestTimeIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.neos = load_neos(TEST_NEO_FILE)
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+        cls.db = NEODatabase(cls.neos, cls.approaches)
+
+    def test_query_with_limit_matches_the_first_results(self):
+        filters = create_filters(start_date=datetime.date(2020, 6, 1), velocity_min=10)
+        everything = list(self.db.query(filters))
+        self.assertEqual(list(self.db.query(filters, limit=5)), everything[:5])
+
+    def test_query_rejects_a_negative_limit(self):
+        with self.assertRaises(ValueError):
+            self.db.query(create_filters(), limit=-1)
+
+    def test_split_date_range_collapses_date_filters(self):
+        filters = create_filters(start_date=datetime.date(2020, 3, 1), end_date=datetime.date(2020, 3, 31),
+                                 date=datetime.date(2020, 3, 14), distance_max=0.1)
+        start, end, residual = split_date_range(filters)
+        self.assertEqual(start, datetime.datetime(2020, 3, 14))
+        self.assertEqual(end, datetime.datetime(2020, 3, 15))
+        self.assertEqual(residual, filters[-1:])
+
+    def test_split_date_range_without_date_filters(self):
+        filters = create_filters(velocity_min=10)
+        self.assertEqual(split_date_range(filters), (None, None, filters))
+
+    def test_date_query_reads_only_that_days_rows(self):
+        date = datetime.date(2020, 3, 2)
+        start, end, _ = split_date_range(create_filters(date=date))
+        rows = self.db._rows_between(start, end)
+
+        expected = [index for index, approach in enumerate(self.approaches) if approach.time.date() == date]
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(list(rows), expected)
+
+
+@unittest.skipIf(numpy is None, "The columnar backend requires NumPy.")
+class TestColumnarQuery(TestQuery):
+    """Run every query test against the NumPy-backed columnar store."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.neos = load_neos(TEST_NEO_FILE)
+        cls.approaches = load_approaches(TEST_CAD_FILE)
+        cls.db = NEODatabase(cls.neos, cls.approaches, columnar=True)
+
+    def test_query_with_limit_matches_the_first_results(self):
+        filters = create_filters(velocity_min=10)
+        everything = list(self.db.query(filters))
+        for n in (1, 5, 2000, len(everything) + 1):
+            self.assertEqual(list(self.db.query(filters, limit=n)), everything[:n])
+
+    def test_query_preserves_approach_order(self):
+        filters = create_filters(start_date=datetime.date(2020, 3, 1), distance_max=0.1, hazardous=False)
+        expected = [approach for approach in self.approaches if all(f(approach) for f in filters)]
+        self.assertEqual(expected, list(self.db.query(filters)))
+
+
 if __name__ == '__main__':
     unittest.main()
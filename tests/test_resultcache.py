@@ -0,0 +1,131 @@
+"""Check the cache of query results, and that the database keeps it correct.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_resultcache
+"""
+import datetime
+import operator
+import pathlib
+import unittest
+from array import array
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters, DistanceFilter, RangeFilter, VelocityFilter
+from models import CloseApproach
+from resultcache import ResultCache, cache_key
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_order_does_not_matter(self):
+        filters = create_filters(distance_max=0.1, velocity_min=20, hazardous=True)
+        self.assertEqual(cache_key(filters), cache_key(list(reversed(filters))))
+
+    def test_bounds_spelled_as_ranges(self):
+        self.assertEqual(cache_key(create_filters(distance_min=0.1, distance_max=0.2)),
+                         cache_key([RangeFilter(DistanceFilter, 0.1, 0.2)]))
+        self.assertEqual(cache_key(create_filters(velocity_min=20)),
+                         cache_key([RangeFilter(VelocityFilter, 20, None)]))
+        self.assertEqual(cache_key(create_filters(velocity_min=20, velocity_max=30, distance_max=0.5)),
+                         cache_key([VelocityFilter(operator.le, 30), DistanceFilter(operator.le, 0.5),
+                                    VelocityFilter(operator.ge, 20)]))
+
+    def test_dates_spelled_as_ranges(self):
+        day = datetime.date(2020, 1, 1)
+        self.assertEqual(cache_key(create_filters(date=day)), cache_key(create_filters(start_date=day, end_date=day)))
+
+    def test_different_queries_differ(self):
+        self.assertNotEqual(cache_key(create_filters(velocity_min=20)), cache_key(create_filters(velocity_max=20)))
+        self.assertNotEqual(cache_key(create_filters(hazardous=True)), cache_key(create_filters(hazardous=False)))
+
+    def test_arbitrary_callables_are_not_cached(self):
+        self.assertIsNone(cache_key([lambda approach: True]))
+
+
+class TestResultCache(unittest.TestCase):
+    def test_partial_results_serve_smaller_limits(self):
+        cache = ResultCache()
+        cache.put('key', array('q', range(10)), complete=False)
+        self.assertEqual(list(cache.get('key', limit=5)), list(range(10)))
+        self.assertIsNone(cache.get('key', limit=20))
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_evicts_least_recently_used_entry(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', array('q'), complete=True)
+        cache.put('b', array('q'), complete=True)
+        cache.get('a')
+        cache.put('c', array('q'), complete=True)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_evicts_to_stay_within_memory_budget(self):
+        cache = ResultCache(max_bytes=20000)
+        cache.put('a', array('q', range(1000)), complete=True)
+        cache.put('b', array('q', range(1000)), complete=True)
+        self.assertEqual(len(cache), 2)
+        cache.put('c', array('q', range(1000)), complete=True)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertIsNone(cache.get('a'))
+
+    def test_oversized_results_are_not_kept(self):
+        cache = ResultCache(max_bytes=1000)
+        cache.put('a', array('q', range(1000)), complete=True)
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def test_clear(self):
+        cache = ResultCache()
+        cache.put('a', array('q'), complete=True)
+        self.assertEqual(cache.clear(), 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_results_from_before_a_clear_are_not_kept(self):
+        cache = ResultCache()
+        epoch = cache.epoch
+        cache.clear()
+        cache.put('a', array('q'), complete=True, epoch=epoch)
+        self.assertEqual(len(cache), 0)
+        cache.put('a', array('q'), complete=True, epoch=cache.epoch)
+        self.assertEqual(len(cache), 1)
+
+
+class TestDatabaseCache(unittest.TestCase):
+    def setUp(self):
+        self.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+
+    def test_repeated_query_hits(self):
+        filters = create_filters(velocity_min=20, distance_max=0.3)
+        first = list(self.db.query(filters))
+        self.assertEqual(list(self.db.query(list(reversed(filters)))), first)
+        self.assertEqual(list(self.db.query(filters, limit=3)), first[:3])
+        self.assertEqual(self.db.cache.hits, 2)
+
+    def test_limited_query_is_cached_partially(self):
+        filters = create_filters(velocity_min=20)
+        first = list(self.db.query(filters, limit=10))
+        self.assertEqual(list(self.db.query(filters, limit=5)), first[:5])
+        self.assertEqual(self.db.cache.hits, 1)
+        # More matches than were found the first time need a scan.
+        self.assertEqual(list(self.db.query(filters, limit=20))[:10], first)
+        self.assertEqual(self.db.cache.misses, 2)
+
+    def test_adding_approaches_invalidates(self):
+        filters = create_filters(velocity_min=20)
+        before = list(self.db.query(filters))
+        self.db.add_approaches([CloseApproach(designation='433', time='2021-Jan-01 00:00',
+                                              distance=0.3, velocity=30.0)])
+        self.assertEqual(len(self.db.cache), 0)
+        self.assertEqual(len(list(self.db.query(filters))), len(before) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
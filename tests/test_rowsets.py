@@ -0,0 +1,94 @@
+"""Check combining sets of matches, and saving and refining them in the interactive shell.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_rowsets
+"""
+import contextlib
+import datetime
+import io
+import pathlib
+import unittest
+from array import array
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters
+import main
+import rowsets
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestRowSets(unittest.TestCase):
+    def test_union(self):
+        self.assertEqual(rowsets.union(array('q', [1, 3, 5]), [2, 3, 8], array('q', [0])),
+                         array('q', [0, 1, 2, 3, 5, 8]))
+        self.assertEqual(rowsets.union(), array('q'))
+
+    def test_intersection(self):
+        self.assertEqual(rowsets.intersection(array('q', [1, 3, 5, 7, 9]), [3, 4, 5, 9], array('q', [0, 5, 9])),
+                         array('q', [5, 9]))
+        self.assertEqual(rowsets.intersection(array('q', [1, 2]), array('q')), array('q'))
+        self.assertEqual(rowsets.intersection(), array('q'))
+
+
+class TestShellResults(unittest.TestCase):
+    def setUp(self):
+        self.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        _, inspect_parser, query_parser = main.make_parser()
+        self.shell = main.NEOShell(self.db, inspect_parser, query_parser)
+
+    def run_commands(self, *commands):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            for command in commands:
+                self.shell.onecmd(command)
+        return stdout.getvalue().splitlines(), stderr.getvalue()
+
+    def expected(self, n=10, **options):
+        return [str(approach) for approach in self.db.query(create_filters(**options), limit=n)]
+
+    def test_refine_narrows_the_last_query(self):
+        lines, _ = self.run_commands('query --start-date 2020-03-01 --end-date 2020-06-30 --limit 1',
+                                     'query --refine --max-distance 0.1',
+                                     'query --refine --hazardous --limit 100')
+        start, end = datetime.date(2020, 3, 1), datetime.date(2020, 6, 30)
+        self.assertEqual(lines[1:11], self.expected(start_date=start, end_date=end, distance_max=0.1))
+        self.assertEqual(lines[11:], self.expected(100, start_date=start, end_date=end, distance_max=0.1,
+                                                   hazardous=True))
+
+    def test_refine_needs_an_earlier_query(self):
+        lines, errors = self.run_commands('query --refine --hazardous')
+        self.assertEqual(lines, [])
+        self.assertIn("run a query first", errors)
+
+    def test_saved_results_combine(self):
+        self.run_commands('query --max-distance 0.1', 'results save close',
+                          'query --min-velocity 25', 'results save fast')
+        both = rowsets.intersection(self.db.match(create_filters(distance_max=0.1)),
+                                    self.db.match(create_filters(velocity_min=25)))
+        lines, _ = self.run_commands('results intersect close fast')
+        self.assertEqual(lines, [f"{len(both)} matches."])
+
+        lines, _ = self.run_commands('query --refine --limit 1000')
+        self.assertEqual(lines, self.expected(1000, distance_max=0.1, velocity_min=25))
+
+        lines, _ = self.run_commands('results union close fast')
+        either = rowsets.union(self.db.match(create_filters(distance_max=0.1)),
+                               self.db.match(create_filters(velocity_min=25)))
+        self.assertEqual(lines, [f"{len(either)} matches."])
+
+    def test_results_go_stale(self):
+        self.run_commands('query --max-distance 0.1', 'results save close')
+        self.db.generation += 1
+        lines, errors = self.run_commands('results load close', 'query --refine --hazardous')
+        self.assertEqual(lines, [])
+        self.assertIn("has changed", errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""Check that the HTTP query service answers like the database it serves.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_service
+"""
+import asyncio
+import datetime
+import http.client
+import json
+import pathlib
+import threading
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters
+from write import json_row
+import service
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestQueryService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        cls.loop = asyncio.new_event_loop()
+        cls.server = cls.loop.run_until_complete(service.QueryService(cls.db, workers=4).start(port=0))
+        cls.port = cls.server.sockets[0].getsockname()[1]
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.server.close()
+        cls.loop.run_until_complete(cls.server.wait_closed())
+        cls.loop.close()
+
+    def get(self, target):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            connection.request('GET', target)
+            response = connection.getresponse()
+            return response.status, response.getheader('Content-Type'), response.read().decode('utf-8')
+        finally:
+            connection.close()
+
+    def expected_rows(self, filters, n=None, offset=0):
+        rows = list(self.db.query(filters))[offset:]
+        rows = rows[:n] if n else rows
+        return [json.loads(json.dumps(json_row(row))) for row in rows]
+
+    def test_query_streams_ndjson(self):
+        status, content_type, body = self.get('/query?start_date=2020-03-01&end_date=2020-06-30&max_distance=0.1')
+        self.assertEqual(status, 200)
+        self.assertEqual(content_type, 'application/x-ndjson')
+        filters = create_filters(start_date=datetime.date(2020, 3, 1), end_date=datetime.date(2020, 6, 30),
+                                 distance_max=0.1)
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected_rows(filters))
+
+    def test_query_with_limit_and_offset(self):
+        _, _, body = self.get('/query?hazardous=true&limit=7&offset=5')
+        self.assertEqual([json.loads(line) for line in body.splitlines()],
+                         self.expected_rows(create_filters(hazardous=True), 7, 5))
+
+    def test_query_of_everything_spans_many_chunks(self):
+        _, _, body = self.get('/query')
+        self.assertEqual(len(body.splitlines()), len(self.db._approaches))
+
+    def test_malformed_query_is_rejected(self):
+        for target in ('/query?date=2020-13-01', '/query?hazardous=maybe', '/query?limit=-1', '/query?colour=red'):
+            with self.subTest(target=target):
+                status, _, body = self.get(target)
+                self.assertEqual(status, 400)
+                self.assertIn('error', json.loads(body))
+
+    def test_neo_by_designation_and_name(self):
+        for target in ('/neo?designation=5786', '/neo?name=talos'):
+            with self.subTest(target=target):
+                status, content_type, body = self.get(target)
+                self.assertEqual(status, 200)
+                self.assertEqual(content_type, 'application/json')
+                neo = json.loads(body)
+                self.assertEqual(neo['designation'], '5786')
+                self.assertEqual(neo['name'], 'Talos')
+                self.assertEqual(len(neo['approaches']), len(self.db.get_neo_by_designation('5786').approaches))
+
+    def test_missing_neo_and_unknown_endpoint(self):
+        self.assertEqual(self.get('/neo?designation=not-real')[0], 404)
+        self.assertEqual(self.get('/nowhere')[0], 404)
+
+    def test_keep_alive_connection_serves_many_requests(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            for _ in range(3):
+                connection.request('GET', '/query?date=2020-01-01')
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                response.read()
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
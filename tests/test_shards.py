@@ -0,0 +1,143 @@
+"""Check that a sharded close approach dataset answers queries like a single file.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_shards
+"""
+import datetime
+import json
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters
+import shards
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestShards(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+
+    def setUp(self):
+        self.tmp = pathlib.Path(tempfile.mkdtemp())
+        self.shard_dir = self.tmp / 'cad'
+        self.shard_dir.mkdir()
+        self.cache = self.tmp / 'cache'
+
+        # Split the fixture into one shard per quarter of 2020.
+        with open(TEST_CAD_FILE) as f:
+            document = json.load(f)
+        quarters = [[] for _ in range(4)]
+        for row in document['data']:
+            month = datetime.datetime.strptime(row[3], '%Y-%b-%d %H:%M').month
+            quarters[(month - 1) // 3].append(row)
+        for quarter, rows in enumerate(quarters, start=1):
+            with open(self.shard_dir / f'cad-2020-q{quarter}.json', 'w') as f:
+                json.dump({'count': len(rows), 'data': rows, 'fields': document['fields']}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def sharded_database(self, cad_path=None):
+        return NEODatabase(load_neos(TEST_NEO_FILE), (),
+                           shards=shards.open_shards(cad_path or self.shard_dir, cache_dir=self.cache))
+
+    def test_shards_record_their_time_ranges(self):
+        found = shards.open_shards(self.shard_dir, cache_dir=self.cache)
+        self.assertEqual([shard.path.name for shard in found],
+                         [f'cad-2020-q{quarter}.json' for quarter in range(1, 5)])
+        self.assertEqual(sum(shard.count for shard in found), len(self.db._approaches))
+        for earlier, later in zip(found, found[1:]):
+            self.assertLess(earlier.end, later.start)
+
+    def test_manifest_spares_rescanning_shards(self):
+        shards.open_shards(self.shard_dir, cache_dir=self.cache)
+        with mock.patch.object(shards, '_scan') as scan:
+            shards.open_shards(self.shard_dir, cache_dir=self.cache)
+        scan.assert_not_called()
+
+    def test_shards_sorted_by_another_key(self):
+        # Split the fixture into two half-years, each sorted by distance rather than time.
+        with open(TEST_CAD_FILE) as f:
+            document = json.load(f)
+        shard_dir = self.tmp / 'by-distance'
+        shard_dir.mkdir()
+        dist, jd = document['fields'].index('dist'), document['fields'].index('jd')
+        halves = [[], []]
+        for row in document['data']:
+            month = datetime.datetime.strptime(row[3], '%Y-%b-%d %H:%M').month
+            halves[month > 6].append(row)
+        for half, rows in enumerate(halves, start=1):
+            rows.sort(key=lambda row: float(row[dist]))
+            # Have the first and last rows be in time order, though they bound nothing.
+            by_time = sorted(rows, key=lambda row: float(row[jd]))
+            first, last = by_time[len(by_time) // 2], by_time[len(by_time) // 2 + 1]
+            rows[:] = [first] + [row for row in rows if row is not first and row is not last] + [last]
+            with open(shard_dir / f'cad-2020-h{half}.json', 'w') as f:
+                json.dump({'count': len(rows), 'data': rows, 'fields': document['fields']}, f)
+
+        db = self.sharded_database(shard_dir)
+        filters = create_filters(date=datetime.date(2020, 3, 14))
+        expected = sorted(str(approach) for approach in self.db.query(filters))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(sorted(str(approach) for approach in db.query(filters)), expected)
+
+    def test_glob_pattern_names_shards(self):
+        self.assertTrue(shards.is_sharded(self.shard_dir / 'cad-2020-q[12].json'))
+        self.assertFalse(shards.is_sharded(TEST_CAD_FILE))
+        found = shards.open_shards(self.shard_dir / 'cad-2020-q[12].json', cache_dir=self.cache)
+        self.assertEqual(len(found), 2)
+
+    def test_date_range_query_reads_only_overlapping_shards(self):
+        db = self.sharded_database()
+        filters = create_filters(start_date=datetime.date(2020, 5, 1), end_date=datetime.date(2020, 5, 31))
+        results = list(db.query(filters))
+        self.assertEqual(list(db._shard_approaches), [1])
+        self.assertEqual([str(approach) for approach in results],
+                         [str(approach) for approach in self.db.query(filters)])
+
+    def test_query_results_do_not_depend_on_shard_load_order(self):
+        db = self.sharded_database()
+        list(db.query(create_filters(date=datetime.date(2020, 12, 25))))
+        filters = create_filters(distance_max=0.01)
+        self.assertEqual([str(approach) for approach in db.query(filters)],
+                         [str(approach) for approach in self.db.query(filters)])
+        self.assertEqual(sorted(db._shard_approaches), [0, 1, 2, 3])
+
+    def test_running_query_is_undisturbed_by_loading_more_shards(self):
+        for columnar in (False, True):
+            with self.subTest(columnar=columnar):
+                db = NEODatabase(load_neos(TEST_NEO_FILE), (), columnar=columnar,
+                                 shards=shards.open_shards(self.shard_dir, cache_dir=self.cache))
+                list(db.query(create_filters(date=datetime.date(2020, 12, 25))))
+                filters = create_filters(start_date=datetime.date(2020, 10, 1), velocity_min=5)
+                expected = [str(approach) for approach in self.db.query(filters)]
+
+                # Loading the earlier shards moves every approach already loaded.
+                results = db.query(filters)
+                first = next(results)
+                list(db.query(create_filters(end_date=datetime.date(2020, 6, 30))))
+                self.assertEqual([str(approach) for approach in (first, *results)], expected)
+                # The scan outlived the relinking, so its positions mustn't have been cached.
+                self.assertEqual([str(approach) for approach in db.query(filters)], expected)
+
+    def test_inspect_loads_every_shard(self):
+        db = self.sharded_database()
+        neo = db.get_neo_by_designation('2020 AY1')
+        expected = self.db.get_neo_by_designation('2020 AY1')
+        self.assertEqual([str(approach) for approach in neo.approaches],
+                         [str(approach) for approach in expected.approaches])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""Check that a shared database image answers like the database it was published from.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_shared
+"""
+import datetime
+import mmap
+import multiprocessing
+import pathlib
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+from filters import create_filters
+import ordering
+import shared
+from snapshot import write_image
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+def describe(approach):
+    # Compare by `repr`, since unknown diameters are NaN, which isn't equal to itself.
+    return repr((approach._designation, approach.serialize(), approach.neo and approach.neo.serialize()))
+
+
+def _count_in_worker(path, queue):
+    database = shared.SharedDatabase.attach(path)
+    queue.put(sum(1 for _ in database.query(create_filters(hazardous=True))))
+    database.close()
+
+
+@unittest.skipIf(numpy is None, "Shared database images require NumPy.")
+class TestSharedDatabase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = shared.publish(cls.db, pathlib.Path(cls.tmp.name) / 'shared.img')
+        cls.shared = shared.SharedDatabase.attach(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.shared.close()
+        cls.tmp.cleanup()
+
+    def assertSameResults(self, filters, limit=None, **options):
+        expected = [describe(approach) for approach in self.db.query(filters, limit, **options)]
+        received = [describe(approach) for approach in self.shared.query(filters, limit, **options)]
+        self.assertEqual(received, expected)
+
+    def test_query_everything(self):
+        self.assertSameResults(create_filters())
+
+    def test_query_date_range(self):
+        self.assertSameResults(create_filters(start_date=datetime.date(2020, 3, 1), end_date=datetime.date(2020, 5, 1)))
+        self.assertSameResults(create_filters(date=datetime.date(2020, 7, 4)))
+
+    def test_query_attributes(self):
+        self.assertSameResults(create_filters(hazardous=True, distance_max=0.2, velocity_min=10))
+        self.assertSameResults(create_filters(diameter_min=0.5, diameter_max=1.5))
+
+    def test_query_with_limit(self):
+        self.assertSameResults(create_filters(hazardous=False), limit=5)
+        self.assertSameResults(create_filters(start_date=datetime.date(2020, 6, 1)), limit=1)
+
+    def test_ordered_query(self):
+        for attribute in ordering.SORT_ATTRIBUTES:
+            for descending in (False, True):
+                with self.subTest(sort_by=attribute, descending=descending):
+                    self.assertSameResults(create_filters(hazardous=True), sort_by=attribute, descending=descending)
+                    self.assertSameResults(create_filters(start_date=datetime.date(2020, 6, 1)), limit=10,
+                                           sort_by=attribute, descending=descending)
+
+    def test_jobs_are_accepted(self):
+        self.assertSameResults(create_filters(velocity_min=20), jobs=2)
+
+    def test_contradictory_query_is_empty(self):
+        filters = create_filters(start_date=datetime.date(2020, 6, 1), end_date=datetime.date(2020, 5, 1))
+        self.assertEqual(list(self.shared.query(filters)), [])
+
+    def test_get_neo_by_designation(self):
+        for neo in self.db._neos[::50]:
+            found = self.shared.get_neo_by_designation(neo.designation)
+            self.assertEqual(repr(found.serialize()), repr(neo.serialize()))
+            self.assertEqual([describe(approach) for approach in found.approaches],
+                             [describe(approach) for approach in neo.approaches])
+        self.assertIsNone(self.shared.get_neo_by_designation('not a designation'))
+
+    def test_get_neo_by_name(self):
+        found = self.shared.get_neo_by_name('lemmon')
+        self.assertIsNotNone(found)
+        self.assertEqual(found.designation, self.db.get_neo_by_name('lemmon').designation)
+        self.assertIsNone(self.shared.get_neo_by_name('not a name'))
+
+    def test_neos_are_built_once(self):
+        first = next(iter(self.shared.query(create_filters(hazardous=True))))
+        self.assertIs(self.shared.get_neo_by_designation(first.neo.designation), first.neo)
+
+    def test_attach_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            shared.SharedDatabase.attach(TEST_NEO_FILE)
+
+    def test_attach_unmaps_an_incomplete_image(self):
+        path = write_image(pathlib.Path(self.tmp.name) / 'incomplete.img', [('time', 'q', 0, b'')],
+                           {'byteorder': sys.byteorder, 'time_order_is_identity': True}, magic=shared.MAGIC)
+        maps = []
+        original = mmap.mmap
+
+        def record(*args, **kwargs):
+            maps.append(original(*args, **kwargs))
+            return maps[-1]
+
+        with mock.patch.object(shared.mmap, 'mmap', record):
+            with self.assertRaises(KeyError):
+                shared.SharedDatabase.attach(path)
+        self.assertTrue(maps[0].closed)
+
+    def test_workers_attach(self):
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        workers = [context.Process(target=_count_in_worker, args=(self.path, queue)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        counts = [queue.get(timeout=60) for _ in workers]
+        for worker in workers:
+            worker.join()
+        expected = sum(1 for _ in self.db.query(create_filters(hazardous=True)))
+        self.assertEqual(counts, [expected, expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Check that a linked `NEODatabase` survives a round trip through a snapshot.
+
+To run these tests from the project root, run:
+
+    $ python3 -m unittest --verbose tests.test_snapshot
+"""
+import math
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from database import NEODatabase
+from extract import load_neos, load_approaches
+import snapshot
+
+
+TESTS_ROOT = (pathlib.Path(__file__).parent).resolve()
+TEST_NEO_FILE = TESTS_ROOT / 'test-neos-2020.csv'
+TEST_CAD_FILE = TESTS_ROOT / 'test-cad-2020.json'
+
+
+class TestSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db = NEODatabase(load_neos(TEST_NEO_FILE), load_approaches(TEST_CAD_FILE))
+
+    def setUp(self):
+        self.tmp = pathlib.Path(tempfile.mkdtemp())
+        self.neofile = self.tmp / 'neos.csv'
+        self.cadfile = self.tmp / 'cad.json'
+        shutil.copy(TEST_NEO_FILE, self.neofile)
+        shutil.copy(TEST_CAD_FILE, self.cadfile)
+        self.cache = self.tmp / 'cache'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_without_snapshot_misses(self):
+        self.assertIsNone(snapshot.load(self.neofile, self.cadfile, self.cache))
+
+    def test_round_trip_preserves_neos(self):
+        snapshot.save(self.db, self.neofile, self.cadfile, self.cache)
+        db = snapshot.load(self.neofile, self.cadfile, self.cache)
+        self.assertIsNotNone(db)
+
+        for expected, actual in zip(self.db._neos, db._neos):
+            self.assertEqual(actual.designation, expected.designation)
+            self.assertEqual(actual.name, expected.name)
+            self.assertEqual(actual.hazardous, expected.hazardous)
+            if math.isnan(expected.diameter):
+                self.assertTrue(math.isnan(actual.diameter))
+            else:
+                self.assertEqual(actual.diameter, expected.diameter)
+        self.assertEqual(len(db._neos), len(self.db._neos))
+
+    def test_round_trip_preserves_linked_approaches(self):
+        snapshot.save(self.db, self.neofile, self.cadfile, self.cache)
+        db = snapshot.load(self.neofile, self.cadfile, self.cache)
+
+        self.assertEqual([str(approach) for approach in db.query()],
+                         [str(approach) for approach in self.db.query()])
+        self.assertEqual([str(approach) for approach in db.get_neo_by_designation('68347').approaches],
+                         [str(approach) for approach in self.db.get_neo_by_designation('68347').approaches])
+
+    def test_changed_data_file_invalidates_snapshot(self):
+        snapshot.save(self.db, self.neofile, self.cadfile, self.cache)
+        with open(self.cadfile, 'a') as f:
+            f.write('\n')
+        self.assertIsNone(snapshot.load(self.neofile, self.cadfile, self.cache))
+
+    def test_touched_data_file_invalidates_snapshot(self):
+        snapshot.save(self.db, self.neofile, self.cadfile, self.cache)
+        stat = self.neofile.stat()
+        os.utime(self.neofile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertIsNone(snapshot.load(self.neofile, self.cadfile, self.cache))
+
+    def test_corrupt_snapshot_misses(self):
+        path = snapshot.save(self.db, self.neofile, self.cadfile, self.cache)
+        path.write_bytes(b'not a snapshot')
+        self.assertIsNone(snapshot.load(self.neofile, self.cadfile, self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -226,5 +226,66 @@ class TestWriteToJSON(unittest.TestCase):
         self.assertIsInstance(approach['neo']['potentially_hazardous'], bool)
 
 
+class TestWriteToCSVFastPath(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = build_results(None)
+
+    def test_csv_matches_a_dictwriter_export(self):
+        with unittest.mock.patch('write.open') as mock_file, UncloseableStringIO() as buf:
+            mock_file.return_value = buf
+            write_to_csv(self.results, None)
+            buf.seek(0)
+            value = buf.getvalue()
+
+        expected = io.StringIO()
+        writer = csv.DictWriter(expected, fieldnames=(
+            'datetime_utc', 'distance_au', 'velocity_km_s',
+            'designation', 'name', 'diameter_km', 'potentially_hazardous'))
+        writer.writeheader()
+        for result in self.results:
+            writer.writerow({**result.serialize(), **result.neo.serialize(), 'name': result.neo.name or ''})
+        self.assertEqual(value, expected.getvalue())
+
+
+class TestWriteToJSONStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = build_results(None)
+
+    def write(self, results):
+        with unittest.mock.patch('write.open') as mock_file, UncloseableStringIO() as buf:
+            mock_file.return_value = buf
+            write_to_json(results, None)
+            buf.seek(0)
+            return buf.getvalue()
+
+    def expected(self, results):
+        return json.dumps([
+            {
+                'datetime_utc': result.time_str,
+                'distance_au': result.distance,
+                'velocity_km_s': result.velocity,
+                'neo': {
+                    'designation': result.neo.designation,
+                    'name': result.neo.name or '',
+                    'diameter_km': result.neo.diameter,
+                    'potentially_hazardous': result.neo.hazardous,
+                },
+            }
+            for result in results
+        ])
+
+    def test_streamed_json_is_identical_to_a_single_dump(self):
+        with unittest.mock.patch('write._BATCH_SIZE', 7):
+            self.assertEqual(self.write(self.results), self.expected(self.results))
+
+    def test_streamed_json_of_no_results(self):
+        self.assertEqual(self.write(()), '[]')
+
+    def test_streamed_json_consumes_a_generator(self):
+        self.assertEqual(self.write(result for result in self.results[:3]), self.expected(self.results[:3]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -13,6 +13,12 @@ You'll edit this file in Part 4.
 import csv
 import json
 
+# How many pieces of encoded output to gather before each write to the file.
+_BATCH_SIZE = 2048
+
+# The size of the buffer between the CSV writer and the output file.
+_BUFFER_SIZE = 1 << 20
+
 
 def write_to_csv(results, filename):
     """Write an iterable of `CloseApproach` objects to a CSV file.
@@ -21,6 +27,10 @@ def write_to_csv(results, filename):
     corresponds to the information in a single close approach from the `results`
     stream and its associated near-Earth object.
 
+    Rows are written as tuples by a `csv.writer` through a large output buffer.
+    An NEO's columns are the same for every one of its approaches, so they are
+    built once per NEO and reused.
+
     :param results: An iterable of `CloseApproach` objects.
     :param filename: A Path-like object pointing to where the data should be saved.
     """
@@ -29,29 +39,49 @@ def write_to_csv(results, filename):
         'designation', 'name', 'diameter_km', 'potentially_hazardous'
     )
 
+    neo_columns = {}
+
+    def columns(neo):
+        try:
+            return neo_columns[neo]
+        except KeyError:
+            neo_columns[neo] = (neo.designation, '' if neo.name is None else neo.name, neo.diameter, neo.hazardous)
+            return neo_columns[neo]
+
     try:
-        with open(filename, 'w') as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for row in results:
-                ca_data = row.serialize()
-                neo_data = row.neo.serialize()
-
-                data = {
-                    'datetime_utc': ca_data.get('datetime_utc'),
-                    'distance_au': ca_data.get('distance_au'),
-                    'velocity_km_s': ca_data.get('velocity_km_s'),
-                    'designation': neo_data.get('designation'),
-                    'name': '' if neo_data.get('name') is None else neo_data.get('name'),
-                    'diameter_km': neo_data.get('diameter_km'),
-                    'potentially_hazardous': neo_data.get('potentially_hazardous')
-                }
-                writer.writerow(data)
+        with open(filename, 'w', buffering=_BUFFER_SIZE) as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(fieldnames)
+            writer.writerows(
+                (row.time_str, row.distance, row.velocity) + columns(row.neo)
+                for row in results
+            )
     except Exception as e:
         print('Something went wrong!', e)
 
 
+def json_row(result):
+    """Describe a close approach and its NEO as one element of the JSON output.
+
+    :param result: A `CloseApproach`.
+    :return: A dictionary of the approach's attributes, with its NEO's under the 'neo' key.
+    """
+    ca_data = result.serialize()
+    neo_data = result.neo.serialize()
+
+    return {
+        'datetime_utc': ca_data.get('datetime_utc'),
+        'distance_au': ca_data.get('distance_au'),
+        'velocity_km_s': ca_data.get('velocity_km_s'),
+        'neo': {
+            'designation': neo_data.get('designation'),
+            'name': '' if neo_data.get('name') is None else neo_data.get('name'),
+            'diameter_km': neo_data.get('diameter_km'),
+            'potentially_hazardous': neo_data.get('potentially_hazardous')
+        }
+    }
+
+
 def write_to_json(results, filename):
     """Write an iterable of `CloseApproach` objects to a JSON file.
 
@@ -60,31 +90,31 @@ def write_to_json(results, filename):
     their values and the 'neo' key mapping to a dictionary of the associated
     NEO's attributes.
 
+    The list is written element by element as results arrive from the stream,
+    a batch of encoded rows at a time, so memory use stays flat no matter how
+    many results there are. The output is identical to a single `json.dump` of
+    the whole list.
+
     :param results: An iterable of `CloseApproach` objects.
     :param filename: A Path-like object pointing to where the data should be saved.
     """
     try:
-        data = []
-
-        for result in results:
-            ca_data = result.serialize()
-            neo_data = result.neo.serialize()
-
-            row = {
-                'datetime_utc': ca_data.get('datetime_utc'),
-                'distance_au': ca_data.get('distance_au'),
-                'velocity_km_s': ca_data.get('velocity_km_s'),
-                'neo': {
-                    'designation': neo_data.get('designation'),
-                    'name': '' if neo_data.get('name') is None else neo_data.get('name'),
-                    'diameter_km': neo_data.get('diameter_km'),
-                    'potentially_hazardous': neo_data.get('potentially_hazardous')
-                }
-            }
-
-            data.append(row)
+        encode = json.JSONEncoder().encode
 
         with open(filename, 'w') as outfile:
-            json.dump(data, outfile)
+            batch = ['[']
+            separator = ''
+
+            for result in results:
+                batch.append(separator)
+                batch.append(encode(json_row(result)))
+                separator = ', '
+
+                if len(batch) >= _BATCH_SIZE:
+                    outfile.write(''.join(batch))
+                    batch.clear()
+
+            batch.append(']')
+            outfile.write(''.join(batch))
     except Exception as e:
         print('Something went wrong!', e)